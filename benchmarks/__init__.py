@@ -0,0 +1,4 @@
+"""
+Offline benchmarks of the hot paths of cleaning-schedule
+Run with: python -m benchmarks.run --help
+"""
@@ -0,0 +1,53 @@
+"""
+Synthetic inputs for the benchmarks, shaped like the os3.nl pages the scraper reads
+"""
+
+PAGE_HEAD = '<!DOCTYPE html>\n<html lang="en">\n<body>\n<div class="page">\n'
+PAGE_TAIL = '</div>\n</body>\n</html>\n'
+STUDENT_LINK = (
+    '<li class="level0"><a class="wikilink1" href="/{year}/students/student_{i}" '
+    'title="{year}:students:Student {i}">Student {i}</a></li>\n'
+)
+CLEANING_TASK = '<li class="level1"><div class="li">Cleaning task {i}</div></li>\n'
+FILLER = '<p class="filler">Lorem ipsum dolor sit amet, <em>consectetur</em> adipiscing elit {i}.</p>\n'
+
+
+def make_webpage(size, year='2018-2019'):
+    """
+    Make a synthetic os3.nl page of about <size> bytes with student links, cleaning tasks and filler text
+    :param size: int: The size of the page in bytes
+    :param year: str: The year used in the student links
+    :return: bytes: The page (UTF-8 encoded)
+    """
+    parts = [PAGE_HEAD, '<ul class="list">\n']
+    length = sum(len(part) for part in parts) + len(PAGE_TAIL)
+    i = 0
+    while length < size:
+        # One student, one cleaning task and two paragraphs of filler, until the page is large enough
+        block = ''.join((
+            STUDENT_LINK.format(year=year, i=i), CLEANING_TASK.format(i=i), FILLER.format(i=i), FILLER.format(i=i)
+        ))
+        parts.append(block)
+        length += len(block)
+        i += 1
+    parts.append('</ul>\n')
+    parts.append(PAGE_TAIL)
+    return ''.join(parts).encode('utf-8')
+
+
+def make_roster(size):
+    """
+    :param size: int: The amount of students
+    :return: list: Unique student names
+    """
+    return ['Student {}'.format(i) for i in range(size)]
+
+
+def chunked(data, chunk_size):
+    """
+    Split data into chunks, like a streamed HTTP response
+    :param data: bytes: The data
+    :param chunk_size: int: The size of every chunk
+    :return: list: The chunks
+    """
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+import atexit
+import json
+import logging
+import platform
+import statistics
+import sys
+from argparse import ArgumentParser
+from collections import namedtuple
+from datetime import datetime, timedelta
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+from benchmarks.fixtures import make_webpage, make_roster, chunked
+from cleaning_schedule.assignment import AssignmentHistory, assign_tasks, WEEK_FORMAT
+from cleaning_schedule.history import PickHistory
+from cleaning_schedule.make_os3_cleaning_schedule import exclude_students, pick_students
+from cleaning_schedule.mail import Mail
+from cleaning_schedule.os3website import OS3Website
+from cleaning_schedule.roster import Roster, write_roster
+from cleaning_schedule.rotation import Rotation, IdRotation
+from cleaning_schedule.utils.cache import ExtractionCache
+from cleaning_schedule.utils.extraction import html_to_text
+from cleaning_schedule.settings.base import CLEANING_TASK_LIST_URL, HTTP_CHUNK_SIZE
+
+"""
+Time the hot paths of cleaning-schedule without network access:
+parsing os3.nl pages, picking students, reading the pick history, rendering the email,
+converting it to plain text and building the MIME message.
+Results are written as JSON, a stored result can be used as baseline to find regressions.
+"""
+
+KB = 1024
+MB = 1024 * KB
+PAGE_SIZES = (1 * KB, 100 * KB, 1 * MB, 10 * MB)
+ROSTER_SIZES = (10, 1000, 100000, 1000000)
+# Sizes used with --quick
+QUICK_PAGE_SIZES = (1 * KB, 100 * KB)
+QUICK_ROSTER_SIZES = (10, 1000)
+# Amount of picks in the pick history
+HISTORY_SIZES = (1000, 100000, 1000000)
+QUICK_HISTORY_SIZES = (1000, 100000)
+# Relative slowdown of the median before a benchmark is reported as regression
+DEFAULT_THRESHOLD = 0.2
+
+Benchmark = namedtuple('Benchmark', ['name', 'params', 'quick_params', 'setup'])
+
+
+def format_size(size):
+    """
+    :param size: int: A size in bytes or a count
+    :return: str: The size in a short human readable form
+    """
+    for unit, factor in (('M', MB), ('K', KB)):
+        if size >= factor and size % factor == 0:
+            return '{}{}'.format(size // factor, unit)
+    return str(size)
+
+
+def offline_website(page):
+    """
+    Make an OS3Website that serves <page> for every URL instead of going to os3.nl
+    :param page: bytes: The page to serve
+    :return: OS3Website: The website
+    """
+    chunks = chunked(page, HTTP_CHUNK_SIZE)
+    website = OS3Website('benchmark', 'benchmark')
+    website._open = lambda url, timeout=None: iter(chunks)
+    return website
+
+
+def uncached(website, func):
+    """
+    Forget the extracted elements before every call, so every call parses the page
+    :param website: OS3Website: The website func uses
+    :param func: callable: The function to time
+    :return: callable: func with an empty extraction cache
+    """
+    def call():
+        website.extraction_cache = ExtractionCache()
+        return func()
+    return call
+
+
+def setup_get_all_students(size):
+    website = offline_website(make_webpage(size))
+    return uncached(website, website.get_all_students)
+
+
+def setup_get_all_students_unchanged(size):
+    """
+    The page is the same as the last time it was read, only its digest is computed
+    """
+    website = offline_website(make_webpage(size))
+    website.get_all_students()
+    return website.get_all_students
+
+
+def setup_get_elements_from_webpage(size):
+    website = offline_website(make_webpage(size))
+    url = CLEANING_TASK_LIST_URL.format(website.year)
+    return uncached(website, lambda: website.get_elements_from_webpage(url, 'li', **{'class': 'level1'}))
+
+
+def setup_schedule_year(size):
+    """
+    The student handling of a year of schedules: exclude 1% of the students, then pick 2 students
+    a week for 52 weeks, rotating the student list when it runs out
+    """
+    roster = make_roster(size)
+    excluded = roster[::100]
+
+    def schedule_year():
+        rotation = Rotation(roster, seed=0)
+        exclude_students(rotation, excluded)
+        for _ in range(52):
+            if len(rotation) < 2:
+                rotation.reset(roster)
+                exclude_students(rotation, excluded)
+            pick_students(rotation, 2)
+    return schedule_year
+
+
+def setup_schedule_year_roster(size):
+    """
+    The student handling of a year of schedules as make_os3_cleaning_schedule does it:
+    the rotation holds the IDs of a memory-mapped roster file
+    """
+    directory = mkdtemp(prefix='cleaning-schedule-benchmark')
+    atexit.register(rmtree, directory, True)
+    path = join(directory, 'students.roster')
+    write_roster(path, make_roster(size))
+    excluded = make_roster(size)[::100]
+
+    def schedule_year():
+        with Roster.open(path) as roster:
+            student_ids = range(len(roster))
+            rotation = IdRotation(student_ids, seed=0)
+            exclude_students(rotation, excluded, roster=roster)
+            for _ in range(52):
+                if len(rotation) < 2:
+                    rotation.reset(student_ids)
+                    exclude_students(rotation, excluded, roster=roster)
+                pick_students(rotation, 2, roster=roster)
+    return schedule_year
+
+
+def make_history(size):
+    """
+    Write a pick history of <size> picks, 2 of 200 students a week
+    :return: str: The history log
+    """
+    directory = mkdtemp(prefix='cleaning-schedule-benchmark')
+    atexit.register(rmtree, directory, True)
+    path = join(directory, 'history')
+    history = PickHistory(path)
+    roster = make_roster(200)
+    for week in range(size // 2):
+        date = (datetime(2000, 1, 3) + timedelta(weeks=week % 5000)).strftime(WEEK_FORMAT)
+        history.add(date, roster[(2 * week) % 200:(2 * week) % 200 + 2])
+    history.commit()
+    return path
+
+
+def setup_history_open(size):
+    """
+    Open a pick history log of <size> picks, with the index its commit wrote (below HISTORY_INDEX_TAIL picks the
+    log is read instead)
+    """
+    path = make_history(size)
+    return lambda: PickHistory(path)
+
+
+def setup_history_query(size):
+    """
+    When did a student last clean, how often and who cleaned in a week, in a history of <size> picks
+    """
+    history = PickHistory(make_history(size))
+
+    def query():
+        history.summary('Student 42', '01-01-2019')
+        history.picked_in('03-01-2000')
+    return query
+
+
+def setup_assign_tasks(size):
+    """
+    Assign <size> students to 20 cleaning tasks, with a year of assignment history
+    """
+    students = make_roster(size)
+    tasks = ['Cleaning task {}'.format(i) for i in range(20)]
+    history = AssignmentHistory()
+    for week in range(52):
+        date = (datetime(2018, 1, 1) + timedelta(weeks=week)).strftime(WEEK_FORMAT)
+        history.add(date, assign_tasks(students[week % size:week % size + 2], tasks, date, history))
+    return lambda: assign_tasks(students, tasks, '01-01-2019', history)
+
+
+def setup_render_template(size):
+    mail = Mail()
+    context = {
+        'date': '01-01-2019',
+        'cleaning_url': CLEANING_TASK_LIST_URL.format('2018-2019'),
+        'students': make_roster(2),
+        'assignments': assign_tasks(make_roster(2), ['Cleaning task {}'.format(i) for i in range(size)],
+                                    '01-01-2019'),
+        'cleaning_tasks': ['Cleaning task {}'.format(i) for i in range(size)],
+        'list_rotated': True,
+    }
+    return lambda: mail.render_template(**context)
+
+
+def render_email(mail, size):
+    tasks = ['Cleaning task {}'.format(i) for i in range(size)]
+    return mail.render_template(
+        date='01-01-2019', cleaning_url=CLEANING_TASK_LIST_URL.format('2018-2019'), students=make_roster(2),
+        assignments=assign_tasks(make_roster(2), tasks, '01-01-2019'), cleaning_tasks=tasks, list_rotated=False
+    )
+
+
+def setup_html_to_text(size):
+    body = render_email(Mail(), size)
+    return lambda: html_to_text(body)
+
+
+def setup_make_email(size):
+    mail = Mail()
+    body = render_email(mail, size)
+    cc = ['cc{}@os3.nl'.format(i) for i in range(5)]
+    return lambda: mail.make_email('test@os3.nl', 'OS3 cleaning schedule for the week of 01-01-2019', body, cc)
+
+
+BENCHMARKS = (
+    Benchmark('get_all_students', PAGE_SIZES, QUICK_PAGE_SIZES, setup_get_all_students),
+    Benchmark('get_all_students_unchanged', PAGE_SIZES, QUICK_PAGE_SIZES, setup_get_all_students_unchanged),
+    Benchmark('get_elements_from_webpage', PAGE_SIZES, QUICK_PAGE_SIZES, setup_get_elements_from_webpage),
+    Benchmark('schedule_year', ROSTER_SIZES, QUICK_ROSTER_SIZES, setup_schedule_year),
+    Benchmark('schedule_year_roster', ROSTER_SIZES, QUICK_ROSTER_SIZES, setup_schedule_year_roster),
+    Benchmark('history_open', HISTORY_SIZES, QUICK_HISTORY_SIZES, setup_history_open),
+    Benchmark('history_query', HISTORY_SIZES, QUICK_HISTORY_SIZES, setup_history_query),
+    Benchmark('assign_tasks', (10, 100, 1000), (10, 100), setup_assign_tasks),
+    Benchmark('render_template', (10, 1000), (10,), setup_render_template),
+    Benchmark('html_to_text', (10, 1000), (10,), setup_html_to_text),
+    Benchmark('make_email', (10, 1000), (10,), setup_make_email),
+)
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(description='Benchmark the hot paths of cleaning-schedule (offline)')
+    parser.add_argument('-o', '--output', help='Write the results as JSON to this file (default stdout)')
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+                        help='Compare the results to a stored result, exits with 1 on regressions')
+    parser.add_argument('-i', '--input', metavar='RESULTS',
+                        help='Compare a stored result instead of running the benchmarks, use with --compare')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative slowdown of the median that counts as regression '
+                             '(default {})'.format(DEFAULT_THRESHOLD))
+    parser.add_argument('-b', '--benchmark', nargs='*', choices=[benchmark.name for benchmark in BENCHMARKS],
+                        help='Only run these benchmarks (default all)')
+    parser.add_argument('-q', '--quick', action='store_true', help='Only run the small input sizes')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='Minimum seconds to repeat every benchmark for (default 0.5)')
+    parser.add_argument('--min-repeat', type=int, default=3, help='Minimum amount of repeats (default 3)')
+    parser.add_argument('--max-repeat', type=int, default=100, help='Maximum amount of repeats (default 100)')
+
+    args = parser.parse_args(args)
+    if args.input and not args.compare:
+        parser.error('--input needs --compare')
+    if args.min_repeat < 1 or args.max_repeat < args.min_repeat:
+        parser.error('--min-repeat should be at least 1 and at most --max-repeat')
+    return args
+
+
+def time_function(func, min_time, min_repeat, max_repeat):
+    """
+    Call func repeatedly and time every call
+    :param func: callable: The function to time
+    :param min_time: float: Keep repeating until this many seconds were spent
+    :param min_repeat: int: The minimum amount of calls
+    :param max_repeat: int: The maximum amount of calls
+    :return: list: The duration of every call in seconds
+    """
+    timings = []
+    while len(timings) < max_repeat and (len(timings) < min_repeat or sum(timings) < min_time):
+        started = perf_counter()
+        func()
+        timings.append(perf_counter() - started)
+    return timings
+
+
+def run_benchmarks(benchmarks, quick=False, min_time=0.5, min_repeat=3, max_repeat=100):
+    """
+    Run the benchmarks for all their input sizes
+    :param benchmarks: iterable: The benchmarks to run
+    :param quick: bool: Only use the small input sizes
+    :param min_time: float: Repeat every benchmark for at least this many seconds
+    :param min_repeat: int: The minimum amount of repeats
+    :param max_repeat: int: The maximum amount of repeats
+    :return: list: A result dict for every benchmark and input size
+    """
+    results = []
+    for benchmark in benchmarks:
+        for size in benchmark.quick_params if quick else benchmark.params:
+            func = benchmark.setup(size)
+            timings = time_function(func, min_time, min_repeat, max_repeat)
+            result = {
+                'id': '{}[{}]'.format(benchmark.name, format_size(size)),
+                'name': benchmark.name,
+                'size': size,
+                'repeat': len(timings),
+                'min': min(timings),
+                'median': statistics.median(timings),
+                'mean': statistics.mean(timings),
+                'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            }
+            print('{id:40} {median:12.6f}s median {min:12.6f}s min ({repeat} runs)'.format(**result),
+                  file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def compare_results(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the median of every benchmark to the baseline
+    :param baseline: list: The baseline result dicts
+    :param results: list: The result dicts to compare
+    :param threshold: float: Relative slowdown that counts as regression, 0.2 is 20% slower
+    :return: list: (str: id, float: baseline median, float: median, float: ratio, bool: regression) tuples
+    """
+    baseline = {result['id']: result for result in baseline}
+    comparison = []
+    for result in results:
+        if result['id'] not in baseline:
+            continue
+        before = baseline[result['id']]['median']
+        ratio = result['median'] / before if before else float('inf')
+        comparison.append((result['id'], before, result['median'], ratio, ratio > 1 + threshold))
+    return comparison
+
+
+def load_results(path):
+    """
+    :param path: str: A JSON file written by this script
+    :return: list: The result dicts
+    """
+    with open(path, 'r') as fh:
+        return json.load(fh)['results']
+
+
+def main(args=None):
+    args = parse_args(args)
+    # Keep the info messages of picking students and building emails out of the timings
+    for name in list(logging.Logger.manager.loggerDict):
+        if name.startswith('cleaning_schedule'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    if args.input:
+        results = load_results(args.input)
+    else:
+        benchmarks = [benchmark for benchmark in BENCHMARKS if not args.benchmark or benchmark.name in args.benchmark]
+        results = run_benchmarks(benchmarks, args.quick, args.min_time, args.min_repeat, args.max_repeat)
+        output = json.dumps({
+            'meta': {
+                'timestamp': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'quick': args.quick,
+            },
+            'results': results,
+        }, indent=2)
+        if args.output:
+            with open(args.output, 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            print(output)
+
+    if args.compare:
+        comparison = compare_results(load_results(args.compare), results, args.threshold)
+        regressions = [row for row in comparison if row[4]]
+        for benchmark_id, before, after, ratio, regression in comparison:
+            print('{:40} {:12.6f}s -> {:12.6f}s {:7.2f}x{}'.format(
+                benchmark_id, before, after, ratio, '  REGRESSION' if regression else ''
+            ), file=sys.stderr)
+        if regressions:
+            print('{} of {} benchmarks regressed more than {:.0%}'.format(
+                len(regressions), len(comparison), args.threshold
+            ), file=sys.stderr)
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
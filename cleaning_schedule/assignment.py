@@ -0,0 +1,267 @@
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from cleaning_schedule.utils.logger import configure_logging
+from cleaning_schedule.utils.names import normalise_name
+from cleaning_schedule.settings.base import ASSIGNMENT_NO_REPEAT_WEEKS, ASSIGNMENT_UNAVAILABLE_COST, \
+    ASSIGNMENT_REPEAT_COST, ASSIGNMENT_PAIR_COST, ASSIGNMENT_LOAD_COST
+
+"""
+Assign the picked students of a week to the individual cleaning tasks.
+Every round matches each student (or each task, when there are more students than tasks) at most once,
+so the tasks of a week are spread evenly. A round is solved as a minimum cost assignment, the cost of
+giving a student a task grows when the student is not available for it, did it within the last weeks,
+would share it with a student they cleaned with before or already did more tasks than others.
+"""
+
+logger = configure_logging(__name__)
+
+Assignment = namedtuple('Assignment', ['student', 'tasks'])
+
+# The format of the weeks in the schedule and the assignment history
+WEEK_FORMAT = '%d-%m-%Y'
+
+
+def hungarian(cost):
+    """
+    Solve a rectangular assignment problem with the Hungarian algorithm, O(rows^2 * columns)
+    :param cost: list: Rows of costs, all of the same length
+    :return: list: (int: row, int: column) pairs with the minimum total cost, sorted by row,
+                   every row or every column (whichever there are fewer of) is assigned once
+    """
+    transposed = len(cost) > len(cost[0])
+    if transposed:
+        cost = [list(column) for column in zip(*cost)]
+    rows, columns = len(cost), len(cost[0])
+    infinity = float('inf')
+    # Potentials of the rows and columns, the row assigned to every column (1 based, 0 is none)
+    u = [0] * (rows + 1)
+    v = [0] * (columns + 1)
+    assigned = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        assigned[0] = row
+        column = 0
+        min_value = [infinity] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = assigned[column]
+            row_cost = cost[current_row - 1]
+            row_potential = u[current_row]
+            delta = infinity
+            next_column = 0
+            for j in range(1, columns + 1):
+                if used[j]:
+                    continue
+                reduced = row_cost[j - 1] - row_potential - v[j]
+                if reduced < min_value[j]:
+                    min_value[j] = reduced
+                    way[j] = column
+                if min_value[j] < delta:
+                    delta = min_value[j]
+                    next_column = j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[assigned[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_value[j] -= delta
+            column = next_column
+            if assigned[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            assigned[column] = assigned[previous]
+            column = previous
+    pairs = [(assigned[j] - 1, j - 1) for j in range(1, columns + 1) if assigned[j]]
+    if transposed:
+        pairs = [(column, row) for row, column in pairs]
+    return sorted(pairs)
+
+
+def solve_assignment(cost):
+    """
+    Solve a rectangular assignment problem, with scipy when it is installed
+    Without scipy hungarian() is used, it takes seconds from a few hundred rows and columns
+    :param cost: list: Rows of costs, all of the same length
+    :return: list: (int: row, int: column) pairs with the minimum total cost, sorted by row
+    """
+    if not cost or not cost[0]:
+        return []
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        return hungarian(cost)
+    rows, columns = linear_sum_assignment(cost)
+    return list(zip(rows.tolist(), columns.tolist()))
+
+
+def parse_week(week):
+    """
+    :param week: str: A week as written in the schedule
+    :return: datetime: The date of the week
+    """
+    return datetime.strptime(week, WEEK_FORMAT)
+
+
+class AssignmentHistory:
+    """
+    Index of past assignments: when a student last did a task, how many tasks a student did
+    and how often two students shared a task
+    """
+
+    def __init__(self, records=()):
+        """
+        :param records: iterable: (str: week, str: student, str: task) tuples of past assignments
+        """
+        self._last_done = {}
+        self._load = {}
+        # student -> {other student: times they shared a task}
+        self._partners = {}
+        weeks = {}
+        for week, student, task in records:
+            weeks.setdefault(week, {}).setdefault(task, []).append(student)
+        for week, tasks in weeks.items():
+            self._add_week(parse_week(week), tasks)
+
+    def add(self, week, assignments):
+        """
+        :param week: str: The week of the assignments
+        :param assignments: list: Assignment tuples of the week
+        """
+        tasks = {}
+        for assignment in assignments:
+            for task in assignment.tasks:
+                tasks.setdefault(task, []).append(assignment.student)
+        self._add_week(parse_week(week), tasks)
+
+    def _add_week(self, week, tasks):
+        for task, students in tasks.items():
+            for student in students:
+                key = (student, task)
+                if key not in self._last_done or self._last_done[key] < week:
+                    self._last_done[key] = week
+                self._load[student] = self._load.get(student, 0) + 1
+            for student in students:
+                for other in students:
+                    if other != student:
+                        partners = self._partners.setdefault(student, {})
+                        partners[other] = partners.get(other, 0) + 1
+
+    def weeks_since(self, student, task, week):
+        """
+        :param student: str: The student
+        :param task: str: The task
+        :param week: datetime: The week to count from
+        :return: int: Weeks between <week> and the last time the student did the task, None if never
+        """
+        last_done = self._last_done.get((student, task))
+        return None if last_done is None else abs((week - last_done).days) // 7
+
+    def load(self, student):
+        """
+        :param student: str: The student
+        :return: int: The amount of tasks the student did
+        """
+        return self._load.get(student, 0)
+
+    def pair_count(self, student, other):
+        """
+        :param student: str: A student
+        :param other: str: Another student
+        :return: int: The amount of times the students shared a task
+        """
+        return self._partners.get(student, {}).get(other, 0)
+
+    def partners(self, student):
+        """
+        :param student: str: A student
+        :return: dict: other student -> the amount of times they shared a task with <student>
+        """
+        return self._partners.get(student, {})
+
+
+def load_constraints(path):
+    """
+    Load the tasks students are not available for
+    :param path: str: A JSON file like {"unavailable": {"Student Name": ["Task", ...]}}
+    :return: dict: normalised student name -> set of normalised tasks
+    """
+    with open(path, 'r') as fh:
+        constraints = json.load(fh)
+    unavailable = constraints.get('unavailable', {}) if isinstance(constraints, dict) else None
+    if not isinstance(unavailable, dict) or not all(isinstance(tasks, list) for tasks in unavailable.values()):
+        raise ValueError('{} should contain "unavailable": {{"Student Name": ["Task", ...]}}'.format(path))
+    return {
+        normalise_name(student): {normalise_name(task) for task in tasks} for student, tasks in unavailable.items()
+    }
+
+
+def assign_tasks(students, tasks, week, history=None, unavailable=None, no_repeat_weeks=ASSIGNMENT_NO_REPEAT_WEEKS):
+    """
+    Assign the picked students of a week to the cleaning tasks
+    With more tasks than students every student gets the same amount of tasks (give or take one),
+    with more students than tasks every student gets one task and tasks are shared
+    :param students: list: The picked students
+    :param tasks: list: The cleaning tasks
+    :param week: str: The week to assign
+    :param history: AssignmentHistory: Past assignments, None for no history
+    :param unavailable: dict: normalised student name -> set of normalised tasks, see load_constraints()
+    :param no_repeat_weeks: int: Avoid giving a student a task they did within this many weeks
+    :return: list: Assignment of every student, in the order of <students>
+    """
+    history = history or AssignmentHistory()
+    unavailable = unavailable or {}
+    week_date = parse_week(week)
+    assigned = [[] for _ in students]
+    # The students sharing every task this week
+    sharing = [set() for _ in tasks]
+    normalised_tasks = [normalise_name(task) for task in tasks]
+    partners = [history.partners(student) for student in students]
+
+    def base_cost(student, task, unavailable_tasks):
+        value = ASSIGNMENT_LOAD_COST * history.load(student)
+        if normalised_tasks[task] in unavailable_tasks:
+            value += ASSIGNMENT_UNAVAILABLE_COST
+        weeks_since = history.weeks_since(student, tasks[task], week_date)
+        if weeks_since is not None and weeks_since < no_repeat_weeks:
+            value += ASSIGNMENT_REPEAT_COST * (no_repeat_weeks - weeks_since)
+        return value
+
+    # The part of the costs that does not change between rounds
+    base_costs = []
+    for student in students:
+        unavailable_tasks = unavailable.get(normalise_name(student), set())
+        base_costs.append([base_cost(student, task, unavailable_tasks) for task in range(len(tasks))])
+
+    def cost(student, task):
+        value = base_costs[student][task] + ASSIGNMENT_LOAD_COST * len(assigned[student])
+        if partners[student] and sharing[task]:
+            value += ASSIGNMENT_PAIR_COST * sum(
+                count for other, count in partners[student].items() if other in sharing[task]
+            )
+        return value
+
+    unassigned_students = list(range(len(students)))
+    unassigned_tasks = list(range(len(tasks)))
+    while students and tasks and (unassigned_students or unassigned_tasks):
+        round_students = unassigned_students or list(range(len(students)))
+        round_tasks = unassigned_tasks or list(range(len(tasks)))
+        costs = [[cost(student, task) for task in round_tasks] for student in round_students]
+        for row, column in solve_assignment(costs):
+            student, task = round_students[row], round_tasks[column]
+            if costs[row][column] >= ASSIGNMENT_UNAVAILABLE_COST:
+                logger.warning('{} is not available for {}, but nobody else is left to do it'.format(
+                    students[student], tasks[task]
+                ))
+            assigned[student].append(task)
+            sharing[task].add(students[student])
+        unassigned_students = [student for student in unassigned_students if not assigned[student]]
+        unassigned_tasks = [task for task in unassigned_tasks if not sharing[task]]
+    return [
+        Assignment(student, [tasks[task] for task in sorted(assigned[number])])
+        for number, student in enumerate(students)
+    ]
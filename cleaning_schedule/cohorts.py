@@ -0,0 +1,192 @@
+import json
+import logging
+from argparse import ArgumentParser
+from collections import namedtuple
+from os import getenv
+
+from cleaning_schedule.make_os3_cleaning_schedule import parse_args as parse_schedule_args, make_schedule, \
+    export_metrics
+from cleaning_schedule.utils.logger import configure_logging, configure_sinks
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.settings.base import HTTP_POOL_SIZE, HTTP_CACHE_TTL
+
+"""
+Make the cleaning schedules of multiple OS3 cohorts from one process.
+All cohorts share one HTTP session, one template environment and one SMTP connection pool.
+Cohorts run at the same time, so the stages and counters of the metrics add up the work of all cohorts.
+Only the time each cohort took is recorded per cohort, as the stage "cohort <name>".
+"""
+
+logger = configure_logging(__name__)
+
+CohortResult = namedtuple('CohortResult', ['name', 'success', 'error'])
+
+# Cohort config keys that map to a command line option of make_os3_cleaning_schedule
+COHORT_OPTIONS = {
+    'year': '--year',
+    'students': '--students',
+    'email': '--email',
+    'cc': '--cc',
+    'excluded_students': '--excluded-students',
+    'excluded_students_file': '--excluded-students-file',
+    'state_backend': '--state-backend',
+    'weeks': '--weeks',
+    'seed': '--seed',
+    'match': '--match',
+    'constraints': '--constraints',
+    'no_repeat_weeks': '--no-repeat-weeks',
+    'student_emails': '--student-emails',
+    'max_send_concurrency': '--max-send-concurrency',
+}
+COHORT_FLAGS = {
+    'keep_picked_students': '--keep-picked-students',
+    'no_email': '--no-email',
+    'personal': '--personal',
+    'debug': '--debug',
+}
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(prog='make_os3_cleaning_schedule.py cohorts',
+                            description='Make the cleaning schedules of multiple OS3 cohorts and groups at once')
+    parser.add_argument('config', help='JSON file with a list of cohorts under "cohorts", each with at least a '
+                                       '"students_file" and "email" or "no_email". Other keys: ' +
+                                       ', '.join(sorted(list(COHORT_OPTIONS) + list(COHORT_FLAGS) + ['name', 'args'])))
+    parser.add_argument('-d', '--debug', action='store_true', help='Debug messages')
+    parser.add_argument('-u', '--user', default=getenv('OS3_USER'),
+                        help='OS3 username (default $OS3_USER)')
+    parser.add_argument('-p', '--password', default=getenv('OS3_PASS'),
+                        help='OS3 password (default $OS3_PASS)')
+    parser.add_argument('--max-workers', type=int, default=2,
+                        help='Maximum amount of cohorts to schedule at the same time (default 2)')
+    parser.add_argument('--cache-dir', help='Cache os3.nl pages in this directory (default no caching)')
+    parser.add_argument('--cache-ttl', type=int, default=HTTP_CACHE_TTL,
+                        help='Seconds a cached page is used before asking os3.nl if it changed '
+                             '(default {})'.format(HTTP_CACHE_TTL))
+    parser.add_argument('--metrics-out', action='append', default=[],
+                        help='Write the timing of every stage and counters of all cohorts to this file, stages and '
+                             'counters are the sum of all cohorts, only the "cohort <name>" stages are per cohort, '
+                             'in the Prometheus text format if the file ends in .prom, JSON otherwise '
+                             '(can be given more than once)')
+    parser.add_argument('--log-file', help='Also log to this file, rotated when it grows over 10MB')
+    parser.add_argument('--log-json', action='store_true', help='Log JSON lines instead of plain text')
+
+    args = parser.parse_args(args)
+    if not args.user:
+        parser.error('No user given and $OS3_USER not set')
+    elif not args.password:
+        parser.error('No password given and $OS3_PASS not set')
+    if args.max_workers < 1:
+        parser.error('--max-workers should be at least 1')
+    return args
+
+
+def load_cohorts(path):
+    """
+    Load the cohorts from a JSON config file
+    :param path: str: The config file
+    :return: list: dicts with the settings of every cohort
+    """
+    with open(path, 'r') as fh:
+        config = json.load(fh)
+    cohorts = config.get('cohorts') if isinstance(config, dict) else None
+    if not isinstance(cohorts, list):
+        raise ValueError('{} does not contain a list of cohorts'.format(path))
+    for number, cohort in enumerate(cohorts, 1):
+        if not isinstance(cohort, dict) or 'students_file' not in cohort:
+            raise ValueError('Cohort {} in {} has no students_file'.format(number, path))
+        cohort.setdefault('name', '{} ({})'.format(cohort.get('year', 'default year'), cohort['students_file']))
+    return cohorts
+
+
+def cohort_arguments(cohort, user, password):
+    """
+    Translate a cohort config to make_os3_cleaning_schedule arguments
+    :param cohort: dict: The cohort config
+    :param user: str: The OS3 username
+    :param password: str: The OS3 password
+    :return: list: The command line arguments
+    """
+    arguments = [cohort['students_file'], '--user', user, '--password', password]
+    for key, option in COHORT_OPTIONS.items():
+        value = cohort.get(key)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            arguments += [option] + [str(item) for item in value]
+        else:
+            arguments += [option, str(value)]
+    arguments += [flag for key, flag in COHORT_FLAGS.items() if cohort.get(key)]
+    return arguments + [str(argument) for argument in cohort.get('args', [])]
+
+
+def run_cohort(cohort, website, user, password):
+    """
+    Make the cleaning schedule of one cohort, failures are reported instead of raised
+    :param cohort: dict: The cohort config
+    :param website: OS3 website class object to share connections with
+    :param user: str: The OS3 username
+    :param password: str: The OS3 password
+    :return: CohortResult: The result
+    """
+    try:
+        args = parse_schedule_args(cohort_arguments(cohort, user, password))
+        logger.info('Making cleaning schedule for {}'.format(cohort['name']))
+        with metrics.span('cohort {}'.format(cohort['name'])):
+            make_schedule(args, website.for_year(args.year))
+    except SystemExit as e:
+        if e.code:
+            return CohortResult(cohort['name'], False, 'exited with code {}'.format(e.code))
+    except Exception as e:
+        logger.exception('Cleaning schedule for {} failed'.format(cohort['name']))
+        return CohortResult(cohort['name'], False, str(e))
+    return CohortResult(cohort['name'], True, None)
+
+
+def run_cohorts(cohorts, website, user, password, max_workers=2):
+    """
+    Make the cleaning schedules of all cohorts in a bounded pool of workers
+    :param cohorts: list: The cohort configs
+    :param website: OS3 website class object to share connections with
+    :param user: str: The OS3 username
+    :param password: str: The OS3 password
+    :param max_workers: int: The maximum amount of cohorts to schedule at the same time
+    :return: list: CohortResult of every cohort, in config order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_cohort, cohort, website, user, password) for cohort in cohorts]
+        return [future.result() for future in futures]
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.log_file or args.log_json:
+        configure_sinks(json_lines=args.log_json, log_file=args.log_file)
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    try:
+        cohorts = load_cohorts(args.config)
+    except (IOError, ValueError) as e:
+        logger.critical('Could not load cohorts from {}, got error: {}'.format(args.config, e))
+        exit(2)
+
+    from cleaning_schedule.os3website import OS3Website
+
+    website = OS3Website(args.user, args.password, pool_size=max(args.max_workers * 2, HTTP_POOL_SIZE),
+                         cache_dir=args.cache_dir, cache_ttl=args.cache_ttl)
+    website.set_log_level(logging.DEBUG if args.debug else logging.INFO)
+    with website:
+        results = run_cohorts(cohorts, website, args.user, args.password, max_workers=args.max_workers)
+
+    for result in results:
+        if result.success:
+            logger.info('{}: OK'.format(result.name))
+        else:
+            logger.error('{}: FAILED ({})'.format(result.name, result.error))
+    failed = [result for result in results if not result.success]
+    logger.info('{} of {} cohorts scheduled'.format(len(results) - len(failed), len(results)))
+    export_metrics(args.metrics_out, not failed)
+    if failed:
+        exit(1)
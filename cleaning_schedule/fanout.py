@@ -0,0 +1,130 @@
+from collections import namedtuple
+
+from cleaning_schedule.utils.filesystem import get_lines_from_file
+from cleaning_schedule.utils.logger import configure_logging
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.utils.names import NameIndex
+from cleaning_schedule.settings.base import SMTP_SEND_CONCURRENCY
+
+"""
+Send every recipient of a cleaning schedule their own email.
+A bounded pool of workers renders and sends the messages over the pooled SMTP connections,
+so the next message is rendered while the previous ones are being sent.
+"""
+
+logger = configure_logging(__name__)
+
+Recipient = namedtuple('Recipient', ['name', 'address', 'on_duty', 'tasks'])
+SendResult = namedtuple('SendResult', ['recipient', 'success', 'error'])
+
+ON_DUTY_SUBJECT = 'You are on OS3 cleaning duty in the week of {}'
+OVERVIEW_SUBJECT = 'OS3 cleaning schedule for the week of {}'
+
+
+def load_student_emails(path):
+    """
+    Load the email addresses of the students
+    :param path: str: A file with one "Student Name <address>" per line, empty lines are skipped
+    :return: dict: student name -> email address
+    """
+    from email.utils import parseaddr
+
+    student_emails = {}
+    for number, line in enumerate(get_lines_from_file(path), 1):
+        if not line.strip():
+            continue
+        name, address = parseaddr(line)
+        if not name or '@' not in address:
+            raise ValueError('Line {} of {} is not formatted as "Student Name <address>"'.format(number, path))
+        student_emails[name] = address
+    return student_emails
+
+
+def make_recipients(assignments, tasks, student_emails, overview_addresses=None):
+    """
+    Make a recipient for every picked student and every address that gets the overview of the week
+    Student names are looked up case, accent and whitespace insensitive
+    :param assignments: list: Assignment of every picked student, see assign_tasks()
+    :param tasks: list: All cleaning tasks of the week, for the overview
+    :param student_emails: dict: student name -> email address, see load_student_emails()
+    :param overview_addresses: list: Addresses that get the overview instead of a duty notice
+    :return: list: Recipient tuples, the address is None for students without a known address
+    """
+    index = NameIndex(student_emails)
+    recipients = []
+    for student, student_tasks in assignments:
+        matches = index.lookup(student)
+        address = student_emails[matches[0]] if len(matches) == 1 else None
+        recipients.append(Recipient(student, address, True, list(student_tasks)))
+    seen = set()
+    for address in overview_addresses or []:
+        if address not in seen:
+            seen.add(address)
+            recipients.append(Recipient(address, address, False, list(tasks)))
+    return recipients
+
+
+def send_to_recipient(mail, website, recipient, context, sender):
+    """
+    Render and send the email of one recipient, failures are reported instead of raised
+    :param mail: Mail: Renders the personal template
+    :param website: OS3 website class object holding the SMTP connection pool
+    :param recipient: Recipient: The recipient
+    :param context: dict: The template arguments shared by all recipients of the week
+    :param sender: str: The from address
+    :return: SendResult: The result
+    """
+    if not recipient.address:
+        return SendResult(recipient, False, 'no email address known')
+    subject = (ON_DUTY_SUBJECT if recipient.on_duty else OVERVIEW_SUBJECT).format(context['date'])
+    try:
+        body = mail.render_template(recipient=recipient.name, on_duty=recipient.on_duty, tasks=recipient.tasks,
+                                    **context)
+        message = mail.make_email(recipient.address, subject, body)
+        refused = website.smtp_pool.send(sender, [recipient.address], message)
+    except Exception as e:
+        return SendResult(recipient, False, str(e))
+    if refused:
+        return SendResult(recipient, False, 'refused by the SMTP server: {}'.format(refused[recipient.address]))
+    return SendResult(recipient, True, None)
+
+
+def fan_out(mail, website, recipients, context, sender='cleaning-schedule@os3.nl',
+            max_workers=SMTP_SEND_CONCURRENCY):
+    """
+    Send every recipient their own email
+    :param mail: Mail: Renders the personal template, shared by all workers
+    :param website: OS3 website class object holding the SMTP connection pool
+    :param recipients: list: The recipients, see make_recipients()
+    :param context: dict: The template arguments shared by all recipients of the week
+    :param sender: str: The from address
+    :param max_workers: int: The maximum amount of messages to render and send at the same time
+    :return: list: SendResult of every recipient, in recipient order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with metrics.span('fanout'), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(send_to_recipient, mail, website, recipient, context, sender) for recipient in recipients
+        ]
+        results = [future.result() for future in futures]
+    for result in results:
+        metrics.increment('emails_sent' if result.success else 'emails_failed')
+    return results
+
+
+def report_results(results):
+    """
+    Log the result of every recipient
+    :param results: list: SendResult tuples, see fan_out()
+    :return: list: The failed results
+    """
+    failed = []
+    for result in results:
+        if result.success:
+            logger.info('Sent email to {} <{}>'.format(result.recipient.name, result.recipient.address))
+        else:
+            logger.error('Could not send email to {}: {}'.format(result.recipient.name, result.error))
+            failed.append(result)
+    logger.info('{} of {} emails sent'.format(len(results) - len(failed), len(results)))
+    return failed
@@ -0,0 +1,637 @@
+import json
+import logging
+import struct
+import sys
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import date, datetime
+from os import fstat
+from os.path import isfile
+
+from cleaning_schedule.assignment import WEEK_FORMAT
+from cleaning_schedule.utils.filesystem import write_file_atomic
+from cleaning_schedule.utils.logger import configure_logging
+from cleaning_schedule.utils.names import NameIndex, MATCH_EXACT, MATCH_MODES
+from cleaning_schedule.settings.base import HISTORY_INDEX_TAIL
+
+"""
+Append-only log of who was picked in which week.
+The log starts with a magic and holds fixed size records of 8 bytes (little endian):
+a pick is the ordinal of the week's date and a student ID,
+a student is a 0 followed by the length of the UTF-8 name and the name, the n-th student record gets ID n.
+Records are only ever appended under a lock, a partly written record at the end of the log is ignored
+and dropped by the next commit.
+Next to the log (<log>.idx) an index by student and by week of the start of the log is kept, it is memory-mapped
+so opening the history only reads the records after it and every question about the history is a lookup.
+"""
+
+logger = configure_logging(__name__)
+
+HISTORY_MAGIC = b'OS3HIST1'
+# Week ordinal (0 for a student record) and student ID (name length for a student record)
+HISTORY_RECORD = struct.Struct('<iI')
+
+HISTORY_INDEX_SUFFIX = '.idx'
+HISTORY_INDEX_MAGIC = b'OS3HIDX1'
+# Magic, the size of the log the index covers and the amount of students, weeks and picks in it
+HISTORY_INDEX_HEADER = struct.Struct('<8sQIII')
+INDEX_ITEM = struct.Struct('<I')
+
+SORT_LAST_DUTY = 'last'
+SORT_DUTIES = 'duties'
+SORT_NAME = 'name'
+SORT_ORDERS = (SORT_LAST_DUTY, SORT_DUTIES, SORT_NAME)
+
+DutySummary = namedtuple('DutySummary', ['student', 'duties', 'last_duty', 'weeks_since'])
+
+
+def week_ordinal(week):
+    """
+    :param week: str, date or datetime: A week as written in the schedule (dd-mm-YYYY) or a date in it
+    :return: int: The ordinal of the date
+    """
+    if isinstance(week, str):
+        week = datetime.strptime(week, WEEK_FORMAT)
+    return week.toordinal()
+
+
+def format_week(ordinal):
+    """
+    :param ordinal: int: The ordinal of a date
+    :return: str: The week as written in the schedule
+    """
+    return date.fromordinal(ordinal).strftime(WEEK_FORMAT)
+
+
+def _pack(values):
+    packed = array('I', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+class IndexSection:
+    """
+    Read only sequence of unsigned 32 bit integers (little endian) in a buffer, read when they are asked for
+    """
+
+    def __init__(self, buffer, start, length):
+        """
+        :param buffer: bytes or mmap: The buffer
+        :param start: int: The position of the first integer in <buffer>
+        :param length: int: The amount of integers
+        """
+        self._buffer = buffer
+        self._start = start
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, position):
+        if not 0 <= position < self._length:
+            raise IndexError('index section position {} out of range'.format(position))
+        return INDEX_ITEM.unpack_from(self._buffer, self._start + INDEX_ITEM.size * position)[0]
+
+    def slice(self, start, stop):
+        """
+        :return: list: The integers from <start> up to <stop>
+        """
+        position = self._start + INDEX_ITEM.size * start
+        return list(struct.unpack_from('<{}I'.format(stop - start), self._buffer, position))
+
+
+class HistoryIndex:
+    """
+    Read only index of the start of a pick history log, see build_index()
+    The sections after the header are unsigned 32 bit integers: the name offsets, the student IDs sorted by name,
+    the pick offsets by student, the week ordinals of every student (sorted), the weeks (sorted), the pick offsets
+    by week and the student IDs of every week (in the order they were recorded), followed by the UTF-8 names
+    """
+
+    def __init__(self, buffer=None, mapping=None):
+        """
+        Use HistoryIndex.open() instead
+        :param buffer: bytes or mmap: The index, None for an empty index
+        :param mapping: mmap: The memory map to close on close(), None if the index is not backed by a file
+        """
+        if buffer is None:
+            buffer = build_index(0, [], [], {})
+        if len(buffer) < HISTORY_INDEX_HEADER.size or buffer[:len(HISTORY_INDEX_MAGIC)] != HISTORY_INDEX_MAGIC:
+            raise ValueError('not a pick history index')
+        _, self.log_size, self.students, self.weeks, self.picks = HISTORY_INDEX_HEADER.unpack_from(buffer)
+        self._buffer = buffer
+        self._mapping = mapping
+        position = HISTORY_INDEX_HEADER.size
+        sections = []
+        for length in (self.students + 1, self.students, self.students + 1, self.picks, self.weeks, self.weeks + 1,
+                       self.picks):
+            sections.append(IndexSection(buffer, position, length))
+            position += INDEX_ITEM.size * length
+        (self._name_offsets, self._by_name, self._student_picks, self._student_weeks, self._weeks, self._week_picks,
+         self._week_students) = sections
+        self._names_start = position
+        if len(buffer) < position or len(buffer) < position + self._name_offsets[self.students]:
+            raise ValueError('pick history index is truncated')
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map an index file
+        :param path: str: The index file
+        :return: HistoryIndex: The index, an empty index if there is no index file
+        """
+        if not isfile(path):
+            return cls()
+        import mmap
+
+        with open(path, 'rb') as fh:
+            if not fstat(fh.fileno()).st_size:
+                raise ValueError('{} is empty'.format(path))
+            mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mapping, mapping)
+        except ValueError as e:
+            mapping.close()
+            raise ValueError('{}: {}'.format(path, e))
+
+    def close(self):
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+    def name_bytes(self, student_id):
+        """
+        :param student_id: int: The ID of a student in the index
+        :return: bytes: The UTF-8 encoded name
+        """
+        start = self._names_start + self._name_offsets[student_id]
+        return self._buffer[start:self._names_start + self._name_offsets[student_id + 1]]
+
+    def name(self, student_id):
+        """
+        :param student_id: int: The ID of a student in the index
+        :return: str: The name
+        """
+        return self.name_bytes(student_id).decode('utf-8')
+
+    def find(self, student):
+        """
+        Binary search a student on name
+        :param student: str: The student
+        :return: int: The ID of the student, None if the student is not in the index
+        """
+        name = student.encode('utf-8')
+        low, high = 0, self.students
+        while low < high:
+            middle = (low + high) // 2
+            student_id = self._by_name[middle]
+            found = self.name_bytes(student_id)
+            if found == name:
+                return student_id
+            if found < name:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def weeks_of(self, student_id):
+        """
+        :param student_id: int: The ID of a student, the index knows nothing of students after it
+        :return: list: The week ordinals the student was picked, oldest first
+        """
+        if student_id >= self.students:
+            return []
+        return self._student_weeks.slice(self._student_picks[student_id], self._student_picks[student_id + 1])
+
+    def duties(self, student_id, until=None):
+        """
+        :param student_id: int: The ID of a student, the index knows nothing of students after it
+        :param until: int: Only count the weeks up to and including this week ordinal, None for all weeks
+        :return: tuple: (int: the amount of weeks the student was picked, int: the ordinal of the last, 0 if never)
+        """
+        if student_id >= self.students:
+            return 0, 0
+        start, stop = self._student_picks[student_id], self._student_picks[student_id + 1]
+        if until is not None:
+            stop = bisect_right(self._student_weeks, until, start, stop)
+        return stop - start, self._student_weeks[stop - 1] if stop > start else 0
+
+    def week_ordinals(self):
+        """
+        :return: list: The week ordinals someone was picked, oldest first
+        """
+        return self._weeks.slice(0, self.weeks)
+
+    def picked_in(self, ordinal):
+        """
+        :param ordinal: int: The ordinal of a week
+        :return: list: The IDs of the students picked that week
+        """
+        position = bisect_left(self._weeks, ordinal)
+        if position == self.weeks or self._weeks[position] != ordinal:
+            return []
+        return self._week_students.slice(self._week_picks[position], self._week_picks[position + 1])
+
+
+def build_index(log_size, names, weeks, students):
+    """
+    :param log_size: int: The size of the log the index covers
+    :param names: list: The UTF-8 encoded name of every student ID
+    :param weeks: list: The week ordinals every student ID was picked, oldest first
+    :param students: dict: week ordinal -> the IDs of the students picked that week
+    :return: bytes: The index, see HistoryIndex
+    """
+    name_offsets = [0]
+    for name in names:
+        name_offsets.append(name_offsets[-1] + len(name))
+    student_picks = [0]
+    for ordinals in weeks:
+        student_picks.append(student_picks[-1] + len(ordinals))
+    week_ordinals = sorted(students)
+    week_picks = [0]
+    for ordinal in week_ordinals:
+        week_picks.append(week_picks[-1] + len(students[ordinal]))
+    return b''.join([
+        HISTORY_INDEX_HEADER.pack(HISTORY_INDEX_MAGIC, log_size, len(names), len(week_ordinals), student_picks[-1]),
+        _pack(name_offsets), _pack(sorted(range(len(names)), key=names.__getitem__)), _pack(student_picks),
+        _pack(ordinal for ordinals in weeks for ordinal in ordinals), _pack(week_ordinals), _pack(week_picks),
+        _pack(student_id for ordinal in week_ordinals for student_id in students[ordinal]), b''.join(names),
+    ])
+
+
+class PickHistory:
+    """
+    Who was picked in which week, with an index by student and by week
+    The index file covers the start of the log, the picks after it are kept in memory.
+    Picks are added to memory right away and only written to the log on commit(), like the state stores
+    """
+
+    def __init__(self, path, index_tail=HISTORY_INDEX_TAIL):
+        """
+        :param path: str: The history log, created on the first commit
+        :param index_tail: int: Picks after the index before commit() writes the index again
+        """
+        self.path = path
+        self.index_path = path + HISTORY_INDEX_SUFFIX
+        self.index_tail = index_tail
+        self._index = HistoryIndex()
+        self.load()
+
+    def load(self):
+        """
+        Open the index and read the log after it, forgets picks that were not committed
+        Raises ValueError when the file is not a history log
+        """
+        self._pending = []
+        self._reset()
+        if isfile(self.path):
+            with open(self.path, 'rb') as fh:
+                self._read(fh)
+
+    def close(self):
+        """
+        Unmap the index file
+        """
+        self._index.close()
+
+    def _reset(self):
+        self._index.close()
+        self._index = HistoryIndex()
+        # Students, picks by student ID and student IDs by week ordinal after the index, in the order they were recorded
+        self._names = []
+        self._ids = {}
+        self._weeks = {}
+        self._students = {}
+        self._picks = 0
+        # The end of the last complete record in the log
+        self._size = 0
+
+    def _read(self, fh):
+        """
+        Open the index and read the records of the log after it
+        :param fh: file: The log
+        :return: int: The size of the log, larger than self._size when the last record is partly written
+        """
+        # The index is opened before the size of the log is taken, it never covers more than the log then
+        try:
+            self._index = HistoryIndex.open(self.index_path)
+        except (IOError, ValueError) as e:
+            logger.warning('Ignoring the index of {}, got error: {}'.format(self.path, e))
+        size = fstat(fh.fileno()).st_size
+        if self._index.log_size > size:
+            logger.warning('Ignoring the index of {}, it is larger than the log'.format(self.path))
+            self._index.close()
+            self._index = HistoryIndex()
+        if not size:
+            # Created by a commit that did not get to write
+            return 0
+        fh.seek(0)
+        if fh.read(len(HISTORY_MAGIC)) != HISTORY_MAGIC:
+            raise ValueError('{} is not a pick history log'.format(self.path))
+        start = self._index.log_size or len(HISTORY_MAGIC)
+        fh.seek(start)
+        data = fh.read()
+        position = 0
+        while position + HISTORY_RECORD.size <= len(data):
+            week, value = HISTORY_RECORD.unpack_from(data, position)
+            end = position + HISTORY_RECORD.size
+            if week == 0:
+                end += value
+                if end > len(data):
+                    break
+                self._add_name(data[position + HISTORY_RECORD.size:end].decode('utf-8'))
+            elif value < self._index.students + len(self._names):
+                self._add_pick(week, value)
+            else:
+                logger.warning('Ignoring pick of unknown student ID {} in {}'.format(value, self.path))
+            position = end
+        self._size = start + position
+        return start + len(data)
+
+    def __len__(self):
+        """
+        :return: int: The amount of picks
+        """
+        return self._index.picks + self._picks
+
+    def __contains__(self, student):
+        return self._student_id(student) is not None
+
+    def _student_id(self, student):
+        student_id = self._ids.get(student)
+        return self._index.find(student) if student_id is None else student_id
+
+    def _name(self, student_id):
+        if student_id < self._index.students:
+            return self._index.name(student_id)
+        return self._names[student_id - self._index.students]
+
+    def _add_name(self, student):
+        self._ids[student] = self._index.students + len(self._names)
+        self._names.append(student)
+        return self._ids[student]
+
+    def _add_pick(self, week, student_id):
+        self._weeks.setdefault(student_id, []).append(week)
+        self._students.setdefault(week, []).append(student_id)
+        self._picks += 1
+
+    def add(self, week, students):
+        """
+        Add the students picked for a week, written to the log on commit()
+        :param week: str: The week the students were picked for, see WEEK_FORMAT
+        :param students: list: The picked students
+        """
+        ordinal = week_ordinal(week)
+        for student in students:
+            self._record(ordinal, student)
+            self._pending.append((ordinal, student))
+
+    def _record(self, ordinal, student):
+        """
+        Add a pick to memory
+        :param ordinal: int: The ordinal of the week
+        :param student: str: The picked student
+        :return: bytes: The records of the pick, with a student record first for a new student
+        """
+        student_id = self._student_id(student)
+        records = b''
+        if student_id is None:
+            student_id = self._add_name(student)
+            name = student.encode('utf-8')
+            records = HISTORY_RECORD.pack(0, len(name)) + name
+        self._add_pick(ordinal, student_id)
+        return records + HISTORY_RECORD.pack(ordinal, student_id)
+
+    def commit(self):
+        """
+        Append the picks added since load() or the last commit to the log
+        The log is locked while appending and the records other runs appended since load() are read first,
+        so the student IDs of the new records follow theirs and nothing is overwritten.
+        Once more than <index_tail> picks are after the index, the index is written again
+        """
+        if not self._pending:
+            return
+        import fcntl
+
+        # Opened for appending, every write goes to the end of the log
+        with open(self.path, 'a+b') as fh:
+            # Released when the log is closed
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            self._reset()
+            if self._read(fh) > self._size:
+                # Drop a partly written record of a crashed commit, it is at the end of the log
+                fh.truncate(self._size)
+            data = b''.join(self._record(ordinal, student) for ordinal, student in self._pending)
+            if not self._size:
+                data = HISTORY_MAGIC + data
+            fh.write(data)
+            fh.flush()
+            self._size += len(data)
+            self._pending = []
+            if self._picks > self.index_tail:
+                self._write_index()
+
+    def _write_index(self):
+        """
+        Write the index of the complete log, the log should be locked
+        """
+        student_ids = range(self._index.students + len(self._names))
+        names = [self._index.name_bytes(student_id) for student_id in range(self._index.students)]
+        names += [student.encode('utf-8') for student in self._names]
+        students = {ordinal: self._index.picked_in(ordinal) for ordinal in self._index.week_ordinals()}
+        for ordinal, picked in self._students.items():
+            students.setdefault(ordinal, []).extend(picked)
+        try:
+            write_file_atomic(self.index_path, build_index(
+                self._size, names, [self._weeks_of(student_id) for student_id in student_ids], students
+            ))
+        except (IOError, OSError) as e:
+            logger.warning('Could not write the index of {}, got error: {}'.format(self.path, e))
+            return
+        size = self._size
+        self._reset()
+        self._index = HistoryIndex.open(self.index_path)
+        self._size = size
+        logger.debug('Wrote the index of %s, %d picks', self.path, self._index.picks)
+
+    def rollback(self):
+        """
+        Forget the picks added since the last commit
+        """
+        if self._pending:
+            self.load()
+
+    def students(self):
+        """
+        :return: list: All students in the history, in the order they were first picked
+        """
+        return [self._index.name(student_id) for student_id in range(self._index.students)] + self._names
+
+    def _weeks_of(self, student_id):
+        weeks = self._index.weeks_of(student_id)
+        after = self._weeks.get(student_id)
+        return sorted(weeks + after) if after else weeks
+
+    def duties(self, student):
+        """
+        :param student: str: The student
+        :return: int: The amount of weeks the student was picked
+        """
+        student_id = self._student_id(student)
+        if student_id is None:
+            return 0
+        return self._index.duties(student_id)[0] + len(self._weeks.get(student_id, ()))
+
+    def last_duty(self, student):
+        """
+        :param student: str: The student
+        :return: str: The last week the student was picked, None if never
+        """
+        student_id = self._student_id(student)
+        if student_id is None:
+            return None
+        last = max([self._index.duties(student_id)[1]] + self._weeks.get(student_id, []))
+        return format_week(last) if last else None
+
+    def weeks_of(self, student):
+        """
+        :param student: str: The student
+        :return: list: The weeks the student was picked, oldest first
+        """
+        student_id = self._student_id(student)
+        return [] if student_id is None else [format_week(week) for week in self._weeks_of(student_id)]
+
+    def picked_in(self, week):
+        """
+        :param week: str: A week, see WEEK_FORMAT
+        :return: list: The students picked for the week
+        """
+        ordinal = week_ordinal(week)
+        return [self._name(student_id)
+                for student_id in self._index.picked_in(ordinal) + self._students.get(ordinal, [])]
+
+    def summary(self, student, week=None):
+        """
+        :param student: str: The student
+        :param week: str, date or datetime: The week to count from, None for today.
+                     Duties planned after it (with --weeks) are not counted yet
+        :return: DutySummary: The amount of duties, the last duty and the weeks since the last duty (None if never)
+        """
+        student_id = self._student_id(student)
+        if student_id is None:
+            return DutySummary(student, 0, None, None)
+        now = week_ordinal(week or date.today())
+        duties, last = self._index.duties(student_id, now)
+        after = [ordinal for ordinal in self._weeks.get(student_id, ()) if ordinal <= now]
+        duties += len(after)
+        last = max([last] + after)
+        if not duties:
+            return DutySummary(student, 0, None, None)
+        return DutySummary(student, duties, format_week(last), (now - last) // 7)
+
+    def summaries(self, week=None):
+        """
+        :param week: str, date or datetime: The week to count from, None for today
+        :return: list: DutySummary of every student in the history
+        """
+        return [self.summary(student, week) for student in self.students()]
+
+
+def sort_summaries(summaries, order=SORT_LAST_DUTY):
+    """
+    :param summaries: list: DutySummary tuples
+    :param order: str: last (longest since the last duty first), duties (fewest duties first) or name
+    :return: list: The sorted summaries
+    """
+    if order == SORT_DUTIES:
+        return sorted(summaries, key=lambda summary: (summary.duties, summary.student))
+    if order == SORT_NAME:
+        return sorted(summaries, key=lambda summary: summary.student)
+    # Students that never cleaned first, then the longest ago
+    return sorted(summaries, key=lambda summary: (
+        summary.weeks_since is not None, -(summary.weeks_since or 0), summary.student
+    ))
+
+
+def format_summaries(summaries):
+    """
+    :param summaries: list: DutySummary tuples
+    :return: str: The summaries as table
+    """
+    width = max([len('Student')] + [len(summary.student) for summary in summaries])
+    lines = ['{:<{width}}  {:>6}  {:<10}  {:>11}'.format('Student', 'Duties', 'Last duty', 'Weeks since',
+                                                         width=width)]
+    for summary in summaries:
+        lines.append('{:<{width}}  {:>6}  {:<10}  {:>11}'.format(
+            summary.student, summary.duties, summary.last_duty or 'never',
+            '-' if summary.weeks_since is None else summary.weeks_since, width=width
+        ))
+    return '\n'.join(lines)
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(prog='make_os3_cleaning_schedule.py history',
+                            description='Show who cleaned when, from the pick history log written with --history')
+    parser.add_argument('history_file', help='The pick history log')
+    query_group = parser.add_mutually_exclusive_group()
+    query_group.add_argument('-s', '--student', nargs='+',
+                             help='Only show these students, with every week they cleaned')
+    query_group.add_argument('-w', '--week', help='Show the students that cleaned in this week (dd-mm-YYYY)')
+    parser.add_argument('--match', choices=MATCH_MODES, default=MATCH_EXACT,
+                        help='How --student is matched to the students in the history, names are always '
+                             'compared case, accent and whitespace insensitive (default exact)')
+    parser.add_argument('--sort', choices=SORT_ORDERS, default=SORT_LAST_DUTY,
+                        help='Order of the students: longest since the last duty, fewest duties or name '
+                             '(default last)')
+    parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+    parser.add_argument('-d', '--debug', action='store_true', help='Debug messages')
+
+    args = parser.parse_args(args)
+    if args.week:
+        try:
+            week_ordinal(args.week)
+        except ValueError:
+            parser.error('--week should be a date like 01-01-2019')
+    if not isfile(args.history_file):
+        parser.error('{} does not exist'.format(args.history_file))
+    return args
+
+
+def main(args=None):
+    args = parse_args(args)
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    try:
+        history = PickHistory(args.history_file)
+    except (IOError, ValueError) as e:
+        logger.critical('Could not read {}, got error: {}'.format(args.history_file, e))
+        exit(2)
+
+    if args.week:
+        students = history.picked_in(args.week)
+        print(json.dumps({'week': args.week, 'students': students}) if args.json else
+              '\n'.join(students) or 'Nobody cleaned in the week of {}'.format(args.week))
+        return
+
+    students = history.students()
+    if args.student:
+        matched, unmatched, ambiguous = NameIndex(students).resolve(args.student, args.match)
+        for student in unmatched:
+            logger.warning('{} is not in the history'.format(student))
+        for student, candidates in ambiguous.items():
+            logger.warning('{} matches multiple students: {}'.format(student, ', '.join(candidates)))
+        students = [student for student in students if student in matched]
+    summaries = sort_summaries([history.summary(student) for student in students], args.sort)
+    if args.json:
+        print(json.dumps([dict(summary._asdict(), weeks=history.weeks_of(summary.student)) if args.student
+                          else summary._asdict() for summary in summaries], indent=2))
+    elif summaries:
+        print(format_summaries(summaries))
+        if args.student:
+            for summary in summaries:
+                print('{}: {}'.format(summary.student, ', '.join(history.weeks_of(summary.student)) or 'never'))
+    else:
+        print('No students found in {}'.format(args.history_file))
@@ -1,25 +1,113 @@
 import jinja2
-from email.mime.text import MIMEText
+import os
+from email.encoders import encode_base64
+from email.generator import BytesGenerator
 from email.mime.multipart import MIMEMultipart
-from email.utils import parseaddr
-from os.path import join
+from email.mime.nonmultipart import MIMENonMultipart
+from email.mime.text import MIMEText
+from email.policy import SMTP
+from io import BytesIO
+from threading import Lock
 
+from cleaning_schedule.utils.extraction import html_to_text
 from cleaning_schedule.utils.logger import configure_logging
-from cleaning_schedule.settings.base import EMAIL_TEMPLATE, PROJECT_DIR
+from cleaning_schedule.utils.validation import verify_email_addresses
+from cleaning_schedule.settings.base import EMAIL_TEMPLATE, TEMPLATE_DIR, TEMPLATE_CACHE_DIR
 
 logger = configure_logging(__name__)
 
+_template_env = None
+_template_env_lock = Lock()
+
+
+def get_template_environment():
+    """
+    Get the jinja environment shared by all Mail instances
+    Compiled templates are kept in memory and in an on-disk bytecode cache,
+    a template is only compiled again when its file changes
+    :return: jinja2.Environment: The environment
+    """
+    global _template_env
+    with _template_env_lock:
+        if _template_env is None:
+            _template_env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(searchpath=TEMPLATE_DIR),
+                bytecode_cache=create_bytecode_cache(),
+                auto_reload=True,
+            )
+        return _template_env
+
+
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Bytecode cache keyed on the template name only, instead of the name and the path of the template file
+    Compiled templates stay valid when the package is moved, so a cache compiled at build time
+    is used by the installed package. A changed template is still compiled again, jinja compares
+    the checksum of the source with the one stored in the cache
+    Read-only caches (like a shipped cache in a system wide install) are read but not written to
+    """
+
+    def get_cache_key(self, name, filename=None):
+        return super().get_cache_key(name)
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            logger.debug('Not caching compiled template %s: %s', bucket.key, e)
+
+
+def create_bytecode_cache(directory=TEMPLATE_CACHE_DIR):
+    """
+    Create an on-disk bytecode cache for compiled templates
+    :param directory: str: The directory to store the compiled templates in
+    :return: TemplateBytecodeCache: The cache, in the user's temp dir if <directory> does not exist and can't be created
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        pass
+    if os.path.isdir(directory) and os.access(directory, os.R_OK | os.X_OK):
+        return TemplateBytecodeCache(directory)
+    logger.debug('%s is not readable, caching compiled templates in temp dir', directory)
+    return TemplateBytecodeCache()
+
+
+def precompile_templates(directory=None):
+    """
+    Compile all templates into the bytecode cache, so the first render does not have to
+    :param directory: str: The directory to store the compiled templates in (like the templates dir of a build),
+                      None to compile into the cache of the shared environment
+    :return: list: The names of the compiled templates
+    """
+    if directory is None:
+        template_env = get_template_environment()
+    else:
+        os.makedirs(directory, exist_ok=True)
+        template_env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(searchpath=TEMPLATE_DIR),
+            bytecode_cache=TemplateBytecodeCache(directory),
+        )
+    # The bytecode cache lives in the template dir, its files are not templates
+    cache_dir = os.path.basename(TEMPLATE_CACHE_DIR)
+    templates = template_env.list_templates(filter_func=lambda name: not name.startswith(cache_dir + '/'))
+    for template in templates:
+        logger.debug('Compiling template %s', template)
+        template_env.get_template(template)
+    return templates
+
 
 class Mail:
     """
     Preform email actions
     """
-    def __init__(self, from_address='cleaning-schedule@os3.nl'):
+    def __init__(self, from_address='cleaning-schedule@os3.nl', template=EMAIL_TEMPLATE):
         """
         :param from_address: The email address to send from
+        :param template: str: The template to render, relative to the template dir
         """
         self.logger = logger
-        self.template = EMAIL_TEMPLATE
+        self.template = template
         self.from_address = from_address
 
     def set_log_level(self, level):
@@ -35,42 +123,45 @@ class Mail:
         :param kwargs: The arguments to pass to the jinja template
         :return: blob: The rendered template (UTF-8 encoded)
         """
-        self.logger.debug('Rendering email template from {}'.format(self.template))
-        template_loader = jinja2.FileSystemLoader(searchpath=join(PROJECT_DIR, "templates"))
-        template_env = jinja2.Environment(loader=template_loader)
-        template_file = self.template
-        template = template_env.get_template(template_file)
+        self.logger.debug('Rendering email template from %s', self.template)
+        template = get_template_environment().get_template(self.template)
         return template.render(**kwargs).encode('utf-8')
 
     def verify_email_addresses(self, addresses):
         """
         Verify an email address
-        TODO: Make this a regex, current method just tries to parse and find a @ sign
         :param addresses: str: The email to verify
         :return: bool: True is valid email, False is not a valid email
         """
-        for email in addresses:
-            if '@' not in parseaddr(email)[1]:
-                self.logger.warning('{} is not a valid email'.format(addresses))
-                return False
-        return True
+        return verify_email_addresses(addresses, self.logger)
 
-    def make_email(self, to, subject, body, cc=None):
+    def make_email(self, to, subject, body, cc=None, text=None):
         """
-        Construct a MIME email message
+        Construct a MIME email message with a plain text and a html part
+        The html body is encoded once, straight from the rendered bytes, and the message is serialised
+        with CRLF line endings so it can be passed to smtplib as is
         :param to: str: The primary email to send to
         :param subject: str: The email subject
-        :param body: str(encoded): The email body (html)
+        :param body: bytes: The email body (UTF-8 encoded html), str is encoded first
         :param cc: list: The email addresses to included as CC's
-        :return: str: The formatted MIME email message
+        :param text: str: The plain text body, None to convert it from the html
+        :return: bytes: The formatted MIME email message
         """
         self.logger.debug('Constructing MIME email message')
-        msg = MIMEMultipart('alternative')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        msg = MIMEMultipart('alternative', policy=SMTP)
         msg['From'] = self.from_address
         msg['To'] = to
         if cc:
             self.logger.info('Sending CC to {}'.format(', '.join(cc)))
             msg['Cc'] = ', '.join(cc)
         msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-        return msg.as_string()
+        msg.attach(MIMEText(html_to_text(body) if text is None else text, 'plain', 'utf-8', policy=SMTP))
+        html = MIMENonMultipart('text', 'html', charset='utf-8', policy=SMTP)
+        html.set_payload(body)
+        encode_base64(html)
+        msg.attach(html)
+        buffer = BytesIO()
+        BytesGenerator(buffer, policy=SMTP).flatten(msg)
+        return buffer.getvalue()
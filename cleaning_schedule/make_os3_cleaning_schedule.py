@@ -1,28 +1,48 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
+from importlib import import_module
 import logging
+import sqlite3
+import sys
 from os import getenv
 from os.path import isfile
-from random import sample
-from datetime import datetime
-
-from cleaning_schedule.os3website import OS3Website
-from cleaning_schedule.mail import Mail
-from cleaning_schedule.utils.development import print_html5
-from cleaning_schedule.utils.logger import configure_logging
-from cleaning_schedule.utils.filesystem import get_lines_from_file, write_lines_to_file
-from cleaning_schedule.settings.base import CLEANING_TASK_LIST_URL, MAX_WEBSITE_RETRIES
+from datetime import datetime, timedelta
+
+from cleaning_schedule.assignment import AssignmentHistory, assign_tasks, load_constraints
+from cleaning_schedule.history import PickHistory
+from cleaning_schedule.roster import as_roster
+from cleaning_schedule.rotation import IdRotation
+from cleaning_schedule.utils.logger import configure_logging, configure_sinks
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.utils.validation import verify_email_addresses
+from cleaning_schedule.utils.names import NameIndex, MATCH_EXACT, MATCH_MODES
+from cleaning_schedule.utils.filesystem import get_lines_from_file
+from cleaning_schedule.state import open_state_store, import_students_file, STATE_BACKENDS, STATE_BACKEND_FILE
+from cleaning_schedule.settings.base import CLEANING_TASK_LIST_URL, MAX_WEBSITE_RETRIES, HTTP_POOL_SIZE, \
+    HTTP_CACHE_TTL, WEBSITE_RETRY_DEADLINE, SMTP_POOL_SIZE, SMTP_SEND_CONCURRENCY, PERSONAL_EMAIL_TEMPLATE, \
+    ASSIGNMENT_NO_REPEAT_WEEKS
 
 """
 This program tries to achieve randomized picking of students,
 and assign them to the different cleaning tasks that should be preformed at OS3 each week.
 
 Author: Erik Lamers
+
+Modules that are slow to import (requests, jinja2, smtplib, html5print) are imported where they are used,
+so --help and invalid arguments return without loading them.
 """
 
 logger = configure_logging('cleaning_schedule')
 
+# Subcommands, given as the first argument, and the module holding their main()
+COMMANDS = {
+    'cohorts': 'cleaning_schedule.cohorts',
+    'simulate': 'cleaning_schedule.simulate',
+    'serve': 'cleaning_schedule.serve',
+    'history': 'cleaning_schedule.history',
+}
+
 
 def parse_args(args=None):
     parser = ArgumentParser(description='Make OS3 cleaning schedule - For clean coffee. '
@@ -31,7 +51,9 @@ def parse_args(args=None):
 
     parser.add_argument('students_file', help='A file with student names to pick from, '
                                               'if empty a new list will be generated '
-                                              'and written to this location')
+                                              'and written to this location '
+                                              '(a SQLite database with --state-backend sqlite, '
+                                              'a compact roster file with --state-backend roster)')
     parser.add_argument('-y', '--year', default='2018-2019', help='The current year of OS3 (default 2018-2019)')
     parser.add_argument('-d', '--debug', action='store_true', help='Debug messages')
     parser.add_argument('-s', '--students', type=int, default=2, help='Amount of students to pick (default 2)')
@@ -41,6 +63,57 @@ def parse_args(args=None):
                         help='OS3 password (default $OS3_PASS)')
     parser.add_argument('--keep-picked-students', action='store_true',
                         help='Do not remove student from student list after picking')
+    parser.add_argument('--state-backend', choices=STATE_BACKENDS, default=STATE_BACKEND_FILE,
+                        help='Keep the student state in a plain students file, a SQLite database that also '
+                             'records exclusions and picks or a memory-mapped roster file for very large '
+                             'student lists (default file)')
+    parser.add_argument('--import-students-file',
+                        help='Start a new rotation with the students from this file (separated by newlines), '
+                             'use to move a students file into a SQLite database or roster file')
+    parser.add_argument('--history',
+                        help='Append who was picked in which week to this pick history log, '
+                             'see the history subcommand (default no history)')
+    parser.add_argument('--fair-picking', action='store_true',
+                        help='Pick the students with the fewest duties in --history first, '
+                             'students with as many duties are picked randomly')
+    parser.add_argument('--seed', type=int, help='Seed for picking students, the same seed and student list '
+                                                 'give the same picks (default random)')
+    parser.add_argument('-w', '--weeks', type=int, default=1,
+                        help='Amount of weeks to make a cleaning schedule for, starting this week (default 1)')
+    parser.add_argument('--max-concurrency', type=int, default=2,
+                        help='Maximum amount of concurrent requests to os3.nl (default 2)')
+    parser.add_argument('--cache-dir', help='Cache os3.nl pages in this directory, unchanged pages are not '
+                                            'downloaded again (default no caching)')
+    parser.add_argument('--cache-ttl', type=int, default=HTTP_CACHE_TTL,
+                        help='Seconds a cached page is used before asking os3.nl if it changed '
+                             '(default {})'.format(HTTP_CACHE_TTL))
+    parser.add_argument('--retries', type=int, default=MAX_WEBSITE_RETRIES,
+                        help='Maximum attempts of every request to os3.nl (default {})'.format(MAX_WEBSITE_RETRIES))
+    parser.add_argument('--retry-deadline', type=float, default=WEBSITE_RETRY_DEADLINE,
+                        help='Seconds all attempts of a request to os3.nl may take together '
+                             '(default {})'.format(WEBSITE_RETRY_DEADLINE))
+    parser.add_argument('--metrics-out', action='append', default=[],
+                        help='Write the timing of every stage and counters of the run to this file, '
+                             'in the Prometheus text format if the file ends in .prom, JSON otherwise '
+                             '(can be given more than once)')
+    parser.add_argument('--log-file', help='Also log to this file, rotated when it grows over 10MB')
+    parser.add_argument('--log-json', action='store_true', help='Log JSON lines instead of plain text')
+    snapshot_group = parser.add_mutually_exclusive_group()
+    snapshot_group.add_argument('--record', metavar='DIR',
+                                help='Store every page fetched from os3.nl as a compressed snapshot in this directory')
+    snapshot_group.add_argument('--replay', metavar='DIR',
+                                help='Serve every page from the snapshot in this directory instead of os3.nl, '
+                                     'with --no-email no user or password is needed')
+
+    assignment_group = parser.add_argument_group('Assignment actions',
+                                                 'Every picked student is assigned their own cleaning tasks')
+    assignment_group.add_argument('--constraints',
+                                  help='A JSON file with the tasks students are not available for, like '
+                                       '{"unavailable": {"Student Name": ["Task", ...]}}')
+    assignment_group.add_argument('--no-repeat-weeks', type=int, default=ASSIGNMENT_NO_REPEAT_WEEKS,
+                                  help='Avoid giving a student a task they did within this many weeks, '
+                                       'remembered across runs with --state-backend sqlite '
+                                       '(default {})'.format(ASSIGNMENT_NO_REPEAT_WEEKS))
 
     excluded_group = parser.add_argument_group('Exclusion actions',
                                                'Students to exclude, append either to file or to a '
@@ -51,6 +124,9 @@ def parse_args(args=None):
                                     help='List of student to exclude (separated by spaces)')
     student_args_group.add_argument('-f', '--excluded-students-file',
                                     help='A file of students to exclude (separated by newlines)')
+    excluded_group.add_argument('--match', choices=MATCH_MODES, default=MATCH_EXACT,
+                                help='How excluded students are matched to the student list, names are always '
+                                     'compared case, accent and whitespace insensitive (default exact)')
 
     email_actions = parser.add_argument_group('Email actions',
                                               'Either choose to send no email or '
@@ -59,18 +135,41 @@ def parse_args(args=None):
     email_args_group = email_actions.add_mutually_exclusive_group(required=True)
     email_args_group.add_argument('-e', '--email', help='The email address to send the cleaning schedule to')
     email_args_group.add_argument('--no-email', action='store_true', help='Do not email (use for debugging)')
+    email_actions.add_argument('--personal', action='store_true',
+                               help='Send every picked student a personal email with their tasks, '
+                                    'and the email and CC addresses each their own overview')
+    email_actions.add_argument('--student-emails',
+                               help='A file with the email address of every student, one "Student Name <address>" '
+                                    'per line (required with --personal)')
+    email_actions.add_argument('--max-send-concurrency', type=int, default=SMTP_SEND_CONCURRENCY,
+                               help='Maximum amount of personal emails to send at the same time '
+                                    '(default {})'.format(SMTP_SEND_CONCURRENCY))
 
     args = parser.parse_args(args)
-    # Check if HTTP auth creds are present
-    if not args.user:
+    # Check if HTTP auth creds are present, a replay without email does not log in anywhere
+    needs_login = not (args.replay and args.no_email)
+    if needs_login and not args.user:
         parser.error('No user given and $OS3_USER not set')
-    elif not args.password:
+    elif needs_login and not args.password:
         parser.error('No password given and $OS3_PASS not set')
+    if args.max_concurrency < 1:
+        parser.error('--max-concurrency should be at least 1')
+    if args.weeks < 1:
+        parser.error('--weeks should be at least 1')
+    if args.retries < 1:
+        parser.error('--retries should be at least 1')
+    if args.no_repeat_weeks < 0:
+        parser.error('--no-repeat-weeks should be at least 0')
+    if args.max_send_concurrency < 1:
+        parser.error('--max-send-concurrency should be at least 1')
+    if args.personal and not args.student_emails:
+        parser.error('--personal needs --student-emails')
+    if args.fair_picking and not args.history:
+        parser.error('--fair-picking needs --history')
 
     # Check for valid emails
-    mail_parser = Mail()
     if not args.no_email and not \
-            (mail_parser.verify_email_addresses([args.email]) or (args.cc and not mail_parser.verify_email_addresses(args.cc))):
+            (verify_email_addresses([args.email], logger) or (args.cc and not verify_email_addresses(args.cc, logger))):
         parser.error('Email addresses not valid!')
 
     if args.no_email and args.cc:
@@ -82,88 +181,129 @@ def parse_args(args=None):
 def get_student_list_from_website(website):
     """
     Curl the OS3 year info website to get a list of students.
+    Failed requests are retried by the retry policy of the website
     :param website: OS3 website class object
     :return: list: students
     """
-    students = []
-    for i in range(0, MAX_WEBSITE_RETRIES):
-        logger.info('Trying to get list of student from os3.nl')
+    logger.info('Trying to get list of student from os3.nl')
+    with metrics.span('fetch_roster'):
         students = website.get_all_students()
-        if students:
-            break
-        else:
-            logger.warning('Did not get any students from OS3 site')
-            if i == MAX_WEBSITE_RETRIES:
-                logger.critical('Max retries reached, giving up')
-                break
-            else:
-                logger.info('Trying again, attempt {} of {}'.format(i + 1, MAX_WEBSITE_RETRIES))
-    return students
+    if not students:
+        logger.warning('Did not get any students from OS3 site')
+    return students or []
 
 
 def get_cleaning_tasks_from_website(website, year):
     """
     Curl the OS3 CLEANING_TASK_LIST_URL to get a list of cleaning tasks.
+    Failed requests are retried by the retry policy of the website
     :param website: OS3 website class object
     :param year: str: The year of OS3 to use
     :return: list: Cleaning tasks
     """
-    cleaning_tasks = []
-    for i in range(0, MAX_WEBSITE_RETRIES):
-        logger.info('Getting list of cleaning tasks')
+    logger.info('Getting list of cleaning tasks')
+    with metrics.span('fetch_tasks'):
         cleaning_tasks = website.get_elements_from_webpage(
             CLEANING_TASK_LIST_URL.format(year), "li", **{"class": "level1"}
         )
-        if cleaning_tasks:
-            break
-        else:
-            logger.warning('Did not receive a list of cleaning tasks from OS3 site')
-            if i == MAX_WEBSITE_RETRIES:
-                logger.critical('Max retries reached, giving up')
-                break
-            else:
-                logger.info('Trying again: attempt {} of {}'.format(i + 1, MAX_WEBSITE_RETRIES))
-    return cleaning_tasks
+    if not cleaning_tasks:
+        logger.warning('Did not receive a list of cleaning tasks from OS3 site')
+    return cleaning_tasks or []
+
+
+def fetch_from_website(website, year, fetch_students=True, max_concurrency=2):
+    """
+    Concurrently get the list of students and the list of cleaning tasks from the OS3 website.
+    A failing fetch does not cancel the other.
+    :param website: OS3 website class object
+    :param year: str: The year of OS3 to use
+    :param fetch_students: bool: Also get the list of students, if False only the cleaning tasks are fetched
+    :param max_concurrency: int: The maximum amount of fetches to run at the same time
+    :return: tuple: (list: students or None if not fetched, list: cleaning tasks)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        students_future = executor.submit(get_student_list_from_website, website) if fetch_students else None
+        cleaning_tasks_future = executor.submit(get_cleaning_tasks_from_website, website, year)
+        students = students_future.result() if students_future else None
+        cleaning_tasks = cleaning_tasks_future.result()
+    return students, cleaning_tasks
 
 
 def main(args=None):
-    students = []
-    email_body = ''
-    date = datetime.today().strftime('%d-%m-%Y')
-    args = parse_args(args)
+    argv = sys.argv[1:] if args is None else list(args)
+    if argv and argv[0] in COMMANDS:
+        return import_module(COMMANDS[argv[0]]).main(argv[1:])
+
+    with metrics.span('parse_args'):
+        args = parse_args(argv)
+    if args.log_file or args.log_json:
+        configure_sinks(json_lines=args.log_json, log_file=args.log_file)
     logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
     logger.debug('Argument validation successful')
 
+    success = False
+    try:
+        with open_website(args) as website:
+            make_schedule(args, website)
+        success = True
+    finally:
+        export_metrics(args.metrics_out, success)
+
+
+def open_website(args):
+    """
+    Connect to the OS3 website with the connection, cache, retry and snapshot settings of the arguments
+    Exits with 2 when the snapshot can not be opened
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :return: OS3Website: The website, close it when done
+    """
+    from cleaning_schedule.os3website import OS3Website
+    from cleaning_schedule.utils.retry import RetryPolicy
+
     logger.info('Connecting to OS3 website')
-    website = OS3Website(args.user, args.password, args.year)
+    # A page missing from a snapshot will still be missing on the next attempt
+    retry_policy = RetryPolicy(attempts=1 if args.replay else args.retries, deadline=args.retry_deadline)
+    try:
+        website = OS3Website(
+            args.user, args.password, args.year, pool_size=max(args.max_concurrency, HTTP_POOL_SIZE),
+            cache_dir=args.cache_dir, cache_ttl=args.cache_ttl, retry_policy=retry_policy,
+            record_dir=args.record, replay_dir=args.replay,
+            smtp_pool_size=max(args.max_send_concurrency, SMTP_POOL_SIZE) if args.personal else SMTP_POOL_SIZE
+        )
+    except (IOError, ValueError) as e:
+        logger.critical('Could not open snapshot {}, got error: {}'.format(args.record or args.replay, e))
+        exit(2)
     website.set_log_level(logging.DEBUG if args.debug else logging.INFO)
+    return website
 
-    # Check if we can get a list of student from file
-    if isfile(args.students_file):
-        logger.info('Found {}, retrieving student list'.format(args.students_file))
-        students = get_lines_from_file(args.students_file)
-        create_student_file = True if len(students) < args.students else False
-    else:
-        create_student_file = True
 
-    # Getting list of student from file not successful, scrape the OS3 site instead
-    if not isfile(args.students_file) or len(students) < args.students:
-        logger.info(
-            'Student file {} is empty or non existent, getting list of student from os3.nl'.format(args.students_file)
-        )
-        students = get_student_list_from_website(website)
-    if not students:
-        logger.critical('Could not find any students!')
-        exit(10)
-    if args.debug:
-        logger.debug('Found the following student list: {}'.format(students))
+def export_metrics(paths, success):
+    """
+    Write the metrics of this run, a failing metrics file does not fail the run
+    :param paths: list: The files to write to, see Metrics.export()
+    :param success: bool: If the run succeeded
+    """
+    for path in paths:
+        try:
+            metrics.export(path, success)
+            logger.debug('Wrote metrics to %s', path)
+        except IOError as e:
+            logger.error('Could not write metrics to {}, got error: {}'.format(path, e))
 
-    # Remove students that operator asked to exclude
+
+def get_students_to_exclude(args):
+    """
+    Get the students the operator asked to exclude
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :return: list: The students to exclude
+    """
     if args.excluded_students_file:
         if isfile(args.excluded_students_file):
             logger.info('Excluding students from {}'.format(args.excluded_students_file))
             students_to_exclude = get_lines_from_file(args.excluded_students_file)
-            logger.debug('Students to exclude: {}'.format(students_to_exclude))
+            logger.debug('Students to exclude: %s', students_to_exclude)
         else:
             logger.error('{} is not a valid exclude file, ignoring...'.format(args.excluded_students_file))
             students_to_exclude = []
@@ -173,78 +313,376 @@ def main(args=None):
     else:
         logger.debug('No students to exclude')
         students_to_exclude = []
-    for student in students_to_exclude:
-        if student in students:
-            students.remove(student)
-        else:
-            logger.warning(
-                'Tried to remove {} from student list, but person was not present in student list'.format(student)
-            )
+    return students_to_exclude
 
-    # Get de items of the cleaning page
-    cleaning_tasks = get_cleaning_tasks_from_website(website, args.year)
-    if not cleaning_tasks:
-        logger.error('Could not find any cleaning tasks!')
-        logger.warning('Assuming os3.nl playground page is broken, continuing with empty task list')
-    if args.debug:
-        logger.debug('Found the following cleaning tasks: {}'.format(', '.join(cleaning_tasks)))
 
-    # Matching students to cleaning tasks
-    logger.info('Picking {} students from list'.format(args.students))
-    picked_students = sample(students, args.students)
-    if args.debug:
-        logger.debug('Picked the following students: {}'.format(', '.join(picked_students)))
+def exclude_students(rotation, students_to_exclude, match=MATCH_EXACT, roster=None):
+    """
+    Remove the excluded students from the rotation
+    Names are matched case, accent and whitespace insensitive
+    :param rotation: Rotation or IdRotation: The students to remove from
+    :param students_to_exclude: list: The students to remove
+    :param match: str: How to match names, exact, prefix or fuzzy
+    :param roster: Roster: The names of the student IDs, when the rotation holds IDs
+    :return: set: The excluded students (names)
+    """
+    if not students_to_exclude:
+        return set()
+    if roster is None:
+        matched, unmatched, ambiguous = NameIndex(rotation).resolve(students_to_exclude, match)
+    else:
+        # Only the excluded names are indexed, the names of the roster are compared in one scan
+        matched, unmatched, ambiguous = roster.match(students_to_exclude, match, student_ids=rotation)
+    for student in matched:
+        rotation.exclude(student)
+    for student in unmatched:
+        logger.warning(
+            'Tried to remove {} from student list, but person was not present in student list'.format(student)
+        )
+    for student, students in ambiguous.items():
+        logger.warning('Not removing {} from student list, it matches multiple students: {}'.format(
+            student, ', '.join(students if roster is None else (roster[student_id] for student_id in students))
+        ))
+    return matched if roster is None else {roster[student_id] for student_id in matched}
 
-    # Removing picked students from student list
-    if not args.keep_picked_students:
+
+def count_duties(history, roster=None):
+    """
+    Count the duties of every student in the pick history, for pick_students()
+    :param history: PickHistory: The pick history
+    :param roster: Roster: Count by the student IDs of this roster instead of by name, one scan of the roster
+    :return: dict: student (name or ID) -> amount of duties, students that never cleaned are left out
+    """
+    if roster is None:
+        return {student: history.duties(student) for student in history.students()}
+    return {student_id: history.duties(student) for student, student_id in roster.find(history.students()).items()}
+
+
+def pick_students(rotation, amount, keep_picked_students=False, roster=None, duties=None):
+    """
+    Randomly pick students from the rotation
+    :param rotation: Rotation or IdRotation: The students to pick from,
+                     picked students are removed unless keep_picked_students is set
+    :param amount: int: The amount of students to pick
+    :param keep_picked_students: bool: Do not remove the picked students from the rotation
+    :param roster: Roster: The names of the student IDs, when the rotation holds IDs
+    :param duties: dict: Pick the students with the fewest duties first, see count_duties(),
+                   the picked students are counted in it. None to pick randomly
+    :return: list: The picked students (names)
+    """
+    logger.info('Picking {} students from list'.format(amount))
+    if not keep_picked_students:
         logger.info('Removing picked students from remaining student list')
+    if duties is None:
+        picked_students = rotation.pick(amount, keep_picked=keep_picked_students)
+    else:
+        picked_students = rotation.pick_fewest(amount, lambda student: duties.get(student, 0),
+                                               keep_picked=keep_picked_students)
         for student in picked_students:
-            try:
-                students.remove(student)
-            except ValueError:
-                logger.error('Trying to remove {} from student list failed!'.format(student))
+            duties[student] = duties.get(student, 0) + 1
+    if roster is not None:
+        picked_students = [roster[student_id] for student_id in picked_students]
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Picked the following students: %s', ', '.join(picked_students))
+    return picked_students
+
+
+def make_schedule(args, website):
+    """
+    Pick students for one or more weeks, update the student state and email the cleaning schedules
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :param website: OS3 website class object
+    """
+    store = open_state_store(args.state_backend, args.students_file)
+    try:
+        if args.import_students_file:
+            logger.info('Importing students from {} into {}'.format(args.import_students_file, args.students_file))
+            import_students_file(store, args.import_students_file)
+        run_schedule(args, website, store)
+    finally:
+        store.close()
+
+
+def run_schedule(args, website, store, pick_history=None):
+    """
+    Pick students for one or more weeks, update the student state and email the cleaning schedules
+    The roster and cleaning tasks are fetched once, the student state and pick history are committed once at the end
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :param website: OS3 website class object
+    :param store: FileStateStore, SQLiteStateStore or RosterStateStore: The student state
+    :param pick_history: PickHistory: The pick history, None to open --history
+    :return: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+    """
+    # Read the constraints and addresses before picking, so a broken file does not cost anyone their turn
+    unavailable, student_emails = load_schedule_files(args)
+    if pick_history is None:
+        pick_history = load_pick_history(args)
+    emails = plan_schedule(args, website, store, unavailable, pick_history=pick_history)
+    if args.debug or args.no_email:
+        from cleaning_schedule.utils.development import print_html5
+
+        for _, email_body, _ in emails:
+            logger.debug('Printing rendered email')
+            print_html5(email_body)
 
     # Students_file should be created or updated
-    if create_student_file or not args.keep_picked_students:
-        logger.info('Writing list of (remaining) students to {}'.format(args.students_file))
+    logger.info('Saving (remaining) students to {}'.format(args.students_file))
+    try:
+        with metrics.span('save_state'):
+            store.commit()
+    except (IOError, sqlite3.Error) as e:
+        logger.error('Could not write students to {}, got error: {}'.format(args.students_file, e))
+    if pick_history is not None:
+        logger.info('Saving picked students to {}'.format(args.history))
         try:
-            write_lines_to_file(args.students_file, students)
+            with metrics.span('save_state'):
+                pick_history.commit()
         except IOError as e:
-            logger.error('Could not write students to {}, got error: {}'.format(args.students_file, e))
+            logger.error('Could not write the pick history to {}, got error: {}'.format(args.history, e))
+
+    send_schedule(args, website, emails, student_emails)
+    return emails
+
+
+def load_schedule_files(args):
+    """
+    Read the files with the task constraints and student email addresses, exits with 2 when one is broken
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :return: tuple: (dict: normalised student name -> unavailable tasks, dict: student name -> email address)
+    """
+    unavailable = {}
+    if args.constraints:
+        try:
+            unavailable = load_constraints(args.constraints)
+        except (IOError, ValueError) as e:
+            logger.critical('Could not read constraints from {}, got error: {}'.format(args.constraints, e))
+            exit(2)
+    student_emails = {}
+    if args.personal and not args.no_email:
+        from cleaning_schedule.fanout import load_student_emails
+
+        try:
+            student_emails = load_student_emails(args.student_emails)
+        except (IOError, ValueError) as e:
+            logger.critical('Could not read student email addresses from {}, got error: {}'.format(
+                args.student_emails, e
+            ))
+            exit(2)
+    return unavailable, student_emails
+
 
-    logger.info('Rendering email template')
-    mail = Mail()
-    mail.set_log_level(logging.DEBUG if args.debug else logging.INFO)
+def load_pick_history(args):
+    """
+    Read the pick history log of --history, exits with 2 when it is broken
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :return: PickHistory: The history, None without --history
+    """
+    if not args.history:
+        return None
     try:
-        email_body = mail.render_template(**{
+        with metrics.span('load_state'):
+            return PickHistory(args.history)
+    except (IOError, ValueError) as e:
+        logger.critical('Could not read the pick history from {}, got error: {}'.format(args.history, e))
+        exit(2)
+
+
+def plan_schedule(args, website, store, unavailable=None, mail=None, pick_history=None):
+    """
+    Pick students and assign their tasks for one or more weeks and render the emails
+    The changes to the student state and pick history are not committed, see run_schedule()
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :param website: OS3 website class object
+    :param store: FileStateStore, SQLiteStateStore or RosterStateStore: The student state
+    :param unavailable: dict: normalised student name -> set of normalised tasks, see load_constraints()
+    :param mail: Mail: Renders the emails, None for a new one
+    :param pick_history: PickHistory: Gets the picks of every week, used for --fair-picking and the email footer
+    :return: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+    """
+    roster = None
+    list_rotated = False
+    today = datetime.today()
+
+    # Check if we can get a list of student from file
+    with metrics.span('load_state'):
+        student_file_exists = store.exists()
+        students = store.load()
+        history = AssignmentHistory(store.assignment_history())
+    if student_file_exists:
+        logger.info('Found {}, retrieving student list'.format(args.students_file))
+        create_student_file = True if len(students) < args.students else False
+    else:
+        create_student_file = True
+
+    # Getting list of student from file not successful, scrape the OS3 site instead
+    # The cleaning tasks are always needed, get them at the same time
+    fetch_students = create_student_file
+    if fetch_students:
+        logger.info(
+            'Student file {} is empty or non existent, getting list of student from os3.nl'.format(args.students_file)
+        )
+    elif not args.keep_picked_students and len(students) < args.students * args.weeks:
+        logger.info('Student list will rotate within {} weeks, also getting list of students from os3.nl'.format(
+            args.weeks
+        ))
+        fetch_students = True
+    with metrics.span('fetch'):
+        roster, cleaning_tasks = fetch_from_website(
+            website, args.year, fetch_students=fetch_students, max_concurrency=args.max_concurrency
+        )
+    if create_student_file:
+        students = list(roster)
+        store.replace(students)
+    if not students:
+        logger.critical('Could not find any students!')
+        exit(10)
+    if args.debug:
+        logger.debug('Found the following student list: %s', ', '.join(students))
+
+    with metrics.span('pick'):
+        # The rotation holds student IDs, names are only decoded for excluded and picked students
+        students = as_roster(students)
+        rotation = IdRotation(range(len(students)), seed=args.seed)
+
+        # Remove students that operator asked to exclude
+        students_to_exclude = get_students_to_exclude(args)
+        store.exclude(exclude_students(rotation, students_to_exclude, args.match, students))
+        # Duties by student ID for --fair-picking, counted once per roster and kept up to date by pick_students()
+        duties = count_duties(pick_history, students) if args.fair_picking and pick_history is not None else None
+
+    # Check the items of the cleaning page
+    if not cleaning_tasks:
+        logger.error('Could not find any cleaning tasks!')
+        logger.warning('Assuming os3.nl playground page is broken, continuing with empty task list')
+    if args.debug:
+        logger.debug('Found the following cleaning tasks: %s', ', '.join(cleaning_tasks))
+    # Added and removed tasks since the cleaning page was read the time before, None if nothing changed
+    task_changes = website.page_changes(CLEANING_TASK_LIST_URL.format(args.year))
+
+    if mail is None:
+        from cleaning_schedule.mail import Mail
+
+        mail = Mail()
+        mail.set_log_level(logging.DEBUG if args.debug else logging.INFO)
+    emails = []
+    for week in range(args.weeks):
+        date = (today + timedelta(weeks=week)).strftime('%d-%m-%Y')
+        list_rotated = create_student_file if week == 0 else False
+        # Not enough students left for this week, start over with the complete list
+        if week > 0 and len(rotation) < args.students:
+            logger.info('Not enough students left for the week of {}, rotating student list'.format(date))
+            if not roster:
+                roster = get_student_list_from_website(website)
+                if not roster:
+                    logger.critical('Could not find any students!')
+                    exit(10)
+            with metrics.span('pick'):
+                students = roster = as_roster(roster)
+                rotation.reset(range(len(students)))
+                store.replace(students)
+                store.exclude(exclude_students(rotation, students_to_exclude, args.match, students))
+                if duties is not None:
+                    duties = count_duties(pick_history, students)
+            list_rotated = create_student_file = True
+
+        # Matching students to cleaning tasks
+        with metrics.span('pick'):
+            picked_students = pick_students(rotation, args.students, args.keep_picked_students, students, duties)
+            if not args.keep_picked_students:
+                store.remove(picked_students)
+            store.record_picks(date, picked_students)
+            previous_duties = []
+            if pick_history is not None:
+                previous_duties = [pick_history.summary(student, date) for student in picked_students]
+                pick_history.add(date, picked_students)
+        with metrics.span('assign'):
+            assignments = assign_tasks(picked_students, cleaning_tasks, date, history, unavailable,
+                                       args.no_repeat_weeks)
+            history.add(date, assignments)
+            store.record_assignments(date, assignments)
+
+        logger.info('Rendering email template for the week of {}'.format(date))
+        context = {
             'date': date,
             'cleaning_url': CLEANING_TASK_LIST_URL.format(args.year),
             'students': picked_students,
+            'assignments': assignments,
             'cleaning_tasks': cleaning_tasks,
-            'list_rotated': create_student_file
-        })
-    except Exception as e:
-        logger.critical('Unable to render email template, got error: {}'.format(e))
-        exit(255)
-    if args.debug or args.no_email:
-        logger.debug('Printing rendered email')
-        print_html5(email_body)
-
-    if not args.no_email:
-        logger.info('Sending email to {}'.format(args.email))
-        message = mail.make_email(
-            args.email,
-            'OS3 cleaning schedule for the week of {}'.format(date),
-            email_body.decode('utf-8'),
-            args.cc
-        )
-        to_addrs = args.cc + args.email.split() if args.cc else args.email.split()
-        if website.send_email('cleaning-schedule@os3.nl', to_addrs, message):
-            logger.info('Email sent')
-        else:
-            # Mail sending failed
-            logger.critical('Mail sending failed')
+            'task_changes': task_changes if week == 0 else None,
+            'list_rotated': list_rotated,
+            'previous_duties': previous_duties,
+        }
+        try:
+            with metrics.span('render'):
+                email_body = mail.render_template(**context)
+        except Exception as e:
+            logger.critical('Unable to render email template, got error: {}'.format(e))
             exit(255)
+        emails.append((date, email_body, context))
+    return emails
+
+
+def send_schedule(args, website, emails, student_emails=None, mail=None):
+    """
+    Email the cleaning schedules, exits with 255 when an email could not be sent
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :param website: OS3 website class object
+    :param emails: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+    :param student_emails: dict: student name -> email address, for --personal
+    :param mail: Mail: Builds the messages, None for a new one
+    """
+    if args.no_email:
+        return
+    if args.personal:
+        send_personal_emails(args, website, emails, student_emails or {})
+    else:
+        if mail is None:
+            from cleaning_schedule.mail import Mail
+
+            mail = Mail()
+        to_addrs = args.cc + args.email.split() if args.cc else args.email.split()
+        for date, email_body, _ in emails:
+            logger.info('Sending email for the week of {} to {}'.format(date, args.email))
+            with metrics.span('mime'):
+                message = mail.make_email(
+                    args.email,
+                    'OS3 cleaning schedule for the week of {}'.format(date),
+                    email_body,
+                    args.cc
+                )
+            with metrics.span('smtp_send'):
+                sent = website.send_email('cleaning-schedule@os3.nl', to_addrs, message)
+            if sent:
+                metrics.increment('emails_sent')
+                logger.info('Email sent')
+            else:
+                # Mail sending failed
+                logger.critical('Mail sending failed')
+                exit(255)
+
+
+def send_personal_emails(args, website, emails, student_emails):
+    """
+    Send every picked student and every email and CC address their own email for every week
+    All recipients are tried, the run fails afterwards if any email could not be sent
+    :param args: Namespace: The parsed arguments, see parse_args()
+    :param website: OS3 website class object
+    :param emails: list: (str: date, bytes: rendered overview, dict: template arguments) of every week
+    :param student_emails: dict: student name -> email address
+    """
+    from cleaning_schedule.fanout import make_recipients, fan_out, report_results
+    from cleaning_schedule.mail import Mail
+
+    mail = Mail(template=PERSONAL_EMAIL_TEMPLATE)
+    failed = []
+    for date, _, context in emails:
+        recipients = make_recipients(context['assignments'], context['cleaning_tasks'], student_emails,
+                                     [args.email] + (args.cc or []))
+        logger.info('Sending {} personal emails for the week of {}'.format(len(recipients), date))
+        failed += report_results(fan_out(mail, website, recipients, context, max_workers=args.max_send_concurrency))
+    if failed:
+        logger.critical('{} emails could not be sent'.format(len(failed)))
+        exit(255)
 
 
 if __name__ == '__main__':
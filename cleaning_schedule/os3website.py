@@ -1,8 +1,21 @@
-import smtplib
-from bs4 import BeautifulSoup
+import json
+from copy import copy
+from functools import partial
+from os.path import join
+from tempfile import SpooledTemporaryFile
+from threading import Lock
 
+from cleaning_schedule.utils.cache import HTTPCache, ExtractionCache, content_digest, diff_lists
+from cleaning_schedule.utils.extraction import extract_elements
 from cleaning_schedule.utils.logger import configure_logging
-from cleaning_schedule.utils.networking import get_webpage_with_auth, https_in_url
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.utils.retry import RetryPolicy
+from cleaning_schedule.utils.networking import create_http_session, get_webpage_with_auth, open_webpage_with_auth, \
+    https_in_url, IncompleteReadError
+from cleaning_schedule.utils.smtp import SMTPConnectionPool
+from cleaning_schedule.utils.snapshot import Snapshot
+from cleaning_schedule.settings.base import HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_CACHE_TTL, \
+    HTTP_CHUNK_SIZE, EXTRACTION_SPOOL_SIZE, SMTP_HOST, SMTP_PORT, SMTP_STARTTLS, SMTP_LOGIN, SMTP_POOL_SIZE
 
 logger = configure_logging(__name__)
 
@@ -13,14 +26,89 @@ class OS3Website:
     Or send mails from smtp.os3.nl
     """
 
-    def __init__(self, user, password, year='2018-2019'):
+    def __init__(self, user, password, year='2018-2019', pool_size=HTTP_POOL_SIZE,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), cache_dir=None, cache_ttl=HTTP_CACHE_TTL,
+                 retry_policy=None, record_dir=None, replay_dir=None, smtp_pool_size=SMTP_POOL_SIZE):
+        """
+        :param user: str: The OS3 username
+        :param password: str: The OS3 password
+        :param year: str: The year of OS3 to use
+        :param pool_size: int: The amount of keep-alive connections to os3.nl to keep open
+        :param timeout: tuple: (connect timeout, read timeout) in seconds for every request
+        :param cache_dir: str: Directory to cache responses and extracted elements in, None disables the response
+                               cache and keeps extracted elements in memory only
+        :param cache_ttl: int: Seconds a cached response is used before it is revalidated with os3.nl
+        :param retry_policy: RetryPolicy: How to retry failed calls to os3.nl, None uses the default policy
+        :param record_dir: str: Record every fetched page in this snapshot directory
+        :param replay_dir: str: Serve every page from this snapshot directory instead of os3.nl
+        :param smtp_pool_size: int: The maximum amount of SMTP connections to open at the same time
+        """
+        if record_dir and replay_dir:
+            raise ValueError('Can not record and replay at the same time')
         self.exclude_playground = True
         self.user = user
         self.password = password
         self.year = year
         self.logger = logger
+        self.timeout = timeout
+        self.session = create_http_session(user, password, pool_size=pool_size)
+        self.cache = HTTPCache(cache_dir, ttl=cache_ttl) if cache_dir else None
+        self.extraction_cache = ExtractionCache(join(cache_dir, 'extracted') if cache_dir else None)
+        # URL -> Changes of the elements on the page since the previous extraction
+        self.changes = {}
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.snapshot = Snapshot(record_dir or replay_dir, replay=bool(replay_dir)) if record_dir or replay_dir else None
+        self.replay = bool(replay_dir)
         self._url = 'https://www.os3.nl/{}/start'.format(self.year)
         self._must_be_os3 = True
+        self.smtp_pool_size = smtp_pool_size
+        self._smtp_pool = None
+        self._smtp_pool_lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def for_year(self, year):
+        """
+        Get an instance for another year of OS3 that shares the HTTP session, caches, retry policy and SMTP pool
+        of this instance
+        Only close the instance the others were made from
+        :param year: str: The year of OS3 to use
+        :return: OS3Website: The instance for <year>
+        """
+        # Make sure every instance shares the same pool
+        self.smtp_pool
+        website = copy(self)
+        website.year = year
+        website._url = 'https://www.os3.nl/{}/start'.format(year)
+        return website
+
+    def close(self):
+        """
+        Close all open connections to the OS3 website and SMTP server
+        """
+        self.session.close()
+        with self._smtp_pool_lock:
+            if self._smtp_pool is not None:
+                self._smtp_pool.close()
+                self._smtp_pool = None
+
+    @property
+    def smtp_pool(self):
+        """
+        The pool of logged in SMTP connections, created on first use
+        :return: SMTPConnectionPool: The pool
+        """
+        with self._smtp_pool_lock:
+            if self._smtp_pool is None:
+                self._smtp_pool = SMTPConnectionPool(
+                    SMTP_HOST, SMTP_PORT, self.user, self.password, size=self.smtp_pool_size,
+                    starttls=SMTP_STARTTLS, login=SMTP_LOGIN
+                )
+            return self._smtp_pool
 
     def set_log_level(self, level):
         """
@@ -63,16 +151,15 @@ class OS3Website:
         if not self.is_os3_webpage(self._url):
             return students
 
-        webpage = get_webpage_with_auth(self._url, self.user, self.password, self.logger)
-
-        soup = BeautifulSoup(webpage, "html.parser")
-        for a in soup.find_all("a", href=True):
-            if '/{}/students'.format(self.year) in a['href']:
-                # Dirty hack because the playground link is a "student" link
-                if self.exclude_playground and 'playground' in a.text.lower():
-                    self.logger.debug('Found playground link in student links, skipping...')
-                    continue
-                students.append(a.text.strip())
+        student_link = '/{}/students'.format(self.year)
+        links = self._extract(self._url, 'a', {'href': lambda href: student_link in href},
+                              cache_key=json.dumps(['a', 'href contains', student_link, self._url]))
+        for _, text in links or []:
+            # Dirty hack because the playground link is a "student" link
+            if self.exclude_playground and 'playground' in text.lower():
+                self.logger.debug('Found playground link in student links, skipping...')
+                continue
+            students.append(text.strip())
         return students
 
     def get_url(self, url):
@@ -83,45 +170,170 @@ class OS3Website:
         """
         if not self.is_os3_webpage(url):
             return None
-        self.logger.debug('Getting {}'.format(url))
-        return get_webpage_with_auth(url, self.user, self.password, self.logger)
+        self.logger.debug('Getting %s', url)
+        return self.retry_policy.call('GET {}'.format(url), self._get, url)
+
+    def _request_timeout(self, timeout):
+        """
+        Shorten the request timeout of this instance to the time an attempt has left
+        :param timeout: float: Seconds the attempt may take, None for no limit
+        :return: tuple: (connect timeout, read timeout) in seconds
+        """
+        connect_timeout, read_timeout = self.timeout
+        if timeout is None or timeout >= read_timeout:
+            return self.timeout
+        timeout = max(timeout, 1)
+        return min(connect_timeout, timeout), timeout
+
+    def _get(self, url, timeout=None):
+        """
+        GET a URL through the keep-alive session of this instance
+        :param url: str: The URL to get
+        :param timeout: float: Seconds the request may take, None uses the timeout of this instance
+        :return: str: The URLs content or None on error
+        """
+        if self.snapshot is None:
+            return get_webpage_with_auth(
+                url, self.user, self.password, self.logger, session=self.session,
+                timeout=self._request_timeout(timeout), cache=self.cache
+            )
+        chunks = self._open(url, timeout=timeout)
+        if chunks is None:
+            return None
+        try:
+            return b''.join(chunks)
+        except IncompleteReadError as e:
+            self.logger.error(str(e))
+            return None
+
+    def _open(self, url, timeout=None):
+        """
+        GET a URL through the keep-alive session of this instance and stream the content
+        :param url: str: The URL to get
+        :param timeout: float: Seconds the request may take, None uses the timeout of this instance
+        :return: generator: The chunks of the URLs content or None on error
+        """
+        if self.replay:
+            chunks = self.snapshot.open(url)
+            if chunks is None:
+                self.logger.error('{} is not in the snapshot in {}'.format(url, self.snapshot.directory))
+            return chunks
+        chunks = open_webpage_with_auth(
+            url, self.user, self.password, self.logger, session=self.session, timeout=self._request_timeout(timeout),
+            cache=self.cache
+        )
+        if chunks is not None and self.snapshot is not None:
+            return self.snapshot.record(url, chunks)
+        return chunks
+
+    def _extract(self, url, element, attrs=None, cache_key=None):
+        """
+        Stream a URL into the element extractor, only the matching elements are kept
+        Failed or empty responses are retried according to the retry policy
+        :param url: str: The URL to get
+        :param element: str: The element to search for
+        :param attrs: dict: The attributes to filter on, see ElementExtractor
+        :param cache_key: str: Identifies this extraction in the extraction cache, None does not use the cache
+        :return: list: (dict: attributes, str: text) of the found elements or None when nothing could be read
+        """
+        return self.retry_policy.call('GET {}'.format(url), self._extract_once, url, element, attrs, cache_key)
+
+    def _extract_once(self, url, element, attrs=None, cache_key=None, timeout=None):
+        """
+        A single attempt of _extract(), a broken stream raises IncompleteReadError
+        :param timeout: float: Seconds the request may take, None uses the timeout of this instance
+        :return: list: (dict: attributes, str: text) of the found elements or None when nothing could be read
+        """
+        chunks = self._open(url, timeout=timeout)
+        if chunks is None:
+            return None
+        if cache_key is None:
+            elements, size = extract_elements(chunks, element, attrs)
+            return elements if size else None
+        return self._extract_cached(url, chunks, element, attrs, cache_key)
+
+    def _extract_cached(self, url, chunks, element, attrs, cache_key):
+        """
+        Extract the elements, unless the page has the same digest as the page of the cached extraction
+        The elements of a changed page are compared to the cached elements, see page_changes()
+        Only complete 2xx (or revalidated 304) responses get here, error pages never replace the cached elements
+        :param url: str: The URL of the page
+        :param chunks: iterable: The chunks of the page
+        :param element: str: The element to search for
+        :param attrs: dict: The attributes to filter on, see ElementExtractor
+        :param cache_key: str: Identifies this extraction in the extraction cache
+        :return: list: (dict: attributes, str: text) of the found elements or None when the page was empty
+        """
+        # The page is spooled until the digest is known, so an unchanged page is never parsed.
+        # Pages up to EXTRACTION_SPOOL_SIZE bytes stay in memory, larger pages are moved to a temp file
+        with SpooledTemporaryFile(max_size=EXTRACTION_SPOOL_SIZE) as page:
+            digest = content_digest()
+            for chunk in chunks:
+                digest.update(chunk)
+                page.write(chunk)
+            if not page.tell():
+                return None
+            digest = digest.hexdigest()
+            cached = self.extraction_cache.get(cache_key)
+            if cached is not None and cached['digest'] == digest:
+                self.logger.debug('%s did not change, using the cached elements', url)
+                metrics.increment('extraction_cache_hits')
+                self.changes.pop(url, None)
+                return cached['elements']
+            page.seek(0)
+            elements, _ = extract_elements(iter(partial(page.read, HTTP_CHUNK_SIZE), b''), element, attrs)
+        changes = None
+        if cached is not None:
+            changes = diff_lists([text.strip() for _, text in cached['elements']],
+                                 [text.strip() for _, text in elements])
+        if changes and (changes.added or changes.removed):
+            self.logger.info('{} changed since it was last read, added: {}, removed: {}'.format(
+                url, ', '.join(changes.added) or 'nothing', ', '.join(changes.removed) or 'nothing'
+            ))
+            self.changes[url] = changes
+        else:
+            self.changes.pop(url, None)
+        try:
+            self.extraction_cache.store(cache_key, digest, elements)
+        except IOError as e:
+            self.logger.warning('Could not cache the elements of {}, got error: {}'.format(url, e))
+        return elements
+
+    def page_changes(self, url):
+        """
+        Get the elements that were added to and removed from a page since it was read the time before
+        :param url: str: The URL of the page
+        :return: Changes: The added and removed texts or None if the page did not change
+        """
+        return self.changes.get(url)
 
     def get_elements_from_webpage(self, url, element, **kwargs):
         """
-        Uses BS to get all elements of a certain type from a OS3 webpage
+        Get the text of all elements of a certain type from a OS3 webpage
         :param url: str: The URL of the OS3 webpage to get (without <>)
         :param element: str: The element to search for
-        :return:
-        """
-        webpage = get_webpage_with_auth(url, self.user, self.password, self.logger)
-        found_elements = []
-        if webpage:
-            soup = BeautifulSoup(webpage, "html.parser")
-            for element in soup.find_all(element, **kwargs):
-                found_elements.append(element.text.strip())
-            return found_elements
-        else:
+        :param kwargs: The attributes the element should have (like BeautifulSoup's find_all)
+        :return: list: The stripped text of every found element or None when the webpage returned nothing
+        """
+        elements = self._extract(url, element, kwargs,
+                                 cache_key=json.dumps([element, kwargs, url], sort_keys=True, default=repr))
+        if elements is None:
             self.logger.warning('OS3 webpage call returned nothing to search for')
             return None
+        return [text.strip() for _, text in elements]
 
     def send_email(self, sender, to_list, message):
         """
         Tries to send a email message via the OS3 SMTP server
+        The connection is kept open for the next message, call close() when done
         :param sender: str: The from address
         :param to_list: list: All email addresses to send to
-        :param message: The message to send
+        :param message: bytes: The message to send, see Mail.make_email()
         :return: True is successful / False is failure
         """
-        self.logger.debug('Trying to connect to smtp.os3.nl')
+        self.logger.debug('Trying to send email via %s', SMTP_HOST)
         try:
-            server = smtplib.SMTP('smtp.os3.nl', 587)
-            if server.starttls()[0] != 220:
-                self.logger.error('SMTP ERROR: Unable to STARTTLS')
-                return False
-            server.ehlo()
-            server.esmtp_features['auth'] = 'PLAIN LOGIN'
-            server.login(self.user, self.password)
-            server.sendmail(sender, to_list, message)
+            self.smtp_pool.send(sender, to_list, message)
             self.logger.debug('Successfully send email message')
             return True
         except Exception as e:
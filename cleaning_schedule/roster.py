@@ -0,0 +1,204 @@
+import struct
+import sys
+from array import array
+
+from cleaning_schedule.utils.filesystem import write_file_atomic
+from cleaning_schedule.utils.names import MATCH_EXACT, NameMatcher, normalise_encoded_name
+
+"""
+Compact roster of student names for very large student lists.
+All names are kept as one UTF-8 blob with an array('I') of offsets into it, a student is identified by the
+position of their name (the student ID). A roster file holds a header, the offsets (little endian) and the blob,
+it is memory-mapped on open so names are only read from disk and decoded when they are asked for.
+"""
+
+ROSTER_MAGIC = b'OS3RSTR1'
+# Magic and the amount of students
+ROSTER_HEADER = struct.Struct('<8sI')
+# Unsigned 32 bit offsets, the blob of a roster can not be larger than 4GB
+OFFSET_TYPECODE = 'I'
+MAX_BLOB_SIZE = 2 ** 32 - 1
+
+
+def _offset_array(data=b''):
+    offsets = array(OFFSET_TYPECODE)
+    offsets.frombytes(data)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets
+
+
+class Roster:
+    """
+    Read only sequence of unique student names, indexed by student ID
+    Getting a name is O(1): two offset lookups and decoding one slice of the blob
+    """
+
+    def __init__(self, blob, offsets, start=0, mapping=None):
+        """
+        Use Roster.from_names() or Roster.open() instead
+        :param blob: bytes or mmap: The UTF-8 encoded names
+        :param offsets: array: The start of every name and the end of the last name, relative to <start>
+        :param start: int: The position of the first name in <blob>
+        :param mapping: mmap: The memory map to close on close(), None if the roster is not backed by a file
+        """
+        self._blob = blob
+        self._offsets = offsets
+        self._start = start
+        self._mapping = mapping
+
+    @classmethod
+    def from_names(cls, names):
+        """
+        :param names: iterable: The student names, duplicates are ignored
+        :return: Roster: The roster, the order of <names> gives the student IDs
+        """
+        offsets = _offset_array()
+        offsets.append(0)
+        encoded = []
+        size = 0
+        for name in dict.fromkeys(names):
+            data = name.encode('utf-8')
+            size += len(data)
+            if size > MAX_BLOB_SIZE:
+                raise ValueError('Roster names take more than {} bytes'.format(MAX_BLOB_SIZE))
+            encoded.append(data)
+            offsets.append(size)
+        return cls(b''.join(encoded), offsets)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map a roster file, see write_roster()
+        :param path: str: The roster file
+        :return: Roster: The roster, close() it when done
+        """
+        import mmap
+
+        with open(path, 'rb') as fh:
+            header = fh.read(ROSTER_HEADER.size)
+            if len(header) < ROSTER_HEADER.size or not header.startswith(ROSTER_MAGIC):
+                raise ValueError('{} is not a roster file'.format(path))
+            _, count = ROSTER_HEADER.unpack(header)
+            offsets = _offset_array(fh.read(4 * (count + 1)))
+            if len(offsets) != count + 1:
+                raise ValueError('{} is truncated'.format(path))
+            blob_start = fh.tell()
+            if not offsets[-1]:
+                return cls(b'', offsets)
+            mapping = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapping) < blob_start + offsets[-1]:
+            mapping.close()
+            raise ValueError('{} is truncated'.format(path))
+        return cls(mapping, offsets, blob_start, mapping)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, student_id):
+        """
+        :param student_id: int: The ID of the student
+        :return: str: The name of the student
+        """
+        if not 0 <= student_id < len(self):
+            raise IndexError('student ID {} out of range'.format(student_id))
+        start = self._start
+        return self._blob[start + self._offsets[student_id]:start + self._offsets[student_id + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for student_id in range(len(self)):
+            yield self[student_id]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def find(self, names):
+        """
+        Look up the IDs of names, scanning the roster once
+        The names are compared encoded, so no name in the roster is decoded
+        :param names: iterable: The names to look up
+        :return: dict: name -> student ID, names that are not in the roster are left out
+        """
+        wanted = {name.encode('utf-8'): name for name in names}
+        found = {}
+        if not wanted:
+            return found
+        blob, start, offsets = self._blob, self._start, self._offsets
+        for student_id in range(len(self)):
+            name = wanted.get(blob[start + offsets[student_id]:start + offsets[student_id + 1]])
+            if name is not None:
+                found[name] = student_id
+                if len(found) == len(wanted):
+                    break
+        return found
+
+    def match(self, names, match=MATCH_EXACT, student_ids=None):
+        """
+        Match names case, accent and whitespace insensitive, scanning the roster once
+        Only <names> are indexed, ASCII names in the roster are compared without decoding them
+        :param names: iterable: The names to match
+        :param match: str: How to match, see NameIndex.lookup()
+        :param student_ids: iterable: The IDs of the students to match against, None for the whole roster
+        :return: tuple: See NameIndex.resolve(), with student IDs
+        """
+        matcher = NameMatcher(names, match)
+        blob, start, offsets = self._blob, self._start, self._offsets
+        for student_id in range(len(self)) if student_ids is None else student_ids:
+            name = blob[start + offsets[student_id]:start + offsets[student_id + 1]]
+            matcher.add(normalise_encoded_name(name), student_id)
+        return matcher.resolve()
+
+    def to_bytes(self):
+        """
+        :return: bytes: The roster in the roster file format
+        """
+        offsets = array(self._offsets.typecode, self._offsets)
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        return b''.join([
+            ROSTER_HEADER.pack(ROSTER_MAGIC, len(self)), offsets.tobytes(),
+            self._blob[self._start:self._start + self._offsets[-1]]
+        ])
+
+    def close(self):
+        """
+        Unmap the roster file, names can not be read afterwards
+        """
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+
+
+def write_roster(path, names):
+    """
+    Write names as a roster file, the file is replaced atomically
+    :param path: str: The roster file
+    :param names: iterable: The student names, duplicates are ignored
+    :return: int: The amount of students written
+    """
+    roster = names if isinstance(names, Roster) else Roster.from_names(names)
+    write_file_atomic(path, roster.to_bytes())
+    return len(roster)
+
+
+def is_roster_file(path):
+    """
+    :param path: str: A file
+    :return: bool: True if the file is a roster file, see write_roster()
+    """
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read(len(ROSTER_MAGIC)) == ROSTER_MAGIC
+    except IOError:
+        return False
+
+
+def as_roster(students):
+    """
+    :param students: iterable: Student names or a Roster
+    :return: Roster: <students> as roster, a Roster is returned as is
+    """
+    return students if isinstance(students, Roster) else Roster.from_names(students)
@@ -0,0 +1,198 @@
+from array import array
+from random import Random
+
+
+class Rotation:
+    """
+    The students that still have to clean before the student list rotates
+    Students are kept in a list with a hash index on their position, so picking,
+    excluding and re-admitting a student are all O(1) regardless of the amount of students
+    Picking swaps a random student to the end of the list and pops it (a lazy Fisher-Yates shuffle)
+    """
+
+    def __init__(self, students=(), seed=None):
+        """
+        :param students: iterable: The students to start with, duplicates are ignored
+        :param seed: int: Seed for the random picking, None picks differently every run
+        """
+        self._random = Random(seed)
+        self._queue = []
+        self._index = {}
+        for student in students:
+            self.admit(student)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __contains__(self, student):
+        return student in self._index
+
+    def __iter__(self):
+        return iter(self._queue)
+
+    def students(self):
+        """
+        :return: list: The students that are still in the rotation
+        """
+        return list(self._queue)
+
+    def admit(self, student):
+        """
+        Add a student to the rotation
+        :param student: str: The student
+        :return: bool: True if added, False if the student was already in the rotation
+        """
+        if student in self._index:
+            return False
+        self._index[student] = len(self._queue)
+        self._queue.append(student)
+        return True
+
+    def exclude(self, student):
+        """
+        Remove a student from the rotation
+        :param student: str: The student
+        :return: bool: True if removed, False if the student was not in the rotation
+        """
+        position = self._index.get(student)
+        if position is None:
+            return False
+        self._remove_at(position)
+        return True
+
+    def reset(self, students):
+        """
+        Start a new rotation with the given students
+        :param students: iterable: The students
+        """
+        self._queue = []
+        self._index = {}
+        for student in students:
+            self.admit(student)
+
+    def _remove_at(self, position):
+        # Move the last student into the gap, so nothing has to shift
+        student = self._queue[position]
+        last = self._queue.pop()
+        if position < len(self._queue):
+            self._queue[position] = last
+            self._index[last] = position
+        del self._index[student]
+        return student
+
+    def pop(self):
+        """
+        Remove a random student from the rotation
+        :return: str: The student
+        """
+        if not self._queue:
+            raise IndexError('pop from empty rotation')
+        return self._remove_at(self._random.randrange(len(self._queue)))
+
+    def pick(self, amount, keep_picked=False):
+        """
+        Randomly pick students from the rotation
+        :param amount: int: The amount of students to pick
+        :param keep_picked: bool: Leave the picked students in the rotation
+        :return: list: The picked students
+        """
+        if not 0 <= amount <= len(self._queue):
+            raise ValueError('Sample larger than population or is negative')
+        if keep_picked:
+            return [self._queue[position] for position in self._random.sample(range(len(self._queue)), amount)]
+        return [self.pop() for _ in range(amount)]
+
+    def pick_fewest(self, amount, duties, keep_picked=False):
+        """
+        Pick the students with the fewest duties, students with as many duties are picked randomly
+        :param amount: int: The amount of students to pick
+        :param duties: callable: Gets a student and returns the amount of duties the student did
+        :param keep_picked: bool: Leave the picked students in the rotation
+        :return: list: The picked students, fewest duties first
+        """
+        if not 0 <= amount <= len(self._queue):
+            raise ValueError('Sample larger than population or is negative')
+        by_duties = {}
+        for student in self._queue:
+            by_duties.setdefault(duties(student), []).append(student)
+        picked = []
+        for count in sorted(by_duties):
+            if len(picked) == amount:
+                break
+            students = by_duties[count]
+            picked += self._random.sample(students, min(amount - len(picked), len(students)))
+        if not keep_picked:
+            for student in picked:
+                self.exclude(student)
+        return picked
+
+
+class IdRotation(Rotation):
+    """
+    A Rotation of integer student IDs, see Roster
+    The queue and the position of every ID in it are arrays of 4 byte integers instead of a list and a dict,
+    so a rotation of a million students takes 8MB and starting a new rotation copies no names
+    """
+
+    # Position of IDs that are not in the rotation
+    ABSENT = 0xFFFFFFFF
+
+    def __init__(self, students=(), seed=None):
+        """
+        :param students: iterable: The student IDs to start with, duplicates are ignored
+        :param seed: int: Seed for the random picking, None picks differently every run
+        """
+        self._random = Random(seed)
+        self.reset(students)
+
+    def __contains__(self, student):
+        return 0 <= student < len(self._index) and self._index[student] != self.ABSENT
+
+    def admit(self, student):
+        """
+        Add a student to the rotation
+        :param student: int: The student ID
+        :return: bool: True if added, False if the student was already in the rotation
+        """
+        if student in self:
+            return False
+        if student >= len(self._index):
+            self._index.extend([self.ABSENT] * (student + 1 - len(self._index)))
+        self._index[student] = len(self._queue)
+        self._queue.append(student)
+        return True
+
+    def exclude(self, student):
+        """
+        Remove a student from the rotation
+        :param student: int: The student ID
+        :return: bool: True if removed, False if the student was not in the rotation
+        """
+        if student not in self:
+            return False
+        self._remove_at(self._index[student])
+        return True
+
+    def reset(self, students):
+        """
+        Start a new rotation with the given student IDs
+        :param students: iterable: The student IDs, range(len(roster)) for a complete roster
+        """
+        if isinstance(students, range) and students.start == 0 and students.step == 1:
+            # Every ID is at its own position, no need to admit them one by one
+            self._queue = array('I', students)
+            self._index = array('I', students)
+            return
+        self._queue = array('I')
+        self._index = array('I')
+        for student in students:
+            self.admit(student)
+
+    def _remove_at(self, position):
+        student = self._queue[position]
+        last = self._queue.pop()
+        if position < len(self._queue):
+            self._queue[position] = last
+            self._index[last] = position
+        self._index[student] = self.ABSENT
+        return student
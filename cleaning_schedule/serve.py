@@ -0,0 +1,434 @@
+import json
+import logging
+from argparse import ArgumentParser
+from copy import copy
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Event, Lock, Thread
+from time import monotonic
+from urllib.parse import urlsplit, parse_qs
+
+from cleaning_schedule.make_os3_cleaning_schedule import parse_args as parse_schedule_args, open_website, \
+    run_schedule, plan_schedule, load_schedule_files, load_pick_history
+from cleaning_schedule.state import open_state_store, import_students_file
+from cleaning_schedule.utils.logger import configure_logging, configure_sinks
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.settings.base import SERVE_HOST, SERVE_PORT, SERVE_REFRESH_INTERVAL, EMAIL_TEMPLATE
+
+"""
+Keep the OS3 website session, the students and cleaning tasks, the email templates and the student state
+warm in one long running process, and make, preview and send cleaning schedules over HTTP:
+
+    GET  /health             Status and the time of the next scheduled send
+    GET  /schedule?weeks=N   The picks and tasks of the next N weeks as JSON, the student state is not changed
+    GET  /preview?week=N     The email of week N (default 1) as HTML, the student state is not changed
+    POST /send?weeks=N       Pick students, save the student state and send the emails, like a command line run
+    POST /refresh            Get the students and cleaning tasks from os3.nl again
+    GET  /metrics            The metrics of all runs in the Prometheus text format
+
+A schedule that is previewed is not necessarily the schedule that is sent, picking is random unless --seed is given.
+"""
+
+logger = configure_logging(__name__)
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def parse_args(args=None):
+    """
+    Parse the serve options, all other arguments are the arguments of make_os3_cleaning_schedule.py
+    :param args: list: The arguments
+    :return: tuple: (Namespace: the serve options, Namespace: the schedule arguments)
+    """
+    parser = ArgumentParser(prog='make_os3_cleaning_schedule.py serve', allow_abbrev=False,
+                            description='Serve cleaning schedules over HTTP from a long running process. '
+                                        'All other arguments are passed to make_os3_cleaning_schedule.py '
+                                        'and used for every schedule')
+    parser.add_argument('--host', default=SERVE_HOST, help='Address to listen on (default {})'.format(SERVE_HOST))
+    parser.add_argument('--port', type=int, default=SERVE_PORT,
+                        help='Port to listen on, 0 for any free port (default {})'.format(SERVE_PORT))
+    parser.add_argument('--send-at', type=parse_weekly_time, metavar='"DAY HH:MM"',
+                        help='Send the schedule every week at this time, like "mon 09:00" (default never)')
+    parser.add_argument('--refresh-interval', type=int, default=SERVE_REFRESH_INTERVAL,
+                        help='Seconds the students and cleaning tasks are kept before they are fetched from os3.nl '
+                             'again (default {})'.format(SERVE_REFRESH_INTERVAL))
+
+    serve_args, schedule_args = parser.parse_known_args(args)
+    if not 0 <= serve_args.port <= 65535:
+        parser.error('--port should be between 0 and 65535')
+    if serve_args.refresh_interval < 0:
+        parser.error('--refresh-interval should be at least 0')
+    return serve_args, parse_schedule_args(schedule_args)
+
+
+def parse_weekly_time(value):
+    """
+    :param value: str: A time of the week, like "mon 09:00"
+    :return: tuple: (int: weekday, 0 is monday, int: hour, int: minute)
+    """
+    from argparse import ArgumentTypeError
+
+    try:
+        day, time = value.lower().split()
+        hour, minute = (int(part) for part in time.split(':'))
+        weekday = WEEKDAYS.index(day[:3])
+    except ValueError:
+        raise ArgumentTypeError('{} is not formatted like "mon 09:00"'.format(value))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ArgumentTypeError('{} is not a valid time'.format(time))
+    return weekday, hour, minute
+
+
+def next_weekly_time(weekly_time, now):
+    """
+    :param weekly_time: tuple: (int: weekday, int: hour, int: minute), see parse_weekly_time()
+    :param now: datetime: The time to start from
+    :return: datetime: The first time after <now> at <weekly_time>
+    """
+    weekday, hour, minute = weekly_time
+    moment = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    moment += timedelta(days=(weekday - now.weekday()) % 7)
+    if moment <= now:
+        moment += timedelta(weeks=1)
+    return moment
+
+
+class WarmWebsite:
+    """
+    Wraps an OS3Website and keeps the students and cleaning tasks it got for a while,
+    so the schedules made in between do not go to os3.nl. Everything else goes to the wrapped website
+    """
+
+    def __init__(self, website, refresh_interval=SERVE_REFRESH_INTERVAL):
+        """
+        :param website: OS3Website: The website to wrap
+        :param refresh_interval: int: Seconds before the students and cleaning tasks are fetched again
+        """
+        self.website = website
+        self.refresh_interval = refresh_interval
+        self._results = {}
+        self._lock = Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.website, name)
+
+    def _remember(self, key, fetch):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None and monotonic() - result[0] < self.refresh_interval:
+                return result[1]
+        value = fetch()
+        # Do not keep failures, the next schedule should try again
+        if value:
+            with self._lock:
+                self._results[key] = (monotonic(), value)
+        return value
+
+    def get_all_students(self):
+        return self._remember(('students',), self.website.get_all_students)
+
+    def get_elements_from_webpage(self, url, element, **kwargs):
+        key = ('elements', url, element, tuple(sorted(kwargs.items())))
+        return self._remember(key, lambda: self.website.get_elements_from_webpage(url, element, **kwargs))
+
+    def refresh(self):
+        """
+        Forget the students and cleaning tasks, they are fetched from os3.nl on the next schedule
+        """
+        with self._lock:
+            self._results = {}
+
+
+def summarise(emails):
+    """
+    :param emails: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+    :return: list: dict with the date, picked students, assignments and cleaning tasks of every week
+    """
+    return [
+        {
+            'date': date,
+            'students': list(context['students']),
+            'assignments': [
+                {'student': student, 'tasks': list(tasks)} for student, tasks in context['assignments']
+            ],
+            'cleaning_tasks': list(context['cleaning_tasks']),
+            'list_rotated': context['list_rotated'],
+        }
+        for date, _, context in emails
+    ]
+
+
+class ScheduleError(Exception):
+    """
+    A schedule could not be made or sent
+    """
+
+
+class ScheduleService:
+    """
+    Makes the cleaning schedules of the server, one at a time, with a warm website, mail and student state
+    """
+
+    def __init__(self, args, website, store, mail=None, history=None):
+        """
+        :param args: Namespace: The schedule arguments, see make_os3_cleaning_schedule.parse_args()
+        :param website: WarmWebsite: The website
+        :param store: The student state, kept open while serving
+        :param mail: Mail: Renders the emails, None for a new one
+        :param history: PickHistory: The pick history of --history, read again before every schedule
+        """
+        if mail is None:
+            from cleaning_schedule.mail import Mail
+
+            mail = Mail()
+        self.args = args
+        self.website = website
+        self.store = store
+        self.mail = mail
+        self.history = history
+        self.scheduler = None
+        self._lock = Lock()
+
+    def _arguments(self, weeks):
+        args = copy(self.args)
+        if weeks is not None:
+            args.weeks = weeks
+        return args
+
+    def _run(self, action):
+        with self._lock:
+            if self.history is not None:
+                # Picks of runs from the command line since the last schedule count for the footer and fair picking
+                self.history.load()
+            try:
+                return action()
+            except SystemExit as e:
+                raise ScheduleError('schedule failed with exit code {}'.format(e.code))
+
+    def plan(self, weeks=None):
+        """
+        Make the schedule of the next weeks without changing the student state
+        :param weeks: int: The amount of weeks, None for --weeks
+        :return: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+        """
+        def action():
+            args = self._arguments(weeks)
+            try:
+                unavailable, _ = load_schedule_files(args)
+                return plan_schedule(args, self.website, self.store, unavailable, self.mail, self.history)
+            finally:
+                self.store.rollback()
+                if self.history is not None:
+                    self.history.rollback()
+        return self._run(action)
+
+    def preview(self, week=1):
+        """
+        :param week: int: The week to preview, 1 is this week
+        :return: bytes: The rendered email of the week
+        """
+        return self.plan(week)[-1][1]
+
+    def send(self, weeks=None):
+        """
+        Make the schedule of the next weeks, save the student state and send the emails
+        :param weeks: int: The amount of weeks, None for --weeks
+        :return: list: (str: date, bytes: rendered email, dict: template arguments) of every week
+        """
+        def action():
+            try:
+                emails = run_schedule(self._arguments(weeks), self.website, self.store, self.history)
+            finally:
+                self.store.rollback()
+                if self.history is not None:
+                    self.history.rollback()
+            # The changed cleaning tasks are reported once
+            self.website.changes.clear()
+            return emails
+        return self._run(action)
+
+    def scheduled_send(self):
+        """
+        Send the schedule with fresh students and cleaning tasks, failures are logged
+        """
+        logger.info('Sending the weekly cleaning schedule')
+        self.website.refresh()
+        try:
+            self.send()
+        except Exception as e:
+            logger.error('Weekly cleaning schedule failed: {}'.format(e))
+
+    def health(self):
+        """
+        :return: dict: The status of the service
+        """
+        next_run = self.scheduler.next_run if self.scheduler else None
+        return {'status': 'ok', 'next_send': next_run.isoformat() if next_run else None}
+
+
+class WeeklyScheduler(Thread):
+    """
+    Runs a job every week at the same time, in a daemon thread
+    """
+
+    def __init__(self, weekly_time, job):
+        """
+        :param weekly_time: tuple: (int: weekday, int: hour, int: minute), see parse_weekly_time()
+        :param job: callable: The job to run
+        """
+        super().__init__(name='weekly-scheduler', daemon=True)
+        self.weekly_time = weekly_time
+        self.job = job
+        self.next_run = None
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.next_run = next_weekly_time(self.weekly_time, datetime.now())
+            logger.info('Next cleaning schedule will be sent at {}'.format(self.next_run))
+            # Wake up at least every minute, so changes of the clock are noticed
+            while not self._stopped.is_set() and datetime.now() < self.next_run:
+                self._stopped.wait(min(60, (self.next_run - datetime.now()).total_seconds()))
+            if not self._stopped.is_set():
+                self.job()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class ScheduleServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server handling every request in its own thread
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        """
+        :param address: tuple: (str: host, int: port) to listen on
+        :param service: ScheduleService: The service answering the requests
+        """
+        super().__init__(address, ScheduleRequestHandler)
+        self.service = service
+
+
+class ScheduleRequestHandler(BaseHTTPRequestHandler):
+    """
+    Maps the HTTP API to the ScheduleService of the server
+    """
+    server_version = 'cleaning-schedule'
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        routes = {
+            ('GET', '/health'): self._health,
+            ('GET', '/schedule'): self._schedule,
+            ('GET', '/preview'): self._preview,
+            ('POST', '/send'): self._send_schedule,
+            ('POST', '/refresh'): self._refresh,
+            ('GET', '/metrics'): self._metrics,
+        }
+        route = routes.get((method, url.path))
+        if route is None:
+            allowed = [route_method for route_method, path in routes if path == url.path]
+            if allowed:
+                return self._send_json({'error': 'use {}'.format(', '.join(allowed))}, 405)
+            return self._send_json({'error': 'not found'}, 404)
+        try:
+            with metrics.span('serve'):
+                route(parse_qs(url.query))
+        except ValueError as e:
+            self._send_json({'error': str(e)}, 400)
+        except ScheduleError as e:
+            self._send_json({'error': str(e)}, 500)
+        except Exception as e:
+            logger.exception('{} {} failed'.format(method, self.path))
+            self._send_json({'error': str(e)}, 500)
+
+    def _health(self, query):
+        self._send_json(self.server.service.health())
+
+    def _schedule(self, query):
+        self._send_json({'weeks': summarise(self.server.service.plan(self._number(query, 'weeks')))})
+
+    def _preview(self, query):
+        self._send(200, self.server.service.preview(self._number(query, 'week') or 1), 'text/html; charset=utf-8')
+
+    def _send_schedule(self, query):
+        self._send_json({'weeks': summarise(self.server.service.send(self._number(query, 'weeks')))})
+
+    def _refresh(self, query):
+        self.server.service.website.refresh()
+        self._send_json({'status': 'ok'})
+
+    def _metrics(self, query):
+        self._send(200, metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+
+    @staticmethod
+    def _number(query, name):
+        values = query.get(name)
+        if not values:
+            return None
+        if not values[0].isdigit() or int(values[0]) < 1:
+            raise ValueError('{} should be a number of at least 1'.format(name))
+        return int(values[0])
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main(args=None):
+    serve_args, args = parse_args(args)
+    if args.log_file or args.log_json:
+        configure_sinks(json_lines=args.log_json, log_file=args.log_file)
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    from cleaning_schedule.mail import Mail, get_template_environment
+
+    website = open_website(args)
+    store = None
+    try:
+        store = open_state_store(args.state_backend, args.students_file)
+        if args.import_students_file:
+            logger.info('Importing students from {} into {}'.format(args.import_students_file, args.students_file))
+            import_students_file(store, args.import_students_file)
+        # Compile the template before the first request
+        get_template_environment().get_template(EMAIL_TEMPLATE)
+        mail = Mail()
+        mail.set_log_level(logging.DEBUG if args.debug else logging.INFO)
+        service = ScheduleService(args, WarmWebsite(website, serve_args.refresh_interval), store, mail,
+                                  load_pick_history(args))
+        server = ScheduleServer((serve_args.host, serve_args.port), service)
+        if serve_args.send_at:
+            service.scheduler = WeeklyScheduler(serve_args.send_at, service.scheduled_send)
+            service.scheduler.start()
+        logger.info('Serving cleaning schedules on http://{}:{}'.format(*server.server_address[:2]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info('Stopping')
+        finally:
+            if service.scheduler:
+                service.scheduler.stop()
+            server.server_close()
+    finally:
+        if store is not None:
+            store.close()
+        website.close()
@@ -8,3 +8,54 @@ PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MAX_WEBSITE_RETRIES = 3
 CLEANING_TASK_LIST_URL = 'https://www.os3.nl/{}/students/playground/cleaning'
 EMAIL_TEMPLATE = 'this_weeks_cleaning_tasks.email.jn2'
+# Template of the email every recipient gets with --personal
+PERSONAL_EMAIL_TEMPLATE = 'personal_cleaning_tasks.email.jn2'
+TEMPLATE_DIR = os.path.join(PROJECT_DIR, 'templates')
+# Compiled templates are stored here, a read-only cache is only read and the user's temp dir is used when it is missing
+TEMPLATE_CACHE_DIR = os.path.join(TEMPLATE_DIR, '__jinjacache__')
+HTTP_POOL_SIZE = 4
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 30
+HTTP_CHUNK_SIZE = 16 * 1024
+HTTP_CACHE_TTL = 3600
+HTTP_CACHE_MAX_SIZE = 50 * 1024 * 1024
+# Bytes of the BLAKE2 digest of a page, a page with the same digest as last run is not parsed again
+EXTRACTION_DIGEST_SIZE = 16
+# Pages up to this many bytes are kept in memory until their digest is known, larger pages go to a temp file
+EXTRACTION_SPOOL_SIZE = 1024 * 1024
+# Override with $SMTP_HOST, $SMTP_PORT, $SMTP_STARTTLS=0 and $SMTP_LOGIN=0 to use a local stand-in server
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.os3.nl')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') != '0'
+SMTP_LOGIN = os.getenv('SMTP_LOGIN', '1') != '0'
+SMTP_POOL_SIZE = 2
+SMTP_TIMEOUT = 30
+# Messages rendered and sent at the same time with --personal, every worker can hold an SMTP connection
+SMTP_SEND_CONCURRENCY = 4
+SQLITE_TIMEOUT = 60
+# Address of the serve mode, and seconds it keeps the students and cleaning tasks before asking os3.nl again
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8080
+SERVE_REFRESH_INTERVAL = HTTP_CACHE_TTL
+# Picks appended to the --history log before its index is written again, only these are read when opening it
+HISTORY_INDEX_TAIL = 1024
+# Avoid giving a student a cleaning task they did within this many weeks
+ASSIGNMENT_NO_REPEAT_WEEKS = 4
+# Cost of giving a student a task, the higher the cost the less likely: not available for the task,
+# did it within ASSIGNMENT_NO_REPEAT_WEEKS (per week left), shared a task before (per time), already did (per task)
+ASSIGNMENT_UNAVAILABLE_COST = 1000000
+ASSIGNMENT_REPEAT_COST = 1000
+ASSIGNMENT_PAIR_COST = 100
+ASSIGNMENT_LOAD_COST = 1
+# Retries of os3.nl calls: full jitter exponential backoff in seconds, bounded by a total deadline per call
+WEBSITE_RETRY_BACKOFF = 0.5
+WEBSITE_RETRY_MAX_BACKOFF = 8
+WEBSITE_RETRY_DEADLINE = 60
+# Consecutive failed attempts before calls to os3.nl fail fast, and seconds before trying again
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 60
+LOG_FORMAT = '[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s'
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Size in bytes before the --log-file is rotated, and the amount of rotated files to keep
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
@@ -0,0 +1,284 @@
+import json
+import logging
+from argparse import ArgumentParser
+
+from cleaning_schedule.roster import Roster, is_roster_file
+from cleaning_schedule.rotation import IdRotation
+from cleaning_schedule.utils.filesystem import get_lines_from_file
+from cleaning_schedule.utils.logger import configure_logging
+
+"""
+Simulate the picking policy of make_os3_cleaning_schedule for many years, to see how evenly it spreads duty.
+Every week <students> are picked from the rotation, when fewer are left the rotation starts over with the
+complete roster and the students that were left do not clean in that round.
+With NumPy installed all simulated years are sampled at once in batches, otherwise Rotation itself is used.
+"""
+
+logger = configure_logging(__name__)
+
+ENGINE_AUTO = 'auto'
+ENGINE_NUMPY = 'numpy'
+ENGINE_PYTHON = 'python'
+ENGINES = (ENGINE_AUTO, ENGINE_NUMPY, ENGINE_PYTHON)
+# Simulated years sampled at once by the NumPy engine. The weeks are walked one at a time, so the memory use
+# is about BATCH_SIZE * roster size * 20 bytes (the float64 sort keys and int64 order of one round of the rotation,
+# and the int16 duty counts and last duty weeks), independent of the amount of weeks
+BATCH_SIZE = 1000
+
+
+def parse_args(args=None):
+    parser = ArgumentParser(prog='make_os3_cleaning_schedule.py simulate',
+                            description='Simulate the picking policy for many years and report how evenly '
+                                        'cleaning duty is spread')
+    roster_group = parser.add_mutually_exclusive_group()
+    roster_group.add_argument('-r', '--roster-size', type=int, default=60,
+                              help='Amount of students in the roster (default 60)')
+    roster_group.add_argument('-f', '--students-file',
+                              help='Use the students in this file (or roster file) as roster')
+    parser.add_argument('-s', '--students', type=int, default=2, help='Amount of students to pick a week (default 2)')
+    parser.add_argument('-w', '--weeks', type=int, default=52, help='Weeks in a simulated year (default 52)')
+    parser.add_argument('-t', '--trials', type=int, default=10000, help='Amount of years to simulate (default 10000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulation (default 0)')
+    parser.add_argument('--keep-picked-students', action='store_true',
+                        help='Simulate picking without removing picked students from the rotation')
+    parser.add_argument('--engine', choices=ENGINES, default=ENGINE_AUTO,
+                        help='Sample with NumPy or with the Rotation of the scheduler (default numpy if installed)')
+    parser.add_argument('-o', '--output', help='Also write the report as JSON to this file')
+    parser.add_argument('-d', '--debug', action='store_true', help='Debug messages')
+
+    args = parser.parse_args(args)
+    if args.students_file and is_roster_file(args.students_file):
+        with Roster.open(args.students_file) as roster:
+            args.roster = list(roster)
+    elif args.students_file:
+        args.roster = [student for student in get_lines_from_file(args.students_file) if student.strip()]
+    else:
+        args.roster = ['Student {}'.format(number) for number in range(args.roster_size)]
+    if args.students < 1 or args.students > len(args.roster):
+        parser.error('--students should be between 1 and the roster size ({})'.format(len(args.roster)))
+    if args.weeks < 1:
+        parser.error('--weeks should be at least 1')
+    if args.trials < 1:
+        parser.error('--trials should be at least 1')
+    return args
+
+
+def gini(counts):
+    """
+    :param counts: list: The duty count of every student
+    :return: float: The Gini coefficient, 0 when every student cleaned equally often
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    ordered = sorted(counts)
+    size = len(ordered)
+    weighted = sum(rank * count for rank, count in enumerate(ordered, 1))
+    return 2.0 * weighted / (size * total) - (size + 1.0) / size
+
+
+def max_gap(duty_weeks):
+    """
+    :param duty_weeks: list: The weeks a student cleaned, in order
+    :return: int: The most weeks between two duties of the student, 0 when the student cleaned less than twice
+    """
+    return max((later - earlier for earlier, later in zip(duty_weeks, duty_weeks[1:])), default=0)
+
+
+def simulate_python(roster, students, weeks, trials, seed=0, keep_picked=False):
+    """
+    Simulate with the Rotation of the scheduler, one year at a time
+    :param roster: list: All students
+    :param students: int: The amount of students to pick a week
+    :param weeks: int: The weeks in a year
+    :param trials: int: The amount of years to simulate
+    :param seed: int: Seed of the simulation
+    :param keep_picked: bool: Do not remove picked students from the rotation
+    :return: tuple: (list: duty counts of every student for every year, list: max gap of every year,
+                     list: Gini coefficient of every year)
+    """
+    rotation = IdRotation(seed=seed)
+    student_ids = range(len(roster))
+    all_counts, gaps, ginis = [], [], []
+    for _ in range(trials):
+        rotation.reset(student_ids)
+        duty_weeks = [[] for _ in student_ids]
+        for week in range(weeks):
+            if len(rotation) < students:
+                rotation.reset(student_ids)
+            for student in rotation.pick(students, keep_picked=keep_picked):
+                duty_weeks[student].append(week)
+        counts = [len(weeks_on_duty) for weeks_on_duty in duty_weeks]
+        all_counts.append(counts)
+        gaps.append(max(max_gap(weeks_on_duty) for weeks_on_duty in duty_weeks))
+        ginis.append(gini(counts))
+    return all_counts, gaps, ginis
+
+
+def simulate_numpy(roster, students, weeks, trials, seed=0, keep_picked=False, batch_size=BATCH_SIZE):
+    """
+    Simulate with NumPy, sampling the picks of a batch of years at once
+    Every round of the rotation is a random permutation of the roster, picked from front to back
+    The weeks are walked in order, keeping only the duty count and the last duty week of every student
+    :return: tuple: See simulate_python(), as NumPy arrays
+    """
+    import numpy
+
+    rng = numpy.random.default_rng(seed)
+    size = len(roster)
+    # Week numbers, duty counts and gaps never exceed <weeks>
+    week_type = numpy.int16 if weeks < 2 ** 15 else numpy.int32
+    weeks_per_round = size // students
+    all_counts, gaps, ginis = [], [], []
+    for start in range(0, trials, batch_size):
+        batch = min(batch_size, trials - start)
+        years = numpy.arange(batch)[:, None]
+        counts = numpy.zeros((batch, size), dtype=week_type)
+        # The week of the last duty of every student, -1 before the first duty
+        last_duty = numpy.full((batch, size), -1, dtype=week_type)
+        batch_gaps = numpy.zeros(batch, dtype=week_type)
+        order = None
+        for week in range(weeks):
+            if keep_picked:
+                # Every week is an independent sample without replacement
+                picks = rng.random((batch, size)).argsort(axis=1)[:, :students]
+            else:
+                position = week % weeks_per_round
+                if position == 0:
+                    order = rng.random((batch, size)).argsort(axis=1)
+                picks = order[:, position * students:(position + 1) * students]
+            previous_duty = last_duty[years, picks]
+            week_gaps = numpy.where(previous_duty >= 0, week - previous_duty, 0)
+            numpy.maximum(batch_gaps, week_gaps.max(axis=1), out=batch_gaps)
+            # The picks of a week are distinct, so every student is updated at most once
+            counts[years, picks] += 1
+            last_duty[years, picks] = week
+
+        ordered = numpy.sort(counts, axis=1).astype(numpy.int64)
+        totals = ordered.sum(axis=1)
+        weighted = (ordered * numpy.arange(1, size + 1)).sum(axis=1)
+        batch_ginis = numpy.where(
+            totals > 0, 2.0 * weighted / (size * numpy.maximum(totals, 1)) - (size + 1.0) / size, 0.0
+        )
+
+        all_counts.append(counts)
+        gaps.append(batch_gaps)
+        ginis.append(batch_ginis)
+    return numpy.concatenate(all_counts), numpy.concatenate(gaps), numpy.concatenate(ginis)
+
+
+def choose_engine(engine):
+    """
+    :param engine: str: auto, numpy or python
+    :return: str: numpy or python, auto is numpy when it is installed
+    """
+    if engine != ENGINE_AUTO:
+        return engine
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return ENGINE_PYTHON
+    return ENGINE_NUMPY
+
+
+def percentile(ordered, fraction):
+    """
+    :param ordered: list: Sorted values
+    :param fraction: float: The percentile as fraction, 0.95 for the 95th percentile
+    :return: The value below which <fraction> of the values fall (nearest rank)
+    """
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def make_report(counts, gaps, ginis):
+    """
+    Summarise a simulation
+    :param counts: list: Duty counts of every student for every year
+    :param gaps: list: Max gap of every year
+    :param ginis: list: Gini coefficient of every year
+    :return: dict: The report
+    """
+    duties = {}
+    for year in counts:
+        for count in year:
+            count = int(count)
+            duties[count] = duties.get(count, 0) + 1
+    student_years = sum(duties.values())
+    gaps = sorted(int(gap) for gap in gaps)
+    ginis = sorted(float(value) for value in ginis)
+    return {
+        'duties_per_student_year': {
+            'mean': sum(count * amount for count, amount in duties.items()) / student_years,
+            'min': min(duties),
+            'max': max(duties),
+            'distribution': {str(count): duties[count] / student_years for count in sorted(duties)},
+        },
+        'max_gap_weeks': {
+            'mean': sum(gaps) / len(gaps),
+            'p95': percentile(gaps, 0.95),
+            'max': gaps[-1],
+        },
+        'gini': {
+            'mean': sum(ginis) / len(ginis),
+            'p95': percentile(ginis, 0.95),
+            'max': ginis[-1],
+        },
+    }
+
+
+def simulate(roster, students, weeks, trials, seed=0, keep_picked=False, engine=ENGINE_AUTO):
+    """
+    Simulate the picking policy and summarise how evenly duty is spread
+    :param roster: list: All students
+    :param students: int: The amount of students to pick a week
+    :param weeks: int: The weeks in a year
+    :param trials: int: The amount of years to simulate
+    :param seed: int: Seed of the simulation, the same seed gives the same report
+    :param keep_picked: bool: Do not remove picked students from the rotation
+    :param engine: str: auto, numpy or python
+    :return: dict: The report, see make_report()
+    """
+    engine = choose_engine(engine)
+    logger.debug('Simulating %s years with the %s engine', trials, engine)
+    simulator = simulate_numpy if engine == ENGINE_NUMPY else simulate_python
+    report = make_report(*simulator(roster, students, weeks, trials, seed=seed, keep_picked=keep_picked))
+    report['settings'] = {
+        'roster_size': len(roster), 'students': students, 'weeks': weeks, 'trials': trials, 'seed': seed,
+        'keep_picked_students': keep_picked, 'engine': engine,
+    }
+    return report
+
+
+def format_report(report):
+    """
+    :param report: dict: The report, see simulate()
+    :return: str: The report as text
+    """
+    settings = report['settings']
+    duties = report['duties_per_student_year']
+    lines = [
+        '{trials} years of {weeks} weeks, {students} of {roster_size} students a week '
+        '({engine} engine, seed {seed})'.format(**settings),
+        'Duties per student per year: mean {mean:.2f}, min {min}, max {max}'.format(**duties),
+    ]
+    for count, fraction in duties['distribution'].items():
+        lines.append('  {:>3} duties: {:6.2%} {}'.format(count, fraction, '#' * int(round(fraction * 50))))
+    lines.append('Max weeks between two duties: mean {mean:.1f}, p95 {p95}, max {max}'.format(
+        **report['max_gap_weeks']
+    ))
+    lines.append('Gini coefficient of duties: mean {mean:.3f}, p95 {p95:.3f}, max {max:.3f}'.format(**report['gini']))
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    if args.engine == ENGINE_NUMPY and choose_engine(ENGINE_AUTO) != ENGINE_NUMPY:
+        logger.critical('The numpy engine needs NumPy, install it or use --engine python')
+        exit(2)
+    report = simulate(args.roster, args.students, args.weeks, args.trials, seed=args.seed,
+                      keep_picked=args.keep_picked_students, engine=args.engine)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
@@ -0,0 +1,380 @@
+import sqlite3
+from datetime import datetime
+from os.path import isfile
+
+from cleaning_schedule.roster import Roster, as_roster, write_roster
+from cleaning_schedule.utils.filesystem import get_lines_from_file, write_lines_to_file
+from cleaning_schedule.settings.base import SQLITE_TIMEOUT
+
+STATE_BACKEND_FILE = 'file'
+STATE_BACKEND_SQLITE = 'sqlite'
+STATE_BACKEND_ROSTER = 'roster'
+STATE_BACKENDS = (STATE_BACKEND_FILE, STATE_BACKEND_SQLITE, STATE_BACKEND_ROSTER)
+
+
+class FileStateStore:
+    """
+    Keeps the remaining students in a file, one student per line
+    The file is rewritten (atomically) on commit, exclusions, picks and assignments are not recorded
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str: The students file
+        """
+        self.path = path
+        self._students = {}
+        self._dirty = False
+
+    def exists(self):
+        """
+        :return: bool: True if there is a stored student list
+        """
+        return isfile(self.path)
+
+    def load(self):
+        """
+        :return: list: The students that did not clean yet in this rotation
+        """
+        self._students = dict.fromkeys(get_lines_from_file(self.path)) if self.exists() else {}
+        return list(self._students)
+
+    def replace(self, students):
+        """
+        Start a new rotation
+        :param students: list: All students of the new rotation
+        """
+        self._students = dict.fromkeys(students)
+        self._dirty = True
+
+    def remove(self, students):
+        """
+        Remove students from the rotation, after they are picked
+        :param students: iterable: The students to remove
+        """
+        for student in students:
+            self._students.pop(student, None)
+        self._dirty = True
+
+    def exclude(self, students):
+        """
+        Remove excluded students from the rotation
+        Only written to the file together with picks or a new rotation
+        :param students: iterable: The students to exclude
+        """
+        for student in students:
+            self._students.pop(student, None)
+
+    def record_picks(self, week, students):
+        """
+        Record who was picked, not supported by the file backend
+        :param week: str: The week the students were picked for
+        :param students: list: The picked students
+        """
+
+    def record_assignments(self, week, assignments):
+        """
+        Record which student got which task, not supported by the file backend
+        :param week: str: The week of the assignments
+        :param assignments: list: Assignment tuples, see assign_tasks()
+        """
+
+    def assignment_history(self):
+        """
+        :return: list: No assignments are recorded by the file backend
+        """
+        return []
+
+    def commit(self):
+        """
+        Write the changes since load() to the students file
+        """
+        if self._dirty:
+            write_lines_to_file(self.path, list(self._students))
+            self._dirty = False
+
+    def rollback(self):
+        """
+        Forget the changes since load(), the students file is left as is
+        """
+        self._students = {}
+        self._dirty = False
+
+    def close(self):
+        pass
+
+
+class RosterStateStore(FileStateStore):
+    """
+    Keeps the remaining students in a compact roster file, see Roster
+    The roster is memory-mapped on load, picked and excluded students are kept aside
+    and the remaining students are written (atomically) on commit
+    """
+
+    def __init__(self, path):
+        """
+        :param path: str: The roster file
+        """
+        super().__init__(path)
+        self._students = Roster.from_names([])
+        self._loaded = None
+        self._removed = set()
+
+    def load(self):
+        """
+        :return: Roster: The students that did not clean yet in this rotation
+        """
+        self.close()
+        self._students = self._loaded = Roster.open(self.path) if self.exists() else Roster.from_names([])
+        self._removed = set()
+        return self._students
+
+    def replace(self, students):
+        """
+        Start a new rotation
+        :param students: iterable: All students of the new rotation, names or a Roster
+        """
+        self._students = as_roster(students)
+        self._removed = set()
+        self._dirty = True
+
+    def remove(self, students):
+        """
+        Remove students from the rotation, after they are picked
+        :param students: iterable: The students to remove
+        """
+        self._removed.update(students)
+        self._dirty = True
+
+    def exclude(self, students):
+        """
+        Remove excluded students from the rotation
+        Only written to the file together with picks or a new rotation
+        :param students: iterable: The students to exclude
+        """
+        self._removed.update(students)
+
+    def commit(self):
+        """
+        Write the remaining students to the roster file
+        """
+        if self._dirty:
+            write_roster(self.path, (student for student in self._students if student not in self._removed))
+            self._dirty = False
+
+    def rollback(self):
+        """
+        Forget the changes since load(), the roster file is left as is
+        """
+        self.close()
+        self._students = Roster.from_names([])
+        self._removed = set()
+        self._dirty = False
+
+    def close(self):
+        """
+        Unmap the loaded roster file
+        """
+        if self._loaded is not None:
+            self._loaded.close()
+            self._loaded = None
+
+
+class SQLiteStateStore:
+    """
+    Keeps the roster, rotation, exclusions, pick and assignment history in a SQLite database
+    Every change is a small indexed update instead of a rewrite of all students.
+    The database runs in WAL mode and a run holds the write lock from load() until commit(),
+    so concurrent runs can not pick from the same rotation
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            remaining INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE INDEX IF NOT EXISTS students_remaining ON students (remaining);
+        CREATE TABLE IF NOT EXISTS exclusions (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL REFERENCES students (id),
+            excluded_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS exclusions_student ON exclusions (student_id);
+        CREATE TABLE IF NOT EXISTS picks (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL REFERENCES students (id),
+            week TEXT NOT NULL,
+            picked_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS picks_student ON picks (student_id);
+        CREATE INDEX IF NOT EXISTS picks_week ON picks (week);
+        CREATE TABLE IF NOT EXISTS assignments (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL REFERENCES students (id),
+            task TEXT NOT NULL,
+            week TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS assignments_week ON assignments (week);
+    """
+
+    def __init__(self, path, timeout=SQLITE_TIMEOUT):
+        """
+        :param path: str: The database file, created when not present
+        :param timeout: int: Seconds to wait for a concurrent run to finish
+        """
+        self.path = path
+        # Transactions are started explicitly, see load()
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(self.SCHEMA)
+
+    def _begin(self):
+        if not self.connection.in_transaction:
+            self.connection.execute('BEGIN IMMEDIATE')
+
+    def exists(self):
+        """
+        :return: bool: True if there is a stored student list
+        """
+        return self.connection.execute('SELECT 1 FROM students LIMIT 1').fetchone() is not None
+
+    def load(self):
+        """
+        Start a transaction and get the remaining students
+        :return: list: The students that did not clean yet in this rotation
+        """
+        self._begin()
+        return [row[0] for row in self.connection.execute('SELECT name FROM students WHERE remaining = 1 ORDER BY id')]
+
+    def replace(self, students):
+        """
+        Start a new rotation, students that are not in it anymore keep their history
+        :param students: list: All students of the new rotation
+        """
+        self._begin()
+        self.connection.execute('UPDATE students SET remaining = 0 WHERE remaining = 1')
+        students = [(student,) for student in students]
+        self.connection.executemany('INSERT OR IGNORE INTO students (name) VALUES (?)', students)
+        self.connection.executemany('UPDATE students SET remaining = 1 WHERE name = ?', students)
+
+    def remove(self, students):
+        """
+        Remove students from the rotation, after they are picked
+        :param students: iterable: The students to remove
+        """
+        self._begin()
+        self.connection.executemany(
+            'UPDATE students SET remaining = 0 WHERE name = ?', ((student,) for student in students)
+        )
+
+    def exclude(self, students):
+        """
+        Remove excluded students from the rotation and record the exclusion
+        :param students: iterable: The students to exclude
+        """
+        students = list(students)
+        self.remove(students)
+        now = datetime.now().isoformat()
+        self.connection.executemany(
+            'INSERT INTO exclusions (student_id, excluded_at) SELECT id, ? FROM students WHERE name = ?',
+            ((now, student) for student in students)
+        )
+
+    def record_picks(self, week, students):
+        """
+        Record who was picked
+        :param week: str: The week the students were picked for
+        :param students: list: The picked students
+        """
+        self._begin()
+        now = datetime.now().isoformat()
+        self.connection.executemany(
+            'INSERT INTO picks (student_id, week, picked_at) SELECT id, ?, ? FROM students WHERE name = ?',
+            ((week, now, student) for student in students)
+        )
+
+    def record_assignments(self, week, assignments):
+        """
+        Record which student got which task
+        :param week: str: The week of the assignments
+        :param assignments: list: Assignment tuples, see assign_tasks()
+        """
+        self._begin()
+        self.connection.executemany(
+            'INSERT INTO assignments (student_id, task, week) SELECT id, ?, ? FROM students WHERE name = ?',
+            ((task, week, assignment.student) for assignment in assignments for task in assignment.tasks)
+        )
+
+    def assignment_history(self):
+        """
+        :return: list: (str: week, str: student, str: task) tuples of all recorded assignments, oldest first
+        """
+        return self.connection.execute(
+            'SELECT assignments.week, students.name, assignments.task FROM assignments '
+            'JOIN students ON students.id = assignments.student_id ORDER BY assignments.id'
+        ).fetchall()
+
+    def history(self, student=None):
+        """
+        Get the pick history
+        :param student: str: Only get the history of this student
+        :return: list: (str: week, str: student) tuples, oldest first
+        """
+        query = 'SELECT picks.week, students.name FROM picks JOIN students ON students.id = picks.student_id'
+        if student is None:
+            return self.connection.execute(query + ' ORDER BY picks.id').fetchall()
+        return self.connection.execute(query + ' WHERE students.name = ? ORDER BY picks.id', (student,)).fetchall()
+
+    def commit(self):
+        """
+        Commit the changes since load()
+        """
+        if self.connection.in_transaction:
+            self.connection.execute('COMMIT')
+
+    def rollback(self):
+        """
+        Roll back the changes since load() and release the write lock
+        """
+        if self.connection.in_transaction:
+            self.connection.execute('ROLLBACK')
+
+    def close(self):
+        """
+        Close the database, uncommitted changes are rolled back
+        """
+        if self.connection is None:
+            return
+        if self.connection.in_transaction:
+            self.connection.execute('ROLLBACK')
+        self.connection.close()
+        self.connection = None
+
+
+def open_state_store(backend, path):
+    """
+    Open the state store for a backend
+    :param backend: str: file, sqlite or roster
+    :param path: str: The students file, database or roster file
+    :return: FileStateStore, SQLiteStateStore or RosterStateStore: The store
+    """
+    if backend == STATE_BACKEND_SQLITE:
+        return SQLiteStateStore(path)
+    if backend == STATE_BACKEND_ROSTER:
+        return RosterStateStore(path)
+    return FileStateStore(path)
+
+
+def import_students_file(store, path):
+    """
+    Start a new rotation in a store with the students from a newline separated students file
+    :param store: The store to import into
+    :param path: str: The students file
+    :return: int: The amount of imported students
+    """
+    students = get_lines_from_file(path)
+    store.replace(students)
+    store.commit()
+    return len(students)
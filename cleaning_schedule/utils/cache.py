@@ -0,0 +1,295 @@
+import json
+import os
+from collections import namedtuple
+from hashlib import blake2b, sha256
+from os.path import getsize, isfile, join
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+
+from cleaning_schedule.utils.filesystem import write_file_atomic
+from cleaning_schedule.settings.base import HTTP_CACHE_TTL, HTTP_CACHE_MAX_SIZE, EXTRACTION_DIGEST_SIZE
+
+Changes = namedtuple('Changes', ['added', 'removed'])
+
+
+class HTTPCache:
+    """
+    Persistent on-disk cache for HTTP responses
+    Every URL is stored as a body file and a metadata file holding the validators (ETag / Last-Modified)
+    Entries younger than the TTL are served without a request, older entries are revalidated
+    When the total size exceeds max_size the least recently used entries are removed
+    """
+
+    def __init__(self, directory, ttl=HTTP_CACHE_TTL, max_size=HTTP_CACHE_MAX_SIZE):
+        """
+        :param directory: str: The directory to store cached responses in (created when not present)
+        :param ttl: int: Seconds a cached response is used without revalidation
+        :param max_size: int: Maximum total size in bytes of all cached bodies
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = sha256(url.encode('utf-8')).hexdigest()
+        return join(self.directory, '{}.meta'.format(key)), join(self.directory, '{}.body'.format(key))
+
+    def get(self, url):
+        """
+        Get the metadata of a cached response
+        :param url: str: The URL of the response
+        :return: dict: The metadata or None if the URL is not cached
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as fh:
+                entry = json.load(fh)
+        except (IOError, ValueError):
+            return None
+        if not isfile(body_path) or entry.get('url') != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        """
+        Check if a cached response can be used without revalidation
+        :param entry: dict: The metadata as returned by get()
+        :return: bool: True if the entry is younger than the TTL
+        """
+        return time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def validators(entry):
+        """
+        Get the conditional request headers for a cached response
+        :param entry: dict: The metadata as returned by get(), may be None
+        :return: dict: The If-None-Match / If-Modified-Since headers
+        """
+        headers = {}
+        if not entry:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, url):
+        """
+        Read a cached response body and mark it as recently used
+        :param url: str: The URL of the response
+        :return: bytes: The body or None if the URL is not cached
+        """
+        chunks = self.iter_body(url, chunk_size=-1)
+        return b''.join(chunks) if chunks is not None else None
+
+    def iter_body(self, url, chunk_size):
+        """
+        Read a cached response body in chunks and mark it as recently used
+        :param url: str: The URL of the response
+        :param chunk_size: int: The size of the chunks to read, -1 reads the whole body at once
+        :return: generator: The chunks of the body or None if the URL is not cached
+        """
+        _, body_path = self._paths(url)
+        try:
+            fh = open(body_path, 'rb')
+        except IOError:
+            return None
+        os.utime(body_path)
+        return self._read_chunks(fh, chunk_size)
+
+    @staticmethod
+    def _read_chunks(fh, chunk_size):
+        with fh:
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def store(self, url, body, headers):
+        """
+        Store a response body with its validators
+        :param url: str: The URL of the response
+        :param body: bytes: The response body
+        :param headers: dict: The response headers
+        """
+        writer = self.open_writer(url, headers)
+        writer.write(body)
+        writer.commit()
+
+    def open_writer(self, url, headers):
+        """
+        Store a response body while it is being downloaded
+        The entry only becomes visible when the writer is committed
+        :param url: str: The URL of the response
+        :param headers: dict: The response headers
+        :return: CacheWriter: The writer to write the body chunks to
+        """
+        return CacheWriter(self, url, headers)
+
+    def refresh(self, url, headers):
+        """
+        Mark a cached response as revalidated (after a 304 Not Modified)
+        :param url: str: The URL of the response
+        :param headers: dict: The headers of the 304 response, validators in it replace the stored ones
+        """
+        meta_path, body_path = self._paths(url)
+        entry = self.get(url) or {}
+        headers = {
+            'ETag': headers.get('ETag') or entry.get('etag'),
+            'Last-Modified': headers.get('Last-Modified') or entry.get('last_modified'),
+        }
+        self._write_meta(meta_path, url, getsize(body_path), headers)
+
+    @staticmethod
+    def _write_meta(meta_path, url, size, headers):
+        entry = {
+            'url': url,
+            'size': size,
+            'stored_at': time(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        write_file_atomic(meta_path, json.dumps(entry), mode='w')
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size
+        """
+        bodies = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.body'):
+                continue
+            try:
+                stat = os.stat(join(self.directory, name))
+            except OSError:
+                # Removed by a concurrent eviction
+                continue
+            bodies.append((stat.st_mtime, stat.st_size, name[:-len('.body')]))
+        total_size = sum(size for _, size, _ in bodies)
+        for _, size, key in sorted(bodies):
+            if total_size <= self.max_size:
+                break
+            for extension in ('.meta', '.body'):
+                try:
+                    os.remove(join(self.directory, key + extension))
+                except OSError:
+                    pass
+            total_size -= size
+
+
+class CacheWriter:
+    """
+    Write a response body to a HTTPCache in chunks
+    """
+
+    def __init__(self, cache, url, headers):
+        """
+        :param cache: HTTPCache: The cache to store the response in
+        :param url: str: The URL of the response
+        :param headers: dict: The response headers
+        """
+        self.cache = cache
+        self.url = url
+        self.headers = headers
+        self.size = 0
+        fd, self._tmp_path = mkstemp(dir=cache.directory, prefix='.tmp-')
+        self._fh = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._fh.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """
+        Move the written body in place and store its validators
+        """
+        meta_path, body_path = self.cache._paths(self.url)
+        self._fh.close()
+        os.replace(self._tmp_path, body_path)
+        self.cache._write_meta(meta_path, self.url, self.size, self.headers)
+        self.cache.evict()
+
+    def abort(self):
+        """
+        Throw away the written body, the cache keeps its previous entry
+        """
+        self._fh.close()
+        if isfile(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def content_digest():
+    """
+    :return: hashlib.blake2b: A new digest for the content of a page
+    """
+    return blake2b(digest_size=EXTRACTION_DIGEST_SIZE)
+
+
+def diff_lists(old, new):
+    """
+    Compare two lists of extracted texts
+    :param old: list: The texts before
+    :param new: list: The texts after
+    :return: Changes: The added and removed texts, in list order
+    """
+    old_set, new_set = set(old), set(new)
+    return Changes([text for text in new if text not in old_set], [text for text in old if text not in new_set])
+
+
+class ExtractionCache:
+    """
+    Cache of the elements extracted from a page, stored with the digest of the page they came from
+    A page with the same digest as last time does not have to be parsed again
+    Entries are kept in memory and, when a directory is given, on disk for the next run
+    """
+
+    def __init__(self, directory=None):
+        """
+        :param directory: str: The directory to store extractions in (created when not present), None keeps them
+                               in memory only
+        """
+        self.directory = directory
+        self._entries = {}
+        self._lock = Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return join(self.directory, '{}.json'.format(sha256(key.encode('utf-8')).hexdigest()))
+
+    def get(self, key):
+        """
+        :param key: str: What was extracted from which page
+        :return: dict: {'digest': str, 'elements': list} or None if nothing was stored under <key>
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None or not self.directory:
+            return entry
+        try:
+            with open(self._path(key), 'r') as fh:
+                entry = json.load(fh)
+        except (IOError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        entry['elements'] = [(attrs, text) for attrs, text in entry['elements']]
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def store(self, key, digest, elements):
+        """
+        :param key: str: What was extracted from which page
+        :param digest: str: The hex digest of the page
+        :param elements: list: (dict: attributes, str: text) of the extracted elements
+        """
+        entry = {'key': key, 'digest': digest, 'elements': elements, 'stored_at': time()}
+        with self._lock:
+            self._entries[key] = entry
+        if self.directory:
+            write_file_atomic(self._path(key), json.dumps(entry), mode='w')
@@ -0,0 +1,220 @@
+import codecs
+from html.parser import HTMLParser
+from time import monotonic
+
+from cleaning_schedule.utils.metrics import metrics
+
+# Elements without an end tag, these can never contain text
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+# Elements that start on a new line in plain text
+BLOCK_ELEMENTS = {
+    'blockquote', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'ol', 'p', 'table', 'tr', 'ul'
+}
+# Elements of which the text is not shown
+HIDDEN_ELEMENTS = {'head', 'script', 'style', 'title'}
+
+
+class ElementExtractor(HTMLParser):
+    """
+    Incrementally extract the text of matching elements from HTML
+    The page can be fed in chunks as they arrive, only the matching elements are kept in memory
+    Gives the same text as BeautifulSoup(page, 'html.parser').find_all(tag, **attrs)
+    """
+
+    def __init__(self, tag, attrs=None, encoding='utf-8'):
+        """
+        :param tag: str: The element to search for
+        :param attrs: dict: Attribute filters, True only requires the attribute to be present,
+                            a callable is called with the attribute value and
+                            a str should equal the attribute value (or one of the classes for class)
+        :param encoding: str: The encoding to decode fed bytes with
+        """
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.attrs = {('class' if key == 'class_' else key): value for key, value in (attrs or {}).items()}
+        self.elements = []
+        self.size = 0
+        self._matched = 0
+        self._open_elements = []
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    def feed(self, data):
+        """
+        Feed a chunk of the page to the parser
+        :param data: bytes or str: The chunk
+        """
+        self.size += len(data)
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        super().feed(data)
+
+    def close(self):
+        """
+        Finish parsing, elements that are still open at the end of the page are closed
+        :return: list: (dict: attributes, str: text) of all matching elements in document order
+        """
+        super().feed(self._decoder.decode(b'', final=True))
+        super().close()
+        while self._open_elements:
+            self._finish_element()
+        self.elements.sort(key=lambda element: element[0])
+        return [(attrs, text) for _, attrs, text in self.elements]
+
+    def _matches(self, attrs):
+        for key, expected in self.attrs.items():
+            if key not in attrs:
+                return False
+            value = attrs[key] or ''
+            if expected is True:
+                continue
+            elif callable(expected):
+                if not expected(value):
+                    return False
+            elif key == 'class':
+                if expected != value and expected not in value.split():
+                    return False
+            elif expected != value:
+                return False
+        return True
+
+    def handle_starttag(self, tag, attrs):
+        if tag != self.tag:
+            return
+        for element in self._open_elements:
+            element['depth'] += 1
+        attrs = dict(attrs)
+        if not self._matches(attrs):
+            return
+        # Remember the position in the document, nested matches finish before their parents
+        position = self._matched
+        self._matched += 1
+        if tag in VOID_ELEMENTS:
+            self.elements.append((position, attrs, ''))
+        else:
+            self._open_elements.append({'position': position, 'depth': 1, 'attrs': attrs, 'text': []})
+
+    def handle_endtag(self, tag):
+        if tag != self.tag:
+            return
+        for element in self._open_elements:
+            element['depth'] -= 1
+        while self._open_elements and self._open_elements[-1]['depth'] <= 0:
+            self._finish_element()
+
+    def handle_data(self, data):
+        for element in self._open_elements:
+            element['text'].append(data)
+
+    def _finish_element(self):
+        element = self._open_elements.pop()
+        self.elements.append((element['position'], element['attrs'], ''.join(element['text'])))
+
+
+class TextExtractor(HTMLParser):
+    """
+    Incrementally convert HTML to readable plain text
+    Block elements start on a new line, list items get a bullet and links are followed by their URL
+    """
+
+    def __init__(self, encoding='utf-8'):
+        """
+        :param encoding: str: The encoding to decode fed bytes with
+        """
+        super().__init__(convert_charrefs=True)
+        self.lines = []
+        self._line = []
+        self._hidden = 0
+        self._links = []
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+
+    def feed(self, data):
+        """
+        Feed a chunk of the HTML to the parser
+        :param data: bytes or str: The chunk
+        """
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        super().feed(data)
+
+    def close(self):
+        """
+        Finish parsing
+        :return: str: The text, without empty lines at the start and end and without repeated empty lines
+        """
+        super().feed(self._decoder.decode(b'', final=True))
+        super().close()
+        self._break()
+        text = '\n'.join(self.lines).strip('\n')
+        while '\n\n\n' in text:
+            text = text.replace('\n\n\n', '\n\n')
+        return text + '\n' if text else ''
+
+    def _break(self, paragraph=False):
+        line = ' '.join(''.join(self._line).split())
+        self._line = []
+        if line:
+            self.lines.append(line)
+        if paragraph and self.lines and self.lines[-1]:
+            self.lines.append('')
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_ELEMENTS:
+            self._hidden += 1
+        elif tag == 'br':
+            self._break()
+        elif tag in BLOCK_ELEMENTS:
+            self._break(paragraph=tag == 'p')
+            if tag == 'li':
+                self._line.append('* ')
+        elif tag == 'a':
+            self._links.append(dict(attrs).get('href'))
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_ELEMENTS:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in BLOCK_ELEMENTS:
+            self._break(paragraph=tag in ('p', 'ul', 'ol'))
+        elif tag == 'a' and self._links:
+            href = self._links.pop()
+            if href and not href.startswith('#'):
+                self._line.append(' ({})'.format(href))
+
+    def handle_data(self, data):
+        if not self._hidden:
+            self._line.append(data)
+
+
+def html_to_text(html):
+    """
+    :param html: bytes or str: The HTML, bytes should be UTF-8 encoded
+    :return: str: The HTML as plain text, see TextExtractor
+    """
+    extractor = TextExtractor()
+    extractor.feed(html)
+    return extractor.close()
+
+
+def extract_elements(chunks, tag, attrs=None):
+    """
+    Extract the text of all matching elements from a page
+    :param chunks: iterable: The page as chunks of bytes or str
+    :param tag: str: The element to search for
+    :param attrs: dict: Attribute filters, see ElementExtractor
+    :return: tuple: (list: (dict: attributes, str: text) of the matching elements, int: amount of data parsed)
+    """
+    extractor = ElementExtractor(tag, attrs)
+    # Only the parsing is timed, not the waiting for the next chunk
+    parse_time = 0.0
+    try:
+        for chunk in chunks:
+            started = monotonic()
+            extractor.feed(chunk)
+            parse_time += monotonic() - started
+        started = monotonic()
+        elements = extractor.close()
+        parse_time += monotonic() - started
+    finally:
+        metrics.record('parse', parse_time)
+    return elements, extractor.size
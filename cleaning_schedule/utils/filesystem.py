@@ -1,3 +1,7 @@
+import os
+from os.path import isfile
+
+
 def get_lines_from_file(path):
     with open(path, 'r') as fh:
         return fh.read().splitlines()
@@ -6,8 +10,30 @@ def get_lines_from_file(path):
 def write_lines_to_file(path, lines):
     """
     Takes a list of strings and writes them to <path> with a \n after each element
+    The file is replaced atomically, a crash while writing leaves the old file intact
     :param path: str: The filepath to write to
     :param lines: list: The list of strings to write
     """
-    with open(path, 'w') as fh:
-        fh.write('\n'.join(lines))
+    write_file_atomic(path, '\n'.join(lines), mode='w')
+
+
+def write_file_atomic(path, data, mode='wb'):
+    """
+    Write data to a temporary file next to <path> and move it in place
+    Readers will either see the old or the new contents, never a partial write
+    :param path: str: The filepath to write to
+    :param data: bytes or str: The data to write
+    :param mode: str: The mode to open the temporary file with
+    """
+    # tempfile pulls in random and shutil, only load it when writing
+    from tempfile import mkstemp
+
+    fd, tmp_path = mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, mode) as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,17 +1,164 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+from threading import Lock
 
+from cleaning_schedule.settings.base import LOG_FORMAT, LOG_TIME_FORMAT, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT
 
-def configure_logging(name, level=logging.INFO):
-    log = logging.getLogger(name)
-    log.setLevel(level)
-    log.addHandler(create_stream_handler())
-    return log
+"""
+Logging goes through a queue: loggers only put records on the queue, a listener thread formats
+and writes them to the sinks (stdout and optionally a rotating file).
+All loggers of the cleaning_schedule package share one queue handler on the package logger.
+"""
+
+PACKAGE_LOGGER = 'cleaning_schedule'
+
+_queue = queue.Queue(-1)
+_listener = None
+_lock = Lock()
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Put records on the queue with only their message merged
+    Merging keeps later changes to the arguments out of the message, the rest of the formatting
+    (time, level, exceptions) is left to the sinks on the listener thread
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
 
-def create_stream_handler(log_format='[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s', time_format='%Y-%m-%d %H:%M:%S'):
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as JSON lines
+    """
+
+    def format(self, record):
+        line = {
+            'time': self.formatTime(record, self.datefmt),
+            'name': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if record.exc_text:
+            line['exception'] = record.exc_text
+        return json.dumps(line)
+
+
+_handler = LogQueueHandler(_queue)
+
+
+def create_formatter(json_lines=False, log_format=LOG_FORMAT, time_format=LOG_TIME_FORMAT):
+    """
+    :param json_lines: bool: Format records as JSON lines
+    :param log_format: str: The format of plain text lines
+    :param time_format: str: The format of the time
+    :return: logging.Formatter: The formatter
+    """
+    if json_lines:
+        return JSONFormatter(datefmt=time_format)
+    return logging.Formatter(log_format, time_format)
+
+
+def create_stream_handler(log_format=LOG_FORMAT, time_format=LOG_TIME_FORMAT, json_lines=False):
     stream = sys.stdout
     stream_handler = logging.StreamHandler(stream)
     stream_handler.setLevel(logging.DEBUG)
-    stream_handler.setFormatter(logging.Formatter(log_format, time_format))
+    stream_handler.setFormatter(create_formatter(json_lines, log_format, time_format))
     return stream_handler
+
+
+def create_file_handler(path, json_lines=False, max_bytes=LOG_FILE_MAX_BYTES, backup_count=LOG_FILE_BACKUP_COUNT):
+    """
+    :param path: str: The log file, rotated to <path>.1 ... <path>.<backup_count> when full
+    :param json_lines: bool: Format records as JSON lines
+    :param max_bytes: int: Size in bytes before the file is rotated
+    :param backup_count: int: The amount of rotated files to keep
+    :return: logging.handlers.RotatingFileHandler: The handler
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(create_formatter(json_lines))
+    return file_handler
+
+
+def _start_listener(handlers):
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(
+        _queue, *(handlers or (create_stream_handler(),)), respect_handler_level=True
+    )
+    _listener.start()
+
+
+def start_listener(*handlers):
+    """
+    (Re)start the listener thread that writes the queued records to <handlers>
+    :param handlers: logging.Handler: The sinks, stdout if none are given
+    """
+    with _lock:
+        _start_listener(handlers)
+
+
+def stop_listener():
+    """
+    Write all queued records and stop the listener thread
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def configure_sinks(json_lines=False, log_file=None, stdout=True):
+    """
+    Choose where the log records go
+    :param json_lines: bool: Write JSON lines instead of plain text
+    :param log_file: str: Also write to this rotating log file
+    :param stdout: bool: Write to stdout
+    """
+    handlers = [create_stream_handler(json_lines=json_lines)] if stdout else []
+    if log_file:
+        handlers.append(create_file_handler(log_file, json_lines=json_lines))
+    start_listener(*(handlers or [logging.NullHandler()]))
+
+
+def configure_logging(name, level=logging.INFO):
+    """
+    Get a logger that writes through the log queue, safe to call any number of times for the same name
+    Loggers of the cleaning_schedule package propagate to the package logger, which holds the only queue handler
+    :param name: str: The name of the logger
+    :param level: int: The level of the logger
+    :return: logging.Logger: The logger
+    """
+    log = logging.getLogger(name)
+    log.setLevel(level)
+    in_package = name == PACKAGE_LOGGER or name.startswith(PACKAGE_LOGGER + '.')
+    owner = logging.getLogger(PACKAGE_LOGGER) if in_package else log
+    with _lock:
+        if _handler not in owner.handlers:
+            owner.addHandler(_handler)
+        if _listener is None:
+            _start_listener(())
+    return log
+
+
+atexit.register(stop_listener)
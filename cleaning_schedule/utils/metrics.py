@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic, time
+
+from cleaning_schedule.utils.filesystem import write_file_atomic
+
+METRIC_PREFIX = 'cleaning_schedule'
+# Counters kept by the code, exported even when they stayed 0 so alerts do not see missing series
+COUNTER_HELP = {
+    'http_requests': 'Requests made to os3.nl',
+    'retries': 'Attempts that were retried by a retry policy',
+    'failed_attempts': 'Attempts that failed, retried or not',
+    'circuit_rejections': 'Calls not made because the circuit breaker was open',
+    'http_bytes_downloaded': 'Bytes downloaded from os3.nl',
+    'http_cache_hits': 'Pages served from the cache without asking os3.nl',
+    'http_cache_revalidations': 'Cached pages os3.nl confirmed to be unchanged',
+    'http_cache_misses': 'Pages not in the cache or changed',
+    'extraction_cache_hits': 'Pages not parsed because they did not change since they were last read',
+    'emails_sent': 'Emails sent',
+    'emails_failed': 'Emails that could not be sent',
+}
+
+
+def prometheus_label(value):
+    """
+    :param value: str: A label value
+    :return: str: The value escaped for the Prometheus text format
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_format(value):
+    """
+    :param value: int or float: A metric value
+    :return: str: The value as written in the Prometheus text format
+    """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Timings of the stages of a run and counters of what happened during the run
+    Spans use a monotonic clock, a stage that runs more than once adds up its time
+    Safe to use from multiple threads
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all spans and counters
+        """
+        with self._lock:
+            self.started = time()
+            self._started_monotonic = monotonic()
+            self._durations = {}
+            self._calls = {}
+            self._counters = dict.fromkeys(COUNTER_HELP, 0)
+
+    def record(self, stage, seconds):
+        """
+        Add the time spent in a stage
+        :param stage: str: The name of the stage
+        :param seconds: float: The time spent
+        """
+        with self._lock:
+            self._durations[stage] = self._durations.get(stage, 0.0) + seconds
+            self._calls[stage] = self._calls.get(stage, 0) + 1
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Time the code in the with block as <stage>, also when it raises
+        :param stage: str: The name of the stage
+        """
+        started = monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, monotonic() - started)
+
+    def increment(self, counter, amount=1):
+        """
+        :param counter: str: The name of the counter
+        :param amount: int: The amount to add
+        """
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def duration(self, stage):
+        """
+        :param stage: str: The name of the stage
+        :return: float: Seconds spent in the stage
+        """
+        with self._lock:
+            return self._durations.get(stage, 0.0)
+
+    def count(self, counter):
+        """
+        :param counter: str: The name of the counter
+        :return: int: The value of the counter
+        """
+        with self._lock:
+            return self._counters.get(counter, 0)
+
+    def to_dict(self, success=None):
+        """
+        :param success: bool: If the run succeeded, None if unknown
+        :return: dict: All spans and counters
+        """
+        with self._lock:
+            return {
+                'started': self.started,
+                'duration': monotonic() - self._started_monotonic,
+                'success': success,
+                'stages': {
+                    stage: {'seconds': seconds, 'calls': self._calls[stage]}
+                    for stage, seconds in sorted(self._durations.items())
+                },
+                'counters': dict(sorted(self._counters.items())),
+            }
+
+    def to_json(self, success=None):
+        """
+        :param success: bool: If the run succeeded, None if unknown
+        :return: str: The metrics as JSON
+        """
+        import json
+
+        return json.dumps(self.to_dict(success), indent=2, sort_keys=True) + '\n'
+
+    def to_prometheus(self, success=None):
+        """
+        Format the metrics for the node_exporter textfile collector
+        :param success: bool: If the run succeeded, None if unknown
+        :return: str: The metrics in the Prometheus text format
+        """
+        data = self.to_dict(success)
+        lines = []
+
+        def add(name, kind, help_text, samples):
+            name = '{}_{}'.format(METRIC_PREFIX, name)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in samples:
+                lines.append('{}{} {}'.format(name, labels, prometheus_format(value)))
+
+        add('last_run_timestamp_seconds', 'gauge', 'Start time of the last run', [('', data['started'])])
+        add('last_run_duration_seconds', 'gauge', 'Seconds the last run took', [('', data['duration'])])
+        if success is not None:
+            add('last_run_success', 'gauge', '1 if the last run succeeded', [('', int(success))])
+        stages = sorted(data['stages'].items())
+        add('stage_duration_seconds', 'gauge', 'Seconds spent in each stage of the last run',
+            [('{{stage="{}"}}'.format(prometheus_label(stage)), values['seconds']) for stage, values in stages])
+        add('stage_calls', 'gauge', 'Times each stage ran in the last run',
+            [('{{stage="{}"}}'.format(prometheus_label(stage)), values['calls']) for stage, values in stages])
+        for counter, value in data['counters'].items():
+            add(counter, 'gauge', COUNTER_HELP.get(counter, counter.replace('_', ' ').capitalize()), [('', value)])
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, success=None):
+        """
+        Write the metrics to a file, atomically so a collector never reads half a file
+        Files ending in .prom are written in the Prometheus text format, all others as JSON
+        :param path: str: The file to write to
+        :param success: bool: If the run succeeded, None if unknown
+        """
+        if path.endswith('.prom'):
+            data = self.to_prometheus(success)
+        else:
+            data = self.to_json(success)
+        write_file_atomic(path, data, mode='w')
+
+
+# The metrics of this process, shared by every module
+metrics = Metrics()
@@ -0,0 +1,200 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_FUZZY = 'fuzzy'
+MATCH_MODES = (MATCH_EXACT, MATCH_PREFIX, MATCH_FUZZY)
+# Minimum similarity (0 - 1) for a fuzzy match
+FUZZY_CUTOFF = 0.85
+# Bytes an encoded name can not be normalised without decoding: non-ASCII and the ASCII separators str.split()
+# splits on but bytes.split() does not
+_NEEDS_DECODING = re.compile(b'[\x1c-\x1f\x80-\xff]')
+
+
+def normalise_name(name):
+    """
+    Normalise a name for comparison: strip accents, casefold and collapse whitespace
+    :param name: str: The name
+    :return: str: The normalised name
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    without_accents = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(without_accents.casefold().split())
+
+
+def normalise_encoded_name(data):
+    """
+    Normalise a UTF-8 encoded name, see normalise_name()
+    ASCII names are folded as bytes, only other names are decoded and normalised
+    :param data: bytes: The encoded name
+    :return: str: The normalised name
+    """
+    if _NEEDS_DECODING.search(data):
+        return normalise_name(bytes(data).decode('utf-8'))
+    return b' '.join(data.lower().split()).decode('ascii')
+
+
+class NameIndex:
+    """
+    Index of names on their normalised form
+    Built once, after which every lookup is a dict lookup (exact), a binary search (prefix)
+    or a similarity search (fuzzy)
+    """
+
+    def __init__(self, names, values=None):
+        """
+        :param names: iterable: The names to index
+        :param values: iterable: What to index every name under (like student IDs), returned by lookup() and
+                       resolve() instead of the names, None to return the names
+        """
+        self._index = {}
+        pairs = ((name, name) for name in names) if values is None else zip(names, values)
+        for name, value in pairs:
+            self._index.setdefault(normalise_name(name), []).append(value)
+        self._sorted_keys = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, name, match=MATCH_EXACT):
+        """
+        Find the indexed names matching a name, an exact match always wins
+        :param name: str: The name to look for
+        :param match: str: exact, prefix (the indexed name starts with <name>) or fuzzy (similar names)
+        :return: list: The matching indexed names (or values), multiple when the name is ambiguous
+        """
+        key = normalise_name(name)
+        if key in self._index or not key:
+            return list(self._index.get(key, []))
+        if match == MATCH_PREFIX:
+            keys = self._prefix_keys(key)
+        elif match == MATCH_FUZZY:
+            from difflib import get_close_matches
+
+            keys = get_close_matches(key, self._index.keys(), n=1, cutoff=FUZZY_CUTOFF)
+        else:
+            keys = []
+        return [indexed for key in keys for indexed in self._index[key]]
+
+    def _prefix_keys(self, prefix):
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._index)
+        keys = []
+        for key in self._sorted_keys[bisect_left(self._sorted_keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+        return keys
+
+    def resolve(self, names, match=MATCH_EXACT):
+        """
+        Resolve a list of names to the indexed names
+        :param names: iterable: The names to resolve
+        :param match: str: How to match, see lookup()
+        :return: tuple: (set: matched indexed names (or values), list: names without a match,
+                        dict: name -> ambiguous matches)
+        """
+        matched = set()
+        unmatched = []
+        ambiguous = {}
+        for name in names:
+            found = self.lookup(name, match)
+            if not found:
+                unmatched.append(name)
+            elif len(found) > 1 and match != MATCH_EXACT:
+                ambiguous[name] = found
+            else:
+                matched.update(found)
+        return matched, unmatched, ambiguous
+
+
+class NameMatcher:
+    """
+    Match a few names against many names in one pass, the many names are looked at one by one and not kept
+    Only the names to match are indexed, memory use grows with the matches instead of with the scanned names
+    Gives the same results as NameIndex(<scanned names>).resolve(<names>)
+    """
+
+    def __init__(self, names, match=MATCH_EXACT):
+        """
+        :param names: iterable: The names to match
+        :param match: str: How to match, see NameIndex.lookup()
+        """
+        self.match = match
+        self._names = [(name, normalise_name(name)) for name in names]
+        self._keys = {key for _, key in self._names}
+        self._exact = {}
+        # Prefix: key -> values of the names starting with the key
+        self._prefixed = {}
+        self._prefix_lengths = sorted({len(key) for key in self._keys if key})
+        # Fuzzy: key -> [score, scanned key, values] of the most similar name
+        self._closest = {}
+        self._matchers = {}
+        if match == MATCH_FUZZY:
+            from difflib import SequenceMatcher
+
+            for key in self._keys:
+                self._matchers[key] = SequenceMatcher()
+                self._matchers[key].set_seq2(key)
+
+    def add(self, key, value):
+        """
+        Compare one scanned name to the names to match
+        :param key: str: The normalised scanned name, see normalise_name()
+        :param value: What to return for a match (like the student ID of the name)
+        """
+        if key in self._keys:
+            self._exact.setdefault(key, []).append(value)
+        if self.match == MATCH_PREFIX:
+            for length in self._prefix_lengths:
+                if length > len(key):
+                    break
+                if key[:length] in self._keys:
+                    self._prefixed.setdefault(key[:length], []).append(value)
+        elif self.match == MATCH_FUZZY:
+            self._add_fuzzy(key, value)
+
+    def _add_fuzzy(self, key, value):
+        # Like difflib.get_close_matches(n=1): the best score wins, ties go to the largest scanned name
+        for wanted, matcher in self._matchers.items():
+            if not wanted:
+                continue
+            closest = self._closest.get(wanted)
+            if closest is not None and closest[1] == key:
+                closest[2].append(value)
+                continue
+            matcher.set_seq1(key)
+            if matcher.real_quick_ratio() < FUZZY_CUTOFF or matcher.quick_ratio() < FUZZY_CUTOFF:
+                continue
+            score = matcher.ratio()
+            if score >= FUZZY_CUTOFF and (closest is None or (score, key) > (closest[0], closest[1])):
+                self._closest[wanted] = [score, key, [value]]
+
+    def _found(self, key):
+        if key in self._exact or not key:
+            return self._exact.get(key, [])
+        if self.match == MATCH_PREFIX:
+            return self._prefixed.get(key, [])
+        if self.match == MATCH_FUZZY and key in self._closest:
+            return self._closest[key][2]
+        return []
+
+    def resolve(self):
+        """
+        Resolve the names to match to the scanned names, after every scanned name was added
+        :return: tuple: See NameIndex.resolve()
+        """
+        matched = set()
+        unmatched = []
+        ambiguous = {}
+        for name, key in self._names:
+            found = self._found(key)
+            if not found:
+                unmatched.append(name)
+            elif len(found) > 1 and self.match != MATCH_EXACT:
+                ambiguous[name] = list(found)
+            else:
+                matched.update(found)
+        return matched, unmatched, ambiguous
@@ -1,26 +1,144 @@
 import requests
 import requests.exceptions
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.settings.base import HTTP_CHUNK_SIZE
 
-def get_webpage_with_auth(url, username, password, logger):
+
+def create_http_session(username, password, pool_size=4):
+    """
+    Create a keep-alive HTTP session with basic auth and a connection pool
+    Connections in the pool are reused for every request made through the session
+    :param username: str: The username for basic auth
+    :param password: str: The password for basic auth
+    :param pool_size: int: The amount of connections to keep open per host
+    :return: requests.Session: The session
+    """
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(username, password)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    })
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class IncompleteReadError(IOError):
+    """
+    Raised when a webpage could not be read completely
+    """
+
+
+def get_webpage_with_auth(url, username, password, logger, session=None, timeout=None, cache=None):
     """
     HTTP GET's a URL with basic auth
     :param url: str: The URL to GET
     :param username: str: The username for basic auth
     :param password: str: The password for basic auth
     :param logger: logger obj: The log errors with
-    :return: str: The webpage or empty string on error
+    :param session: requests.Session: The session to reuse connections from, if None a new connection is made
+    :param timeout: tuple: (connect timeout, read timeout) in seconds, None waits forever
+    :param cache: HTTPCache: Serve and revalidate the response from this cache, None disables caching
+    :return: str: The webpage or None on error (including a non 2xx response)
     """
+    chunks = open_webpage_with_auth(url, username, password, logger, session=session, timeout=timeout, cache=cache)
+    if chunks is None:
+        return None
     try:
-        response = requests.get(url, auth=HTTPBasicAuth(username, password))
-        return response.content
+        return b''.join(chunks)
+    except IncompleteReadError:
+        return None
+
+
+def open_webpage_with_auth(url, username, password, logger, session=None, timeout=None, cache=None,
+                           chunk_size=HTTP_CHUNK_SIZE):
+    """
+    HTTP GET's a URL with basic auth and stream the body
+    The returned generator raises IncompleteReadError when the connection fails halfway
+    :param url: str: The URL to GET
+    :param username: str: The username for basic auth
+    :param password: str: The password for basic auth
+    :param logger: logger obj: The log errors with
+    :param session: requests.Session: The session to reuse connections from, if None a new connection is made
+    :param timeout: tuple: (connect timeout, read timeout) in seconds, None waits forever
+    :param cache: HTTPCache: Serve and revalidate the response from this cache, None disables caching
+    :param chunk_size: int: The size of the chunks to read
+    :return: generator: The chunks of the webpage or None on error, any response other than 2xx
+                        (or a 304 of a cached page) is an error
+    """
+    entry = None
+    if cache is not None:
+        entry = cache.get(url)
+        if entry and cache.is_fresh(entry):
+            logger.debug('Serving %s from cache', url)
+            metrics.increment('http_cache_hits')
+            return cache.iter_body(url, chunk_size)
+    headers = cache.validators(entry) if cache is not None else {}
+    metrics.increment('http_requests')
+    try:
+        if session is None:
+            response = requests.get(url, auth=HTTPBasicAuth(username, password), timeout=timeout, headers=headers,
+                                    stream=True)
+        else:
+            response = session.get(url, timeout=timeout, headers=headers, stream=True)
     except requests.exceptions.SSLError as e:
         logger.error('SSL error occurred while trying to retrieve {}\nGot error: {}'.format(url, e))
+        return None
+    except requests.exceptions.Timeout as e:
+        logger.error('Timeout occurred while trying to retrieve {}\nGot error: {}'.format(url, e))
+        return None
     except requests.exceptions.BaseHTTPError as e:
         logger.error('HTTP error occurred while trying to retrieve {}\nGot error: {}'.format(url, e))
+        return None
     except Exception as e:
         logger.error('Unknown error occurred while trying to retrieve {}\nError msg: {}'.format(url, e))
+        return None
+
+    if cache is not None and response.status_code == 304 and entry:
+        logger.debug('%s not modified, serving from cache', url)
+        response.close()
+        metrics.increment('http_cache_revalidations')
+        cache.refresh(url, response.headers)
+        return cache.iter_body(url, chunk_size)
+    if not 200 <= response.status_code < 300:
+        logger.error('Got HTTP status {} {} while trying to retrieve {}'.format(
+            response.status_code, response.reason, url))
+        response.close()
+        return None
+    if cache is not None:
+        metrics.increment('http_cache_misses')
+    return _stream_response(url, response, logger, chunk_size, cache)
+
+
+def _stream_response(url, response, logger, chunk_size, cache=None):
+    """
+    Yield the body of a streamed response, a successful response is written to the cache as well
+    """
+    writer = cache.open_writer(url, response.headers) if cache is not None and response.status_code == 200 else None
+    completed = False
+    try:
+        for chunk in response.iter_content(chunk_size):
+            metrics.increment('http_bytes_downloaded', len(chunk))
+            if writer is not None:
+                writer.write(chunk)
+            yield chunk
+        completed = True
+    except Exception as e:
+        logger.error('Error occurred while reading {}\nGot error: {}'.format(url, e))
+        raise IncompleteReadError('Could not read {} completely: {}'.format(url, e))
+    finally:
+        response.close()
+        # Only complete bodies end up in the cache
+        if writer is not None:
+            if completed:
+                writer.commit()
+            else:
+                writer.abort()
 
 
 def https_in_url(url):
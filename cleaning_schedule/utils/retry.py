@@ -0,0 +1,177 @@
+import random
+from threading import Lock
+from time import monotonic, sleep
+
+from cleaning_schedule.utils.logger import configure_logging
+from cleaning_schedule.utils.metrics import metrics
+from cleaning_schedule.settings.base import MAX_WEBSITE_RETRIES, WEBSITE_RETRY_BACKOFF, WEBSITE_RETRY_MAX_BACKOFF, \
+    WEBSITE_RETRY_DEADLINE, CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_RESET_TIMEOUT
+
+logger = configure_logging(__name__)
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Stops calling a service that keeps failing
+    After <threshold> consecutive failures the circuit opens and every call fails fast.
+    After <reset_timeout> seconds one trial call is let through (half-open), its result closes or reopens the circuit
+    """
+
+    def __init__(self, threshold=CIRCUIT_BREAKER_THRESHOLD, reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT):
+        """
+        :param threshold: int: Consecutive failures before the circuit opens
+        :param reset_timeout: int: Seconds the circuit stays open
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._state = CIRCUIT_CLOSED
+        self._opened_at = None
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        """
+        :return: str: closed, open or half-open
+        """
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and monotonic() - self._opened_at >= self.reset_timeout:
+                return CIRCUIT_HALF_OPEN
+            return self._state
+
+    def retry_after(self):
+        """
+        :return: float: Seconds until the next call is allowed, 0 if calls are allowed
+        """
+        with self._lock:
+            if self._state != CIRCUIT_OPEN:
+                return 0
+            return max(0, self.reset_timeout - (monotonic() - self._opened_at))
+
+    def allow(self):
+        """
+        Check if a call may be made, when half-open only the first caller gets to try
+        :return: bool: True if the call may be made
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if self._state == CIRCUIT_OPEN and monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = CIRCUIT_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = CIRCUIT_CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self.failures >= self.threshold:
+                self._state = CIRCUIT_OPEN
+                self._opened_at = monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry a call with exponential backoff and full jitter, bounded by a total deadline and guarded by a circuit breaker
+    A call failed when it raised one of <retry_on> or returned None
+    """
+
+    def __init__(self, attempts=MAX_WEBSITE_RETRIES, backoff=WEBSITE_RETRY_BACKOFF,
+                 max_backoff=WEBSITE_RETRY_MAX_BACKOFF, deadline=WEBSITE_RETRY_DEADLINE, attempt_timeout=None,
+                 breaker=None, retry_on=(IOError,), jitter=True):
+        """
+        :param attempts: int: The maximum amount of attempts
+        :param backoff: float: Seconds to wait after the first failed attempt, doubled after every next failure
+        :param max_backoff: float: The maximum seconds to wait between attempts
+        :param deadline: float: Seconds all attempts together may take, None for no deadline
+        :param attempt_timeout: float: Seconds a single attempt may take, None to only bound it by the deadline
+        :param breaker: CircuitBreaker: The circuit breaker to use, None creates one
+        :param retry_on: tuple: The exceptions that count as a failed attempt, others are raised
+        :param jitter: bool: Wait a random time between 0 and the backoff, so concurrent runs do not retry in sync
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.retry_on = retry_on
+        self.jitter = jitter
+        self.logger = logger
+
+    def delay(self, attempt):
+        """
+        :param attempt: int: The attempt that failed, starting at 1
+        :return: float: Seconds to wait before the next attempt
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def _timeout(self, started):
+        """
+        :param started: float: monotonic() time of the first attempt
+        :return: float: The timeout of the next attempt or None for no timeout
+        """
+        timeouts = [self.attempt_timeout] if self.attempt_timeout is not None else []
+        if self.deadline is not None:
+            timeouts.append(max(0, self.deadline - (monotonic() - started)))
+        return min(timeouts) if timeouts else None
+
+    def call(self, description, func, *args, **kwargs):
+        """
+        Call func until it succeeds, the attempts run out, the deadline passes or the circuit opens
+        func is called with a timeout keyword argument: the seconds the attempt may take or None
+        :param description: str: What is called, for logging
+        :param func: callable: The function to call
+        :param args: The arguments for func
+        :param kwargs: The keyword arguments for func
+        :return: The result of func or None if all attempts failed
+        """
+        started = monotonic()
+        for attempt in range(1, self.attempts + 1):
+            if not self.breaker.allow():
+                metrics.increment('circuit_rejections')
+                self.logger.error('{} not attempted, too many failures, retrying after {:.0f}s'.format(
+                    description, self.breaker.retry_after()
+                ))
+                return None
+            if attempt > 1:
+                metrics.increment('retries')
+            attempt_started = monotonic()
+            try:
+                result = func(*args, timeout=self._timeout(started), **kwargs)
+                error = None
+            except self.retry_on as e:
+                result = None
+                error = e
+            except BaseException:
+                # Not retried, but the breaker has to hear about it or a half-open circuit never closes again
+                self.breaker.record_failure()
+                raise
+            latency = monotonic() - attempt_started
+            if result is not None:
+                self.breaker.record_success()
+                self.logger.debug('%s succeeded on attempt %d of %d in %.2fs', description, attempt, self.attempts, latency)
+                return result
+            self.breaker.record_failure()
+            metrics.increment('failed_attempts')
+            self.logger.warning('{} failed on attempt {} of {} after {:.2f}s{}'.format(
+                description, attempt, self.attempts, latency, ': {}'.format(error) if error else ''
+            ))
+            if attempt == self.attempts:
+                break
+            delay = self.delay(attempt)
+            if self.deadline is not None and monotonic() - started + delay >= self.deadline:
+                self.logger.critical('{} deadline of {}s reached, giving up'.format(description, self.deadline))
+                return None
+            sleep(delay)
+        self.logger.critical('{} max retries reached, giving up'.format(description))
+        return None
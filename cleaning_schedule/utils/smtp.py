@@ -0,0 +1,166 @@
+import smtplib
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from threading import BoundedSemaphore
+
+from cleaning_schedule.utils.logger import configure_logging
+from cleaning_schedule.settings.base import SMTP_POOL_SIZE, SMTP_TIMEOUT
+
+logger = configure_logging(__name__)
+
+
+def is_connection_error(error):
+    """
+    Check if an error means the SMTP connection can not be used anymore
+    SMTPException is an OSError as well, so only the disconnect errors of smtplib count
+    :param error: Exception: The error
+    :return: bool: True if the connection is broken
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPConnectionPool:
+    """
+    Pool of logged in SMTP connections
+    Connections are reused for every message, so STARTTLS, EHLO and LOGIN are only done once per connection
+    Idle connections are checked with a NOOP before reuse and replaced when broken
+    """
+
+    def __init__(self, host, port, user=None, password=None, size=SMTP_POOL_SIZE, starttls=True, login=True,
+                 timeout=SMTP_TIMEOUT):
+        """
+        :param host: str: The SMTP server
+        :param port: int: The SMTP port
+        :param user: str: The username to login with
+        :param password: str: The password to login with
+        :param size: int: The maximum amount of open connections
+        :param starttls: bool: Upgrade connections with STARTTLS
+        :param login: bool: Login after connecting, disable for a local stand-in server
+        :param timeout: int: Seconds to wait for the SMTP server
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.starttls = starttls
+        self.login = login
+        self.timeout = timeout
+        self.logger = logger
+        self._idle = LifoQueue()
+        self._slots = BoundedSemaphore(size)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self):
+        """
+        Open a new connection, upgrade it with STARTTLS and login
+        :return: smtplib.SMTP: The connection
+        """
+        self.logger.debug('Connecting to %s:%s', self.host, self.port)
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                if server.starttls()[0] != 220:
+                    raise smtplib.SMTPException('Unable to STARTTLS')
+                server.ehlo()
+            if self.login:
+                server.esmtp_features['auth'] = 'PLAIN LOGIN'
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    @staticmethod
+    def _is_alive(server):
+        """
+        Check if a connection is still usable
+        :param server: smtplib.SMTP: The connection
+        :return: bool: True if the server answered the NOOP
+        """
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _get_idle_connection(self):
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except Empty:
+                return None
+            if self._is_alive(server):
+                return server
+            self.logger.debug('Dropping broken idle SMTP connection')
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection from the pool, blocks when all connections are in use
+        A connection that fails during use is closed instead of returned to the pool
+        """
+        if self._closed:
+            raise smtplib.SMTPException('SMTP connection pool is closed')
+        self._slots.acquire()
+        server = None
+        try:
+            server = self._get_idle_connection() or self._connect()
+            yield server
+        except Exception as e:
+            if server is not None and is_connection_error(e):
+                server.close()
+                server = None
+            raise
+        finally:
+            if server is not None:
+                if self._closed:
+                    self._quit(server)
+                else:
+                    self._idle.put(server)
+            self._slots.release()
+
+    def send(self, sender, to_list, message):
+        """
+        Send a message over a pooled connection, reconnects once when the connection turns out to be broken
+        :param sender: str: The from address
+        :param to_list: list: All email addresses to send to
+        :param message: str or bytes: The message to send
+        :return: dict: The refused recipients, see smtplib.SMTP.sendmail
+        """
+        try:
+            with self.connection() as server:
+                return server.sendmail(sender, to_list, message)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            self.logger.warning('SMTP connection failed ({}), reconnecting'.format(e))
+        with self.connection() as server:
+            return server.sendmail(sender, to_list, message)
+
+    def close(self):
+        """
+        Quit all idle connections, connections in use are closed when they are returned
+        """
+        self._closed = True
+        while True:
+            try:
+                server = self._idle.get_nowait()
+            except Empty:
+                break
+            self._quit(server)
@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from hashlib import sha256
+from os.path import isfile, join
+from tempfile import mkstemp
+from threading import Lock
+
+from cleaning_schedule.utils.filesystem import write_file_atomic
+from cleaning_schedule.utils.networking import IncompleteReadError
+from cleaning_schedule.settings.base import HTTP_CHUNK_SIZE
+
+MANIFEST = 'manifest.json'
+SNAPSHOT_VERSION = 1
+
+
+class Snapshot:
+    """
+    A directory of recorded webpages, to replay a run without network access
+    Every page is stored gzip compressed, manifest.json maps the URLs to their files and checksums.
+    Pages are only added to the manifest once they were read completely
+    """
+
+    def __init__(self, directory, replay=False):
+        """
+        :param directory: str: The snapshot directory, created when recording
+        :param replay: bool: Only read from the snapshot, the directory must hold a snapshot
+        """
+        self.directory = directory
+        self._lock = Lock()
+        if not replay:
+            os.makedirs(directory, exist_ok=True)
+        self.manifest = self._load_manifest(replay)
+
+    def _load_manifest(self, replay=False):
+        path = join(self.directory, MANIFEST)
+        if not isfile(path):
+            if replay:
+                raise IOError('No snapshot found in {}'.format(self.directory))
+            return {'version': SNAPSHOT_VERSION, 'created_at': datetime.now().isoformat(), 'pages': {}}
+        with open(path, 'r') as fh:
+            manifest = json.load(fh)
+        if manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('{} has snapshot version {}, expected {}'.format(
+                path, manifest.get('version'), SNAPSHOT_VERSION
+            ))
+        return manifest
+
+    def _write_manifest(self):
+        write_file_atomic(join(self.directory, MANIFEST), json.dumps(self.manifest, indent=2, sort_keys=True), mode='w')
+
+    def urls(self):
+        """
+        :return: list: The recorded URLs
+        """
+        with self._lock:
+            return sorted(self.manifest['pages'])
+
+    def __contains__(self, url):
+        with self._lock:
+            return url in self.manifest['pages']
+
+    def record(self, url, chunks):
+        """
+        Pass the chunks of a page through while writing them to the snapshot
+        :param url: str: The URL of the page
+        :param chunks: iterable: The chunks of the page
+        :return: generator: The same chunks
+        """
+        name = '{}.html.gz'.format(sha256(url.encode('utf-8')).hexdigest())
+        fd, tmp_path = mkstemp(dir=self.directory, prefix='.tmp-')
+        digest = sha256()
+        size = 0
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                # mtime=0 so recording the same page twice gives the same file
+                with gzip.GzipFile(fileobj=fh, mode='wb', mtime=0) as compressed:
+                    for chunk in chunks:
+                        compressed.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                        yield chunk
+            os.replace(tmp_path, join(self.directory, name))
+            completed = True
+        finally:
+            if not completed and isfile(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self.manifest['pages'][url] = {
+                'file': name,
+                'size': size,
+                'sha256': digest.hexdigest(),
+                'recorded_at': datetime.now().isoformat(),
+            }
+            self._write_manifest()
+
+    def open(self, url, chunk_size=HTTP_CHUNK_SIZE):
+        """
+        Read a recorded page
+        The returned generator raises IncompleteReadError when the page does not match its checksum
+        :param url: str: The URL of the page
+        :param chunk_size: int: The size of the chunks to read
+        :return: generator: The chunks of the page or None if the URL was not recorded
+        """
+        with self._lock:
+            page = self.manifest['pages'].get(url)
+        if page is None or not isfile(join(self.directory, page['file'])):
+            return None
+        return self._read(url, page, chunk_size)
+
+    def _read(self, url, page, chunk_size):
+        digest = sha256()
+        try:
+            with gzip.open(join(self.directory, page['file']), 'rb') as fh:
+                for chunk in iter(lambda: fh.read(chunk_size), b''):
+                    digest.update(chunk)
+                    yield chunk
+        except (IOError, EOFError) as e:
+            raise IncompleteReadError('Could not read the snapshot of {}: {}'.format(url, e))
+        if digest.hexdigest() != page['sha256']:
+            raise IncompleteReadError('The snapshot of {} does not match its checksum'.format(url))
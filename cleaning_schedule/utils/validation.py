@@ -0,0 +1,16 @@
+def verify_email_addresses(addresses, logger):
+    """
+    Verify email addresses
+    TODO: Make this a regex, current method just tries to parse and find a @ sign
+    :param addresses: list: The emails to verify
+    :param logger: logger obj: The logger to warn about invalid emails with
+    :return: bool: True if all emails are valid, False if one is not a valid email
+    """
+    # email.utils is slow to import, only load it when there are addresses to check
+    from email.utils import parseaddr
+
+    for email in addresses:
+        if '@' not in parseaddr(email)[1]:
+            logger.warning('{} is not a valid email'.format(addresses))
+            return False
+    return True
@@ -0,0 +1,75 @@
+import os
+
+import setuptools
+from setuptools.command.build_py import build_py
+
+
+class PrecompileTemplates(setuptools.Command):
+    """
+    Compile the email templates into the jinja bytecode cache
+    Runs as part of build_py to ship the compiled templates with the package,
+    or on its own from the root of the repo to fill the cache of the checkout: python setup.py precompile_templates
+    """
+    description = 'precompile the jinja email templates'
+    user_options = [
+        ('build-lib=', 'b', 'build directory to compile the templates into (default: the source tree)'),
+    ]
+
+    def initialize_options(self):
+        self.build_lib = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        from cleaning_schedule.mail import precompile_templates
+        from cleaning_schedule.settings.base import TEMPLATE_CACHE_DIR
+        directory = None
+        if self.build_lib is not None:
+            directory = os.path.join(
+                self.build_lib, 'cleaning_schedule', 'templates', os.path.basename(TEMPLATE_CACHE_DIR)
+            )
+        for template in precompile_templates(directory):
+            self.announce('compiled template {}'.format(template), level=2)
+
+
+class BuildPy(build_py):
+    """
+    Build the package and ship the precompiled email templates with it
+    """
+
+    def run(self):
+        super().run()
+        try:
+            import jinja2  # noqa: F401
+        except ImportError:
+            self.announce('jinja2 is not installed, not precompiling the email templates', level=2)
+            return
+        precompile = self.distribution.get_command_obj('precompile_templates')
+        precompile.build_lib = self.build_lib
+        self.run_command('precompile_templates')
+
+
+setuptools.setup(
+    name='os3-cleaning-schedule-Erik-Lamers1',
+    version='0.1.1',
+    author='Erik Lamers',
+    author_email='erik.lamers@os3.nl',
+    description='OS3 cleaning schedule for clean coffee',
+    url="https://github.com/Erik-Lamers1/OS3-cleaning-schedule",
+    packages=setuptools.find_packages(exclude=['tests', 'tests.*', 'benchmarks', 'benchmarks.*']),
+    package_data={
+        'cleaning_schedule': ['templates/*.jn2'],
+    },
+    classifiers=[
+        'Programming Language :: Python :: 3',
+    ],
+    install_requires=[
+        'requests',
+        'jinja2',
+    ],
+    cmdclass={
+        'build_py': BuildPy,
+        'precompile_templates': PrecompileTemplates,
+    },
+)
@@ -0,0 +1,129 @@
+import json
+import random
+from itertools import permutations
+from os import remove
+from tempfile import mktemp
+from unittest import skipUnless
+
+from mock import patch
+
+from tests import MyTestCase
+
+from cleaning_schedule.assignment import hungarian, solve_assignment, assign_tasks, load_constraints, \
+    AssignmentHistory, Assignment
+
+try:
+    import scipy  # noqa: F401
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+
+def brute_force_cost(cost):
+    rows, columns = len(cost), len(cost[0])
+    if rows > columns:
+        cost = [list(column) for column in zip(*cost)]
+        rows, columns = columns, rows
+    return min(sum(cost[row][column] for row, column in enumerate(chosen))
+               for chosen in permutations(range(columns), rows))
+
+
+class TestHungarian(MyTestCase):
+    def test_that_hungarian_finds_the_minimum_cost(self):
+        rng = random.Random(0)
+        for rows, columns in ((3, 3), (2, 5), (5, 2), (4, 6)):
+            cost = [[rng.randint(0, 20) for _ in range(columns)] for _ in range(rows)]
+            pairs = hungarian(cost)
+            self.assertEqual(len(pairs), min(rows, columns))
+            self.assertEqual(len({column for _, column in pairs}), len(pairs))
+            self.assertEqual(sum(cost[row][column] for row, column in pairs), brute_force_cost(cost))
+
+    def test_that_solve_assignment_handles_empty_problems(self):
+        self.assertEqual(solve_assignment([]), [])
+        self.assertEqual(solve_assignment([[]]), [])
+
+    def test_that_solve_assignment_falls_back_to_hungarian_without_scipy(self):
+        hungarian_mock = self.set_up_patch('cleaning_schedule.assignment.hungarian')
+        with patch.dict('sys.modules', {'scipy.optimize': None}):
+            self.assertEqual(solve_assignment([[1, 2]]), hungarian_mock.return_value)
+        hungarian_mock.assert_called_once_with([[1, 2]])
+
+    @skipUnless(HAS_SCIPY, 'SciPy is not installed')
+    def test_that_solve_assignment_with_scipy_matches_hungarian(self):
+        rng = random.Random(0)
+        for rows, columns in ((3, 3), (2, 5), (5, 2), (40, 60)):
+            cost = [[rng.randint(0, 20) for _ in range(columns)] for _ in range(rows)]
+            pairs = solve_assignment(cost)
+            self.assertEqual(pairs, sorted(pairs))
+            self.assertTrue(all(isinstance(row, int) and isinstance(column, int) for row, column in pairs))
+            self.assertEqual(len(pairs), min(rows, columns))
+            self.assertEqual(len({column for _, column in pairs}), len(pairs))
+            self.assertEqual(sum(cost[row][column] for row, column in pairs),
+                             sum(cost[row][column] for row, column in hungarian(cost)))
+
+
+class TestAssignTasks(MyTestCase):
+    def setUp(self):
+        self.tasks = ['Dishes', 'Fridge', 'Floor', 'Coffee machine', 'Trash']
+
+    def test_that_assign_tasks_spreads_tasks_evenly(self):
+        assignments = assign_tasks(['Henk', 'Jarno'], self.tasks, '01-01-2019')
+        self.assertEqual(sorted(len(assignment.tasks) for assignment in assignments), [2, 3])
+        self.assertEqual(sorted(task for assignment in assignments for task in assignment.tasks), sorted(self.tasks))
+
+    def test_that_assign_tasks_shares_tasks_with_more_students_than_tasks(self):
+        assignments = assign_tasks(['Henk', 'Jarno', 'Piet'], ['Dishes', 'Fridge'], '01-01-2019')
+        self.assertTrue(all(len(assignment.tasks) == 1 for assignment in assignments))
+        self.assertEqual({task for assignment in assignments for task in assignment.tasks}, {'Dishes', 'Fridge'})
+
+    def test_that_assign_tasks_respects_availability(self):
+        unavailable = {'henk': {'dishes'}}
+        assignments = assign_tasks(['Henk', 'Jarno'], ['Dishes', 'Floor'], '01-01-2019', unavailable=unavailable)
+        self.assertEqual(assignments, [Assignment('Henk', ['Floor']), Assignment('Jarno', ['Dishes'])])
+
+    def test_that_assign_tasks_assigns_unavailable_students_when_nobody_else_can(self):
+        unavailable = {'henk': {'dishes', 'floor'}}
+        assignments = assign_tasks(['Henk', 'Jarno'], ['Dishes', 'Floor'], '01-01-2019', unavailable=unavailable)
+        self.assertEqual([len(assignment.tasks) for assignment in assignments], [1, 1])
+
+    def test_that_assign_tasks_does_not_repeat_recent_tasks(self):
+        history = AssignmentHistory([('01-01-2019', 'Henk', 'Dishes'), ('01-01-2019', 'Jarno', 'Fridge')])
+        assignments = assign_tasks(['Henk', 'Jarno'], ['Dishes', 'Fridge'], '08-01-2019', history)
+        self.assertEqual(assignments, [Assignment('Henk', ['Fridge']), Assignment('Jarno', ['Dishes'])])
+
+    def test_that_assign_tasks_avoids_students_that_shared_a_task(self):
+        history = AssignmentHistory([('01-01-2019', 'Henk', 'Dishes'), ('01-01-2019', 'Jarno', 'Dishes'),
+                                     ('01-01-2019', 'Piet', 'Fridge'), ('01-01-2019', 'Klaas', 'Fridge')])
+        assignments = assign_tasks(['Henk', 'Jarno', 'Piet', 'Klaas'], ['Floor', 'Trash'], '29-01-2019', history)
+        by_task = {}
+        for student, tasks in assignments:
+            by_task.setdefault(tasks[0], set()).add(student)
+        self.assertNotIn({'Henk', 'Jarno'}, by_task.values())
+        self.assertNotIn({'Piet', 'Klaas'}, by_task.values())
+
+    def test_that_assign_tasks_gives_extra_tasks_to_students_with_less_load(self):
+        history = AssignmentHistory([('01-01-2019', 'Henk', 'Trash')])
+        assignments = assign_tasks(['Henk', 'Jarno'], ['Dishes', 'Fridge', 'Floor'], '29-01-2019', history)
+        self.assertEqual([len(assignment.tasks) for assignment in assignments], [1, 2])
+
+    def test_that_assign_tasks_without_tasks_assigns_nothing(self):
+        self.assertEqual(assign_tasks(['Henk'], [], '01-01-2019'), [Assignment('Henk', [])])
+
+
+class TestLoadConstraints(MyTestCase):
+    def setUp(self):
+        self.path = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, self.path)
+
+    def write(self, constraints):
+        with open(self.path, 'w') as fh:
+            json.dump(constraints, fh)
+
+    def test_that_load_constraints_normalises_names(self):
+        self.write({'unavailable': {'Henk  Slaaf': ['Coffee Machine']}})
+        self.assertEqual(load_constraints(self.path), {'henk slaaf': {'coffee machine'}})
+
+    def test_that_load_constraints_raises_value_error_on_invalid_file(self):
+        self.write({'unavailable': {'Henk Slaaf': 'Coffee machine'}})
+        with self.assertRaises(ValueError):
+            load_constraints(self.path)
@@ -0,0 +1,59 @@
+import json
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from benchmarks.run import compare_results, main
+
+
+def result(benchmark_id, median):
+    return {'id': benchmark_id, 'name': benchmark_id.split('[')[0], 'size': 10, 'repeat': 3,
+            'min': median, 'median': median, 'mean': median, 'stdev': 0.0}
+
+
+class TestCompareResults(MyTestCase):
+    def setUp(self):
+        self.baseline = [result('pick_students[10]', 1.0), result('parse_page[1KB]', 2.0)]
+
+    def test_that_compare_results_reports_slowdown_past_threshold(self):
+        comparison = compare_results(self.baseline, [result('pick_students[10]', 1.5)], threshold=0.2)
+        self.assertEqual(comparison, [('pick_students[10]', 1.0, 1.5, 1.5, True)])
+
+    def test_that_compare_results_passes_slowdown_within_threshold(self):
+        comparison = compare_results(self.baseline, [result('parse_page[1KB]', 2.2)], threshold=0.2)
+        self.assertFalse(comparison[0][4])
+
+    def test_that_compare_results_skips_benchmarks_without_baseline(self):
+        self.assertEqual(compare_results(self.baseline, [result('render_template[10]', 1.0)]), [])
+
+
+class TestCompareMain(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.baseline = self.write_results('baseline.json', [result('pick_students[10]', 1.0),
+                                                             result('parse_page[1KB]', 2.0)])
+
+    def write_results(self, name, results):
+        path = join(self.directory, name)
+        with open(path, 'w') as fh:
+            json.dump({'meta': {}, 'results': results}, fh)
+        return path
+
+    def test_that_compare_exits_non_zero_on_regression(self):
+        results = self.write_results('results.json', [result('pick_students[10]', 1.3),
+                                                      result('parse_page[1KB]', 2.0)])
+        with self.assertRaises(SystemExit) as e:
+            main(['--compare', self.baseline, '--input', results])
+        self.assertEqual(e.exception.code, 1)
+
+    def test_that_compare_passes_within_threshold(self):
+        results = self.write_results('results.json', [result('pick_students[10]', 1.1),
+                                                      result('parse_page[1KB]', 1.5)])
+        main(['--compare', self.baseline, '--input', results])
+
+    def test_that_compare_uses_given_threshold(self):
+        results = self.write_results('results.json', [result('pick_students[10]', 1.3)])
+        main(['--compare', self.baseline, '--input', results, '--threshold', '0.5'])
@@ -0,0 +1,104 @@
+import json
+from mock import Mock, MagicMock
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.cohorts import load_cohorts, cohort_arguments, run_cohort, run_cohorts, main
+from cleaning_schedule.make_os3_cleaning_schedule import main as schedule_main
+
+
+class CohortsTestCase(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.cohorts = [
+            {'name': 'Year 1', 'year': '2018-2019', 'students_file': join(self.directory, 'year1'),
+             'email': 'year1@os3.nl'},
+            {'year': '2019-2020', 'students_file': join(self.directory, 'year2'), 'no_email': True,
+             'cc': ['a@os3.nl', 'b@os3.nl'], 'args': ['--weeks', 2]},
+        ]
+        self.config = join(self.directory, 'cohorts.json')
+        self.write_config({'cohorts': self.cohorts})
+
+    def write_config(self, config):
+        with open(self.config, 'w') as fh:
+            json.dump(config, fh)
+
+
+class TestLoadCohorts(CohortsTestCase):
+    def test_that_load_cohorts_returns_cohorts_with_names(self):
+        cohorts = load_cohorts(self.config)
+        self.assertEqual([cohort['name'] for cohort in cohorts],
+                         ['Year 1', '2019-2020 ({})'.format(self.cohorts[1]['students_file'])])
+
+    def test_that_load_cohorts_raises_value_error_without_cohorts(self):
+        self.write_config({'groups': []})
+        with self.assertRaises(ValueError):
+            load_cohorts(self.config)
+
+    def test_that_load_cohorts_raises_value_error_without_students_file(self):
+        self.write_config({'cohorts': [{'year': '2018-2019'}]})
+        with self.assertRaises(ValueError):
+            load_cohorts(self.config)
+
+
+class TestCohortArguments(CohortsTestCase):
+    def test_that_cohort_arguments_translates_config_to_options(self):
+        arguments = cohort_arguments(self.cohorts[1], 'henk', 'henkpw')
+        self.assertEqual(arguments[:5], [self.cohorts[1]['students_file'], '--user', 'henk', '--password', 'henkpw'])
+        self.assertIn('--no-email', arguments)
+        self.assertEqual(arguments[-2:], ['--weeks', '2'])
+        cc = arguments.index('--cc')
+        self.assertEqual(arguments[cc + 1:cc + 3], ['a@os3.nl', 'b@os3.nl'])
+
+
+class TestRunCohorts(CohortsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_schedule = self.set_up_patch('cleaning_schedule.cohorts.make_schedule')
+        self.website = Mock()
+        self.cohorts = load_cohorts(self.config)
+
+    def test_that_run_cohort_uses_website_for_cohort_year(self):
+        result = run_cohort(self.cohorts[1], self.website, 'henk', 'henkpw')
+        self.assertTrue(result.success)
+        self.website.for_year.assert_called_once_with('2019-2020')
+        self.assertEqual(self.make_schedule.call_args[0][1], self.website.for_year.return_value)
+
+    def test_that_run_cohort_records_the_time_of_the_cohort(self):
+        metrics = self.set_up_patch('cleaning_schedule.cohorts.metrics')
+        run_cohort(self.cohorts[0], self.website, 'henk', 'henkpw')
+        metrics.span.assert_called_once_with('cohort Year 1')
+
+    def test_that_run_cohort_reports_exit(self):
+        self.make_schedule.side_effect = SystemExit(255)
+        result = run_cohort(self.cohorts[0], self.website, 'henk', 'henkpw')
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, 'exited with code 255')
+
+    def test_that_run_cohorts_continues_after_a_failed_cohort(self):
+        self.make_schedule.side_effect = [RuntimeError('boom'), None]
+        results = run_cohorts(self.cohorts, self.website, 'henk', 'henkpw', max_workers=1)
+        self.assertEqual([result.success for result in results], [False, True])
+        self.assertEqual(results[0].error, 'boom')
+
+    def test_that_main_exits_non_zero_if_a_cohort_failed(self):
+        self.set_up_patch('cleaning_schedule.os3website.OS3Website', MagicMock())
+        self.make_schedule.side_effect = [None, RuntimeError('boom')]
+        with self.assertRaises(SystemExit) as e:
+            main([self.config, '-u', 'henk', '-p', 'henkpw', '--max-workers', '1'])
+        self.assertEqual(e.exception.code, 1)
+
+    def test_that_main_shares_one_website_between_cohorts(self):
+        website = self.set_up_patch('cleaning_schedule.os3website.OS3Website', MagicMock())
+        main([self.config, '-u', 'henk', '-p', 'henkpw'])
+        self.assertEqual(website.call_count, 1)
+        self.assertEqual(self.make_schedule.call_count, 2)
+
+    def test_that_schedule_main_dispatches_cohorts_command(self):
+        cohorts_main = self.set_up_patch('cleaning_schedule.cohorts.main')
+        schedule_main(['cohorts', self.config])
+        cohorts_main.assert_called_once_with([self.config])
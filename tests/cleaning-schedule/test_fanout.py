@@ -0,0 +1,118 @@
+import smtplib
+from mock import Mock
+from os import remove
+from tempfile import mktemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.assignment import Assignment
+from cleaning_schedule.fanout import load_student_emails, make_recipients, send_to_recipient, fan_out, \
+    report_results, Recipient, SendResult
+from cleaning_schedule.mail import Mail
+from cleaning_schedule.settings.base import PERSONAL_EMAIL_TEMPLATE
+from cleaning_schedule.utils.cache import Changes
+from cleaning_schedule.utils.filesystem import write_lines_to_file
+
+
+class TestLoadStudentEmails(MyTestCase):
+    def setUp(self):
+        self.path = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, self.path)
+
+    def test_that_load_student_emails_maps_names_to_addresses(self):
+        write_lines_to_file(self.path, ['Henk Slaaf <henk@os3.nl>', '', '"Jarno Jaapsen" <jarno@os3.nl>'])
+        self.assertEqual(load_student_emails(self.path), {'Henk Slaaf': 'henk@os3.nl', 'Jarno Jaapsen': 'jarno@os3.nl'})
+
+    def test_that_load_student_emails_raises_value_error_on_lines_without_name(self):
+        write_lines_to_file(self.path, ['henk@os3.nl'])
+        with self.assertRaises(ValueError):
+            load_student_emails(self.path)
+
+
+class TestMakeRecipients(MyTestCase):
+    def test_that_make_recipients_looks_up_students_insensitive(self):
+        recipients = make_recipients([Assignment('henk  slaaf', ['Dishes'])], ['Dishes', 'Fridge'],
+                                     {'Henk Slaaf': 'henk@os3.nl'})
+        self.assertEqual(recipients, [Recipient('henk  slaaf', 'henk@os3.nl', True, ['Dishes'])])
+
+    def test_that_make_recipients_keeps_students_without_address(self):
+        recipients = make_recipients([Assignment('Henk Slaaf', ['Dishes'])], ['Dishes'], {})
+        self.assertIsNone(recipients[0].address)
+
+    def test_that_make_recipients_adds_each_overview_address_once(self):
+        recipients = make_recipients([], ['Dishes'], {}, ['all@os3.nl', 'cc@os3.nl', 'all@os3.nl'])
+        self.assertEqual([recipient.address for recipient in recipients], ['all@os3.nl', 'cc@os3.nl'])
+        self.assertFalse(any(recipient.on_duty for recipient in recipients))
+
+
+class TestFanOut(MyTestCase):
+    def setUp(self):
+        self.mail = Mock()
+        self.mail.render_template.return_value = b'<p>schedule</p>'
+        self.website = Mock()
+        self.website.smtp_pool.send.return_value = {}
+        self.context = {'date': '01-01-2019', 'students': ['Henk Slaaf'], 'cleaning_tasks': ['Dishes']}
+        self.henk = Recipient('Henk Slaaf', 'henk@os3.nl', True, ['Dishes'])
+
+    def test_that_send_to_recipient_sends_only_to_the_recipient(self):
+        result = send_to_recipient(self.mail, self.website, self.henk, self.context, 'test@os3.nl')
+        self.assertTrue(result.success)
+        self.mail.make_email.assert_called_once_with(
+            'henk@os3.nl', 'You are on OS3 cleaning duty in the week of 01-01-2019', b'<p>schedule</p>'
+        )
+        self.website.smtp_pool.send.assert_called_once_with(
+            'test@os3.nl', ['henk@os3.nl'], self.mail.make_email.return_value
+        )
+
+    def test_that_send_to_recipient_renders_the_recipient_tasks(self):
+        send_to_recipient(self.mail, self.website, self.henk, self.context, 'test@os3.nl')
+        kwargs = self.mail.render_template.call_args[1]
+        self.assertEqual(kwargs['recipient'], 'Henk Slaaf')
+        self.assertTrue(kwargs['on_duty'])
+        self.assertEqual(kwargs['tasks'], ['Dishes'])
+
+    def test_that_send_to_recipient_reports_missing_address(self):
+        result = send_to_recipient(self.mail, self.website, self.henk._replace(address=None), self.context, 'a@os3.nl')
+        self.assertFalse(result.success)
+        self.assertFalse(self.website.smtp_pool.send.called)
+
+    def test_that_send_to_recipient_reports_smtp_errors(self):
+        self.website.smtp_pool.send.side_effect = smtplib.SMTPRecipientsRefused({'henk@os3.nl': (550, b'No')})
+        result = send_to_recipient(self.mail, self.website, self.henk, self.context, 'test@os3.nl')
+        self.assertFalse(result.success)
+
+    def test_that_fan_out_continues_after_a_failed_recipient(self):
+        recipients = [self.henk._replace(address=None), self.henk, self.henk._replace(address='cc@os3.nl')]
+        results = fan_out(self.mail, self.website, recipients, self.context, max_workers=2)
+        self.assertEqual([result.success for result in results], [False, True, True])
+        self.assertEqual(self.website.smtp_pool.send.call_count, 2)
+
+    def test_that_report_results_returns_failed_results(self):
+        failed = SendResult(self.henk, False, 'boom')
+        self.assertEqual(report_results([SendResult(self.henk, True, None), failed]), [failed])
+
+
+class TestPersonalTemplate(MyTestCase):
+    def setUp(self):
+        self.mail = Mail(template=PERSONAL_EMAIL_TEMPLATE)
+        self.context = {'date': '01-01-2019', 'cleaning_url': 'https://www.os3.nl', 'students': ['Henk', 'Jarno'],
+                        'assignments': [Assignment('Henk', ['Dishes']), Assignment('Jarno', ['Fridge'])],
+                        'cleaning_tasks': ['Dishes', 'Fridge'], 'list_rotated': False}
+
+    def test_that_personal_template_tells_students_they_are_on_duty(self):
+        body = self.mail.render_template(recipient='Henk', on_duty=True, tasks=['Dishes'], **self.context)
+        self.assertIn(b'You are on duty', body)
+        self.assertIn(b'<li><b>Jarno</b>: Fridge</li>', body)
+        self.assertNotIn(b'<li><b>Henk</b>', body)
+
+    def test_that_personal_template_gives_overview_to_others(self):
+        body = self.mail.render_template(recipient='all@os3.nl', on_duty=False, tasks=['Dishes', 'Fridge'],
+                                         **self.context)
+        self.assertNotIn(b'You are on duty', body)
+        self.assertIn(b'<li><b>Henk</b>: Dishes</li>', body)
+
+    def test_that_personal_template_lists_changed_tasks(self):
+        body = self.mail.render_template(recipient='Henk', on_duty=True, tasks=['Dishes'],
+                                         task_changes=Changes(['Coffee machine'], ['Fridge']), **self.context)
+        self.assertIn(b'New: <b>Coffee machine</b>', body)
+        self.assertIn(b'<s>Fridge</s>', body)
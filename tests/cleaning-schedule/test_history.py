@@ -0,0 +1,246 @@
+import json
+from datetime import date
+from os.path import join, getsize
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.history import PickHistory, HistoryIndex, DutySummary, HISTORY_MAGIC, week_ordinal, \
+    format_week, sort_summaries, format_summaries, main, SORT_DUTIES, SORT_LAST_DUTY
+from cleaning_schedule.settings.base import HISTORY_INDEX_TAIL
+from cleaning_schedule.make_os3_cleaning_schedule import main as schedule_main
+
+
+class HistoryTestCase(MyTestCase):
+    index_tail = HISTORY_INDEX_TAIL
+
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.path = join(self.directory, 'history')
+
+    def open_history(self):
+        history = PickHistory(self.path, self.index_tail)
+        self.addCleanup(history.close)
+        return history
+
+    def make_history(self):
+        history = self.open_history()
+        history.add('07-01-2019', ['Henk Slaaf', 'Jürgen Jaapsen'])
+        history.add('14-01-2019', ['Piet Paulusma', 'Klaas Vaak'])
+        history.add('21-01-2019', ['Henk Slaaf', 'Piet Paulusma'])
+        history.commit()
+        return history
+
+
+class TestPickHistory(HistoryTestCase):
+    def test_that_week_ordinal_and_format_week_convert_weeks(self):
+        self.assertEqual(week_ordinal('07-01-2019'), date(2019, 1, 7).toordinal())
+        self.assertEqual(format_week(week_ordinal('07-01-2019')), '07-01-2019')
+
+    def test_that_history_indexes_picks_by_student(self):
+        history = self.make_history()
+        self.assertEqual(history.duties('Henk Slaaf'), 2)
+        self.assertEqual(history.last_duty('Henk Slaaf'), '21-01-2019')
+        self.assertEqual(history.weeks_of('Henk Slaaf'), ['07-01-2019', '21-01-2019'])
+        self.assertEqual(len(history), 6)
+
+    def test_that_history_indexes_picks_by_week(self):
+        self.assertEqual(self.make_history().picked_in('14-01-2019'), ['Piet Paulusma', 'Klaas Vaak'])
+
+    def test_that_history_knows_nothing_of_unknown_students(self):
+        history = self.make_history()
+        self.assertNotIn('Nobody', history)
+        self.assertEqual(history.duties('Nobody'), 0)
+        self.assertIsNone(history.last_duty('Nobody'))
+        self.assertEqual(history.summary('Nobody'), DutySummary('Nobody', 0, None, None))
+
+    def test_that_summary_counts_weeks_since_last_duty(self):
+        self.assertEqual(self.make_history().summary('Klaas Vaak', '04-02-2019'),
+                         DutySummary('Klaas Vaak', 1, '14-01-2019', 3))
+
+    def test_that_summary_does_not_count_planned_duties(self):
+        history = self.make_history()
+        self.assertEqual(history.summary('Henk Slaaf', '14-01-2019'), DutySummary('Henk Slaaf', 1, '07-01-2019', 1))
+        self.assertEqual(history.summary('Klaas Vaak', '07-01-2019'), DutySummary('Klaas Vaak', 0, None, None))
+        self.assertTrue(all(summary.weeks_since is None or summary.weeks_since >= 0
+                            for summary in history.summaries('07-01-2019')))
+
+    def test_that_committed_history_is_read_again(self):
+        self.make_history()
+        history = self.open_history()
+        self.assertEqual(history.students(), ['Henk Slaaf', 'Jürgen Jaapsen', 'Piet Paulusma', 'Klaas Vaak'])
+        self.assertEqual(history.weeks_of('Piet Paulusma'), ['14-01-2019', '21-01-2019'])
+
+    def test_that_commit_only_appends_new_records(self):
+        history = self.make_history()
+        size = getsize(self.path)
+        history.add('28-01-2019', ['Klaas Vaak'])
+        history.commit()
+        # Klaas Vaak is known, only the pick is appended
+        self.assertEqual(getsize(self.path), size + 8)
+        self.assertEqual(self.open_history().duties('Klaas Vaak'), 2)
+
+    def test_that_rollback_forgets_picks_that_were_not_committed(self):
+        history = self.make_history()
+        history.add('28-01-2019', ['Klaas Vaak', 'Anna Nieuw'])
+        history.rollback()
+        self.assertEqual(history.duties('Klaas Vaak'), 1)
+        self.assertNotIn('Anna Nieuw', history)
+        history.commit()
+        self.assertEqual(len(self.open_history()), 6)
+
+    def test_that_partly_written_record_is_ignored_and_overwritten(self):
+        self.make_history()
+        with open(self.path, 'ab') as fh:
+            fh.write(b'\x01\x02\x03')
+        history = self.open_history()
+        self.assertEqual(len(history), 6)
+        history.add('28-01-2019', ['Klaas Vaak'])
+        history.commit()
+        self.assertEqual(self.open_history().last_duty('Klaas Vaak'), '28-01-2019')
+
+    def test_that_commit_keeps_picks_committed_by_others_since_load(self):
+        first = self.make_history()
+        second = self.open_history()
+        first.add('28-01-2019', ['Anna Nieuw'])
+        second.add('28-01-2019', ['Bert Ander', 'Klaas Vaak'])
+        first.commit()
+        second.commit()
+        history = self.open_history()
+        self.assertEqual(history.picked_in('28-01-2019'), ['Anna Nieuw', 'Bert Ander', 'Klaas Vaak'])
+        self.assertEqual(history.duties('Klaas Vaak'), 2)
+        self.assertEqual(second.students(), history.students())
+
+    def test_that_commit_only_drops_partly_written_record_at_the_end(self):
+        stale = self.make_history()
+        with open(self.path, 'ab') as fh:
+            fh.write(b'\x01\x02\x03')
+        other = self.open_history()
+        other.add('28-01-2019', ['Klaas Vaak'])
+        other.commit()
+        stale.add('04-02-2019', ['Henk Slaaf'])
+        stale.commit()
+        history = self.open_history()
+        self.assertEqual(history.last_duty('Klaas Vaak'), '28-01-2019')
+        self.assertEqual(history.last_duty('Henk Slaaf'), '04-02-2019')
+        self.assertEqual(len(history), 8)
+
+    def test_that_empty_file_is_read_as_empty_history(self):
+        open(self.path, 'wb').close()
+        history = self.open_history()
+        self.assertEqual(len(history), 0)
+        history.add('07-01-2019', ['Henk Slaaf'])
+        history.commit()
+        self.assertEqual(self.open_history().students(), ['Henk Slaaf'])
+
+    def test_that_other_files_are_not_read_as_history(self):
+        with open(self.path, 'w') as fh:
+            fh.write('Henk Slaaf\n')
+        with self.assertRaises(ValueError):
+            self.open_history()
+
+    def test_that_history_file_starts_with_magic(self):
+        self.make_history()
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(fh.read(len(HISTORY_MAGIC)), HISTORY_MAGIC)
+
+
+class TestIndexedPickHistory(TestPickHistory):
+    """
+    The same tests with the index written on every commit
+    """
+    index_tail = 0
+
+    def test_that_commit_writes_index(self):
+        self.make_history()
+        index = HistoryIndex.open(self.path + '.idx')
+        self.addCleanup(index.close)
+        self.assertEqual((index.students, index.weeks, index.picks), (4, 3, 6))
+        self.assertEqual(index.log_size, getsize(self.path))
+        self.assertEqual(index.find('Klaas Vaak'), 3)
+        self.assertIsNone(index.find('Nobody'))
+
+    def test_that_open_only_reads_the_log_after_the_index(self):
+        self.make_history()
+        with open(self.path, 'r+b') as fh:
+            # Records in the index are not read again
+            fh.seek(len(HISTORY_MAGIC))
+            fh.write(b'\xff' * 8)
+        self.assertEqual(self.open_history().weeks_of('Henk Slaaf'), ['07-01-2019', '21-01-2019'])
+
+    def test_that_picks_after_the_index_are_read_from_the_log(self):
+        self.make_history()
+        history = PickHistory(self.path, HISTORY_INDEX_TAIL)
+        self.addCleanup(history.close)
+        history.add('28-01-2019', ['Klaas Vaak', 'Anna Nieuw'])
+        history.commit()
+        history = self.open_history()
+        self.assertEqual(history.picked_in('28-01-2019'), ['Klaas Vaak', 'Anna Nieuw'])
+        self.assertEqual(history.summary('Klaas Vaak', '28-01-2019'), DutySummary('Klaas Vaak', 2, '28-01-2019', 0))
+        self.assertEqual(len(history), 8)
+
+    def test_that_broken_index_is_ignored(self):
+        self.make_history()
+        logger = self.set_up_patch('cleaning_schedule.history.logger')
+        for data in (b'', b'OS3HIDX1', b'Henk Slaaf\n'):
+            with open(self.path + '.idx', 'wb') as fh:
+                fh.write(data)
+            self.assertEqual(self.open_history().duties('Henk Slaaf'), 2)
+        self.assertEqual(logger.warning.call_count, 3)
+
+    def test_that_index_of_a_larger_log_is_ignored(self):
+        self.make_history()
+        with open(self.path, 'r+b') as fh:
+            fh.truncate(len(HISTORY_MAGIC))
+        self.set_up_patch('cleaning_schedule.history.logger')
+        self.assertEqual(len(self.open_history()), 0)
+        open(self.path, 'wb').close()
+        history = self.open_history()
+        history.add('04-02-2019', ['Klaas Vaak'])
+        history.commit()
+        self.assertEqual(self.open_history().students(), ['Klaas Vaak'])
+
+
+class TestHistoryReport(HistoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_history()
+        self.print = self.set_up_patch('builtins.print')
+
+    def test_that_sort_summaries_puts_longest_since_last_duty_first(self):
+        summaries = [DutySummary('A', 1, '21-01-2019', 0), DutySummary('B', 0, None, None),
+                     DutySummary('C', 2, '07-01-2019', 2)]
+        self.assertEqual([summary.student for summary in sort_summaries(summaries, SORT_LAST_DUTY)], ['B', 'C', 'A'])
+        self.assertEqual([summary.student for summary in sort_summaries(summaries, SORT_DUTIES)], ['B', 'A', 'C'])
+
+    def test_that_format_summaries_makes_table(self):
+        table = format_summaries([DutySummary('Henk Slaaf', 2, '21-01-2019', 1), DutySummary('B', 0, None, None)])
+        self.assertEqual(table.splitlines()[1].split(), ['Henk', 'Slaaf', '2', '21-01-2019', '1'])
+        self.assertEqual(table.splitlines()[2].split(), ['B', '0', 'never', '-'])
+
+    def test_that_main_prints_duties_of_all_students(self):
+        main([self.path, '--json'])
+        report = json.loads(self.print.call_args[0][0])
+        self.assertEqual({summary['student']: summary['duties'] for summary in report},
+                         {'Henk Slaaf': 2, 'Jürgen Jaapsen': 1, 'Piet Paulusma': 2, 'Klaas Vaak': 1})
+
+    def test_that_main_prints_weeks_of_a_student(self):
+        main([self.path, '--student', 'henk', '--match', 'prefix', '--json'])
+        report = json.loads(self.print.call_args[0][0])
+        self.assertEqual(report[0]['student'], 'Henk Slaaf')
+        self.assertEqual(report[0]['weeks'], ['07-01-2019', '21-01-2019'])
+
+    def test_that_main_prints_students_of_a_week(self):
+        main([self.path, '--week', '14-01-2019'])
+        self.print.assert_called_once_with('Piet Paulusma\nKlaas Vaak')
+
+    def test_that_main_rejects_invalid_week(self):
+        with self.assertRaises(SystemExit):
+            main([self.path, '--week', '2019-01-14'])
+
+    def test_that_schedule_main_dispatches_history_command(self):
+        history_main = self.set_up_patch('cleaning_schedule.history.main')
+        schedule_main(['history', self.path])
+        history_main.assert_called_once_with([self.path])
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+from tests import MyTestCase
+
+from cleaning_schedule.settings.base import PROJECT_DIR
+
+# Cumulative microseconds importing the CLI may take, it took over 500ms when everything was imported up front
+IMPORT_TIME_BUDGET = 150000
+# Modules only the paths that need them may import
+LAZY_MODULES = (
+    'requests', 'urllib3', 'jinja2', 'smtplib', 'ssl', 'email.mime', 'html5print', 'bs4', 'concurrent.futures',
+    'difflib', 'tempfile',
+)
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime
+    :param module: str: The module to import
+    :return: dict: module name -> cumulative import time in microseconds
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(PROJECT_DIR), PYTHONDONTWRITEBYTECODE='')
+    # Import once so the timed run reads the bytecode instead of compiling
+    subprocess.run([sys.executable, '-c', 'import {}'.format(module)], env=env, check=True)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(MyTestCase):
+    def setUp(self):
+        self.times = import_times('cleaning_schedule.make_os3_cleaning_schedule')
+
+    def test_that_cli_import_stays_within_budget(self):
+        self.assertLess(self.times['cleaning_schedule.make_os3_cleaning_schedule'], IMPORT_TIME_BUDGET)
+
+    def test_that_cli_import_does_not_load_slow_modules(self):
+        # Modules loaded by site (.pth files) are imported before ours, they do not count
+        site_modules = import_times('site')
+        loaded = [
+            module for module in LAZY_MODULES
+            if any(name == module or name.startswith(module + '.') for name in self.times if name not in site_modules)
+        ]
+        self.assertEqual(loaded, [])
@@ -1,9 +1,18 @@
+import email
+import jinja2
+from email.policy import default
 from logging import WARNING
-from tests import MyTestCase
+from os import listdir, makedirs, remove
 from os.path import join
+from shutil import copytree, ignore_patterns, rmtree
+from tempfile import mkdtemp
+from mock import patch
+from tests import MyTestCase
 
-from cleaning_schedule.mail import Mail
-from cleaning_schedule.settings.base import EMAIL_TEMPLATE, PROJECT_DIR
+from cleaning_schedule.history import DutySummary
+from cleaning_schedule.mail import Mail, get_template_environment, create_bytecode_cache, precompile_templates, \
+    TemplateBytecodeCache
+from cleaning_schedule.settings.base import EMAIL_TEMPLATE, TEMPLATE_DIR, TEMPLATE_CACHE_DIR
 
 
 class TestMailLogLevel(MyTestCase):
@@ -15,19 +24,35 @@ class TestMailLogLevel(MyTestCase):
         self.assertEqual(self.mail.logger.level, WARNING)
 
 
-class TestMail(MyTestCase):
+class TemplateEnvironmentTestCase(MyTestCase):
+    def reset_template_environment(self):
+        patcher = patch('cleaning_schedule.mail._template_env', None)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+
+class TestMail(TemplateEnvironmentTestCase):
     def setUp(self):
         self.jinja = self.set_up_patch('cleaning_schedule.mail.jinja2')
         self.logger = self.set_up_patch('cleaning_schedule.mail.logger')
+        self.create_bytecode_cache = self.set_up_patch('cleaning_schedule.mail.create_bytecode_cache')
+        self.reset_template_environment()
         self.mail = Mail(from_address='test')
 
     def test_render_template_calls_correct_functions(self):
         self.mail.render_template()
-        self.logger.debug.assert_called_once_with('Rendering email template from {}'.format(EMAIL_TEMPLATE))
-        self.jinja.FileSystemLoader.assert_called_once_with(searchpath=join(PROJECT_DIR, "templates"))
-        self.jinja.Environment.assert_called_once_with(loader=self.jinja.FileSystemLoader())
+        self.logger.debug.assert_called_once_with('Rendering email template from %s', EMAIL_TEMPLATE)
+        self.jinja.FileSystemLoader.assert_called_once_with(searchpath=TEMPLATE_DIR)
+        self.jinja.Environment.assert_called_once_with(
+            loader=self.jinja.FileSystemLoader(), bytecode_cache=self.create_bytecode_cache(), auto_reload=True
+        )
         self.jinja.Environment().get_template.assert_called_once_with(EMAIL_TEMPLATE)
 
+    def test_render_template_reuses_template_environment(self):
+        self.mail.render_template()
+        Mail().render_template()
+        self.assertEqual(self.jinja.Environment.call_count, 1)
+
     def test_verify_email_addresses_verifies_correct_email_address(self):
         self.assertTrue(self.mail.verify_email_addresses(['test@test.com']))
 
@@ -39,3 +64,124 @@ class TestMail(MyTestCase):
 
     def test_verify_email_addresses_does_not_verify_single_faulty_address_in_address_list(self):
         self.assertFalse(self.mail.verify_email_addresses(['test@test.com', 'test2@test.com', 'blaap']))
+
+
+class TestMakeEmail(MyTestCase):
+    def setUp(self):
+        self.set_up_patch('cleaning_schedule.mail.logger')
+        self.mail = Mail(from_address='test@os3.nl')
+
+    def make_email(self, *args, **kwargs):
+        message = self.mail.make_email(*args, **kwargs)
+        self.assertIsInstance(message, bytes)
+        # The message is serialised for SMTP with CRLF line endings
+        return email.message_from_bytes(message.replace(b'\r\n', b'\n'), policy=default)
+
+    def test_that_make_email_sets_headers(self):
+        msg = self.make_email('henk@os3.nl', 'Schedule', b'<p>schedule</p>', ['cc@os3.nl', 'cc2@os3.nl'])
+        self.assertEqual(msg['From'], 'test@os3.nl')
+        self.assertEqual(msg['To'], 'henk@os3.nl')
+        self.assertEqual(msg['Cc'], 'cc@os3.nl, cc2@os3.nl')
+        self.assertEqual(msg['Subject'], 'Schedule')
+
+    def test_that_make_email_keeps_html_body(self):
+        body = '<p>Café schedule</p>'.encode('utf-8')
+        msg = self.make_email('henk@os3.nl', 'Schedule', body)
+        self.assertEqual(msg.get_body(('html',)).get_content().encode('utf-8'), body)
+
+    def test_that_make_email_adds_plain_text_part(self):
+        msg = self.make_email('henk@os3.nl', 'Schedule', b'<p>Hi all,</p><ul><li><b>Henk</b>: Dishes</li></ul>')
+        self.assertEqual(msg.get_content_type(), 'multipart/alternative')
+        self.assertEqual(msg.get_body(('plain',)).get_content(), 'Hi all,\n\n* Henk: Dishes\n')
+
+    def test_that_make_email_uses_given_plain_text(self):
+        msg = self.make_email('henk@os3.nl', 'Schedule', '<p>schedule</p>', text='Plain schedule\n')
+        self.assertEqual(msg.get_body(('plain',)).get_content(), 'Plain schedule\n')
+
+    def test_that_make_email_uses_crlf_line_endings(self):
+        message = self.mail.make_email('henk@os3.nl', 'Schedule', b'<p>schedule</p>')
+        self.assertNotIn(b'\n', message.replace(b'\r\n', b''))
+
+
+class TestEmailTemplate(MyTestCase):
+    def setUp(self):
+        self.mail = Mail()
+        self.context = {'date': '28-01-2019', 'cleaning_url': 'https://www.os3.nl', 'students': ['Henk', 'Jarno'],
+                        'assignments': [], 'cleaning_tasks': ['Dishes'], 'list_rotated': False}
+
+    def test_that_email_template_lists_previous_duties_in_footer(self):
+        body = self.mail.render_template(previous_duties=[DutySummary('Henk', 2, '14-01-2019', 2),
+                                                          DutySummary('Jarno', 0, None, None)], **self.context)
+        self.assertIn(b'Henk cleaned 2 times before, last in the week of 14-01-2019 (2 weeks ago).', body)
+        self.assertIn(b'Jarno is on cleaning duty for the first time.', body)
+
+    def test_that_email_template_has_no_previous_duties_without_history(self):
+        self.assertNotIn(b'cleaned', self.mail.render_template(**self.context))
+
+
+class TestTemplateEnvironment(TemplateEnvironmentTestCase):
+    def setUp(self):
+        self.reset_template_environment()
+        self.cache_dir = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.cache_dir)
+        self.set_up_patch('cleaning_schedule.mail.create_bytecode_cache',
+                          return_value=create_bytecode_cache(self.cache_dir))
+
+    def test_that_get_template_environment_returns_the_same_environment(self):
+        self.assertIs(get_template_environment(), get_template_environment())
+
+    def test_that_precompile_templates_compiles_email_template(self):
+        self.assertIn(EMAIL_TEMPLATE, precompile_templates())
+
+    def test_that_precompile_templates_fills_bytecode_cache(self):
+        precompile_templates()
+        self.assertTrue(listdir(self.cache_dir))
+
+    def test_that_precompile_templates_skips_compiled_templates(self):
+        makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        compiled = join(TEMPLATE_CACHE_DIR, '__jinja2_test.cache')
+        with open(compiled, 'wb') as fh:
+            fh.write(b'\x80\x04 not a template')
+        self.addCleanup(remove, compiled)
+        templates = precompile_templates()
+        self.assertIn(EMAIL_TEMPLATE, templates)
+        self.assertFalse([template for template in templates if template.startswith('__jinjacache__')])
+
+    def test_that_precompile_templates_compiles_into_directory(self):
+        directory = join(self.cache_dir, 'build')
+        precompile_templates(directory)
+        self.assertTrue(listdir(directory))
+
+    def test_that_precompiled_templates_are_used_from_another_path(self):
+        template_dir = join(self.cache_dir, 'templates')
+        copytree(TEMPLATE_DIR, template_dir, ignore=ignore_patterns('__jinjacache__'))
+        precompile_templates(join(template_dir, '__jinjacache__'))
+        template_env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(searchpath=template_dir),
+            bytecode_cache=create_bytecode_cache(join(template_dir, '__jinjacache__')),
+        )
+        with patch.object(template_env, 'compile') as compile_template:
+            template_env.get_template(EMAIL_TEMPLATE)
+        compile_template.assert_not_called()
+
+
+class TestTemplateBytecodeCache(MyTestCase):
+    def setUp(self):
+        self.cache_dir = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.cache_dir)
+        self.cache = TemplateBytecodeCache(self.cache_dir)
+
+    def test_that_cache_key_does_not_depend_on_template_path(self):
+        self.assertEqual(self.cache.get_cache_key(EMAIL_TEMPLATE, '/usr/lib/templates/' + EMAIL_TEMPLATE),
+                         self.cache.get_cache_key(EMAIL_TEMPLATE, join(TEMPLATE_DIR, EMAIL_TEMPLATE)))
+
+    def test_that_cache_key_depends_on_template_name(self):
+        self.assertNotEqual(self.cache.get_cache_key('a.jn2'), self.cache.get_cache_key('b.jn2'))
+
+    def test_that_dump_bytecode_skips_unwritable_cache(self):
+        template_env = jinja2.Environment()
+        bucket = self.cache.get_bucket(template_env, EMAIL_TEMPLATE, None, 'source')
+        bucket.code = template_env.compile('source')
+        with patch('jinja2.bccache.open', side_effect=PermissionError, create=True):
+            self.cache.dump_bytecode(bucket)
+        self.assertFalse(listdir(self.cache_dir))
@@ -0,0 +1,323 @@
+import json
+import mock
+from mock import Mock, MagicMock
+from os import remove
+from os.path import isfile
+from tempfile import mktemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.history import PickHistory, DutySummary
+from cleaning_schedule.make_os3_cleaning_schedule import fetch_from_website, exclude_students, pick_students, \
+    count_duties, make_schedule, parse_args, main
+from cleaning_schedule.roster import Roster
+from cleaning_schedule.rotation import Rotation, IdRotation
+from cleaning_schedule.state import SQLiteStateStore
+from cleaning_schedule.utils.cache import Changes
+from cleaning_schedule.utils.filesystem import get_lines_from_file, write_lines_to_file
+
+
+class TestFetchFromWebsite(MyTestCase):
+    def setUp(self):
+        self.get_students = self.set_up_patch(
+            'cleaning_schedule.make_os3_cleaning_schedule.get_student_list_from_website'
+        )
+        self.get_students.return_value = ['Henk Slaaf', 'Jarno Jaapsen']
+        self.get_tasks = self.set_up_patch(
+            'cleaning_schedule.make_os3_cleaning_schedule.get_cleaning_tasks_from_website'
+        )
+        self.get_tasks.return_value = ['Coffee machine', 'Dishes']
+        self.website = Mock()
+
+    def test_fetch_from_website_returns_students_and_cleaning_tasks(self):
+        students, cleaning_tasks = fetch_from_website(self.website, '2018-2019')
+        self.assertEqual(students, ['Henk Slaaf', 'Jarno Jaapsen'])
+        self.assertEqual(cleaning_tasks, ['Coffee machine', 'Dishes'])
+
+    def test_fetch_from_website_makes_correct_function_calls(self):
+        fetch_from_website(self.website, '2018-2019')
+        self.get_students.assert_called_once_with(self.website)
+        self.get_tasks.assert_called_once_with(self.website, '2018-2019')
+
+    def test_fetch_from_website_does_not_get_students_if_not_asked(self):
+        students, cleaning_tasks = fetch_from_website(self.website, '2018-2019', fetch_students=False)
+        self.assertIsNone(students)
+        self.assertFalse(self.get_students.called)
+        self.assertEqual(cleaning_tasks, ['Coffee machine', 'Dishes'])
+
+    def test_fetch_from_website_allows_empty_cleaning_task_list(self):
+        self.get_tasks.return_value = []
+        students, cleaning_tasks = fetch_from_website(self.website, '2018-2019', max_concurrency=1)
+        self.assertEqual(students, ['Henk Slaaf', 'Jarno Jaapsen'])
+        self.assertEqual(cleaning_tasks, [])
+
+
+class TestPickStudents(MyTestCase):
+    def setUp(self):
+        self.students = Rotation(['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+
+    def test_pick_students_picks_amount_of_students(self):
+        picked = pick_students(self.students, 2)
+        self.assertEqual(len(picked), 2)
+
+    def test_pick_students_removes_picked_students(self):
+        picked = pick_students(self.students, 2)
+        self.assertEqual(len(self.students), 1)
+        self.assertNotIn(self.students.students()[0], picked)
+
+    def test_pick_students_keeps_picked_students_if_asked(self):
+        pick_students(self.students, 2, keep_picked_students=True)
+        self.assertEqual(len(self.students), 3)
+
+    def test_exclude_students_removes_excluded_students(self):
+        exclude_students(self.students, ['Henk Slaaf', 'Nobody'])
+        self.assertEqual(sorted(self.students), ['Jarno Jaapsen', 'Piet Paulusma'])
+
+    def test_exclude_students_returns_excluded_students(self):
+        self.assertEqual(exclude_students(self.students, ['henk slaaf', 'Nobody']), {'Henk Slaaf'})
+
+    def test_exclude_students_ignores_case_and_whitespace(self):
+        exclude_students(self.students, ['  henk   SLAAF '])
+        self.assertNotIn('Henk Slaaf', self.students)
+
+    def test_exclude_students_matches_prefix_if_asked(self):
+        exclude_students(self.students, ['jarno'], match='prefix')
+        self.assertNotIn('Jarno Jaapsen', self.students)
+
+    def test_exclude_students_does_not_exclude_ambiguous_prefix(self):
+        self.students.admit('Jarno Jansen')
+        exclude_students(self.students, ['jarno'], match='prefix')
+        self.assertIn('Jarno Jaapsen', self.students)
+        self.assertIn('Jarno Jansen', self.students)
+
+    def test_exclude_students_excludes_ids_of_roster(self):
+        roster = Roster.from_names(['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+        rotation = IdRotation(range(len(roster)))
+        self.assertEqual(exclude_students(rotation, ['jarno jaapsen'], roster=roster), {'Jarno Jaapsen'})
+        self.assertEqual(sorted(rotation), [0, 2])
+
+    def test_pick_students_returns_names_of_roster_ids(self):
+        roster = Roster.from_names(['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+        picked = pick_students(IdRotation(range(len(roster))), 3, roster=roster)
+        self.assertEqual(sorted(picked), ['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+
+    def test_exclude_students_does_not_exclude_ambiguous_roster_ids(self):
+        roster = Roster.from_names(['Henk Slaaf', 'Jarno Jaapsen', 'Jarno Jansen'])
+        rotation = IdRotation(range(len(roster)))
+        logger = self.set_up_patch('cleaning_schedule.make_os3_cleaning_schedule.logger')
+        self.assertEqual(exclude_students(rotation, ['jarno'], match='prefix', roster=roster), set())
+        self.assertEqual(len(rotation), 3)
+        self.assertIn('Jarno Jaapsen, Jarno Jansen', logger.warning.call_args[0][0])
+
+    def test_pick_students_picks_fewest_duties_and_counts_the_picks(self):
+        duties = {'Henk Slaaf': 2, 'Jarno Jaapsen': 1}
+        self.assertEqual(pick_students(self.students, 1, duties=duties), ['Piet Paulusma'])
+        self.assertEqual(duties, {'Henk Slaaf': 2, 'Jarno Jaapsen': 1, 'Piet Paulusma': 1})
+
+    def test_count_duties_counts_by_roster_id(self):
+        roster = Roster.from_names(['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+        history = Mock()
+        history.students.return_value = ['Piet Paulusma', 'Graduated Student']
+        history.duties.return_value = 3
+        self.assertEqual(count_duties(history, roster), {2: 3})
+        self.assertEqual(count_duties(history), {'Piet Paulusma': 3, 'Graduated Student': 3})
+
+
+class TestMakeSchedule(MyTestCase):
+    def setUp(self):
+        self.students_file = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(self.remove_students_file)
+        self.roster = ['Student {}'.format(i) for i in range(5)]
+        self.fetch = self.set_up_patch('cleaning_schedule.make_os3_cleaning_schedule.fetch_from_website')
+        self.fetch.side_effect = lambda website, year, fetch_students=True, max_concurrency=2: (
+            list(self.roster) if fetch_students else None, ['Dishes']
+        )
+        self.mail = self.set_up_patch('cleaning_schedule.mail.Mail')
+        self.mail.return_value.render_template.return_value = b'<p>schedule</p>'
+        self.set_up_patch('cleaning_schedule.utils.development.print_html5')
+        self.website = Mock()
+        self.website.send_email.return_value = True
+        self.website.page_changes.return_value = None
+
+    def remove_students_file(self):
+        for path in (self.students_file, self.students_file + '-wal', self.students_file + '-shm',
+                     self.students_file + '.history'):
+            if isfile(path):
+                remove(path)
+
+    def make_schedule(self, *args):
+        make_schedule(parse_args(['-u', 'henk', '-p', 'henkpw', '-e', 'test@os3.nl', self.students_file] + list(args)),
+                      self.website)
+
+    def test_make_schedule_sends_one_email_per_week(self):
+        self.make_schedule('--weeks', '3')
+        self.assertEqual(self.mail.return_value.render_template.call_count, 3)
+        self.assertEqual(self.website.send_email.call_count, 3)
+
+    def test_make_schedule_fetches_website_once(self):
+        self.make_schedule('--weeks', '3')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_make_schedule_rotates_student_list_in_memory(self):
+        self.make_schedule('--weeks', '3')
+        rotated = [call[1]['list_rotated'] for call in self.mail.return_value.render_template.call_args_list]
+        self.assertEqual(rotated, [True, False, True])
+        # 5 students, 2 picked in week 1 and 2, rotated for week 3 and 2 picked again
+        self.assertEqual(len(get_lines_from_file(self.students_file)), 3)
+
+    def test_make_schedule_does_not_pick_students_twice_before_rotating(self):
+        self.make_schedule('--weeks', '2')
+        picked = [s for call in self.mail.return_value.render_template.call_args_list for s in call[1]['students']]
+        self.assertEqual(len(set(picked)), 4)
+
+    def test_make_schedule_uses_students_file(self):
+        write_lines_to_file(self.students_file, ['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma'])
+        self.make_schedule()
+        self.assertFalse(self.fetch.call_args[1]['fetch_students'])
+        self.assertEqual(len(get_lines_from_file(self.students_file)), 1)
+
+    def test_make_schedule_picks_the_same_students_with_the_same_seed(self):
+        self.make_schedule('--weeks', '2', '--seed', '42')
+        first = [call[1]['students'] for call in self.mail.return_value.render_template.call_args_list]
+        remove(self.students_file)
+        self.mail.return_value.render_template.reset_mock()
+        self.make_schedule('--weeks', '2', '--seed', '42')
+        second = [call[1]['students'] for call in self.mail.return_value.render_template.call_args_list]
+        self.assertEqual(first, second)
+
+    def test_make_schedule_does_not_pick_excluded_students(self):
+        self.make_schedule('--weeks', '2', '-x', 'Student 0', '--state-backend', 'sqlite')
+        picked = [s for call in self.mail.return_value.render_template.call_args_list for s in call[1]['students']]
+        self.assertNotIn('Student 0', picked)
+
+    def test_make_schedule_assigns_tasks_to_picked_students(self):
+        self.fetch.side_effect = lambda website, year, fetch_students=True, max_concurrency=2: (
+            list(self.roster) if fetch_students else None, ['Dishes', 'Fridge', 'Floor']
+        )
+        self.make_schedule('--weeks', '2', '--state-backend', 'sqlite')
+        for call in self.mail.return_value.render_template.call_args_list:
+            assignments = call[1]['assignments']
+            self.assertEqual([assignment.student for assignment in assignments], call[1]['students'])
+            self.assertEqual(sorted(task for assignment in assignments for task in assignment.tasks),
+                             ['Dishes', 'Floor', 'Fridge'])
+        store = SQLiteStateStore(self.students_file)
+        self.addCleanup(store.close)
+        self.assertEqual(len(store.assignment_history()), 6)
+
+    def test_make_schedule_exits_on_invalid_constraints(self):
+        constraints = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, constraints)
+        write_lines_to_file(constraints, ['not json'])
+        with self.assertRaises(SystemExit) as e:
+            self.make_schedule('--constraints', constraints)
+        self.assertEqual(e.exception.code, 2)
+        self.assertFalse(self.fetch.called)
+
+    def test_make_schedule_passes_task_changes_to_the_first_week(self):
+        self.website.page_changes.return_value = Changes(['Coffee machine'], [])
+        self.make_schedule('--weeks', '2')
+        changes = [call[1]['task_changes'] for call in self.mail.return_value.render_template.call_args_list]
+        self.assertEqual(changes, [Changes(['Coffee machine'], []), None])
+
+    def test_make_schedule_fans_out_personal_emails(self):
+        emails_file = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, emails_file)
+        write_lines_to_file(emails_file, ['{} <student{}@os3.nl>'.format(student, i)
+                                          for i, student in enumerate(self.roster)])
+        fan_out = self.set_up_patch('cleaning_schedule.fanout.fan_out')
+        fan_out.return_value = []
+        self.make_schedule('--weeks', '2', '--personal', '--student-emails', emails_file, '-c', 'cc@os3.nl')
+        self.assertEqual(fan_out.call_count, 2)
+        self.assertFalse(self.website.send_email.called)
+        recipients = fan_out.call_args[0][2]
+        self.assertEqual([recipient.on_duty for recipient in recipients], [True, True, False, False])
+        self.assertTrue(all(recipient.address for recipient in recipients))
+
+    def test_make_schedule_exits_when_personal_emails_fail(self):
+        emails_file = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, emails_file)
+        write_lines_to_file(emails_file, [])
+        self.website.smtp_pool.send.return_value = {}
+        with self.assertRaises(SystemExit) as e:
+            self.make_schedule('--personal', '--student-emails', emails_file)
+        self.assertEqual(e.exception.code, 255)
+        # The picked students have no address, the overview is still sent
+        self.website.smtp_pool.send.assert_called_once_with('cleaning-schedule@os3.nl', ['test@os3.nl'], mock.ANY)
+
+    def test_make_schedule_records_picks_in_sqlite_state(self):
+        self.make_schedule('--weeks', '2', '--state-backend', 'sqlite')
+        store = SQLiteStateStore(self.students_file)
+        self.addCleanup(store.close)
+        self.assertEqual(len(store.load()), 1)
+        self.assertEqual(len(store.history()), 4)
+
+    def test_make_schedule_keeps_remaining_students_in_roster_state(self):
+        self.make_schedule('--weeks', '3', '-x', 'Student 4', '--state-backend', 'roster')
+        with Roster.open(self.students_file) as roster:
+            remaining = list(roster)
+        picked = [s for call in self.mail.return_value.render_template.call_args_list for s in call[1]['students']]
+        # 4 students after the exclusion, rotated for week 3 and 2 picked again
+        self.assertEqual(len(remaining), 2)
+        self.assertNotIn('Student 4', picked + remaining)
+
+    def test_make_schedule_records_picks_in_history(self):
+        self.make_schedule('--weeks', '2', '--history', self.students_file + '.history')
+        history = PickHistory(self.students_file + '.history')
+        contexts = [call[1] for call in self.mail.return_value.render_template.call_args_list]
+        self.assertEqual([history.picked_in(context['date']) for context in contexts],
+                         [context['students'] for context in contexts])
+        self.assertEqual(len(history), 4)
+
+    def test_make_schedule_adds_previous_duties_to_the_email(self):
+        history = PickHistory(self.students_file + '.history')
+        history.add('07-01-2019', self.roster)
+        history.commit()
+        self.make_schedule('--history', self.students_file + '.history')
+        context = self.mail.return_value.render_template.call_args[1]
+        self.assertEqual([duty.last_duty for duty in context['previous_duties']], ['07-01-2019'] * 2)
+        self.assertEqual([duty.student for duty in context['previous_duties']], context['students'])
+
+    def test_make_schedule_fair_picking_picks_students_with_fewest_duties_first(self):
+        history = PickHistory(self.students_file + '.history')
+        history.add('07-01-2019', ['Student 0', 'Student 1', 'Student 2'])
+        history.commit()
+        self.make_schedule('--weeks', '2', '--history', self.students_file + '.history', '--fair-picking')
+        picked = [call[1]['students'] for call in self.mail.return_value.render_template.call_args_list]
+        self.assertEqual(sorted(picked[0]), ['Student 3', 'Student 4'])
+        self.assertEqual(PickHistory(self.students_file + '.history').duties('Student 3'), 1)
+
+    def test_parse_args_needs_history_for_fair_picking(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['-u', 'henk', '-p', 'henkpw', '--no-email', 'students', '--fair-picking'])
+
+
+class TestMain(MyTestCase):
+    def setUp(self):
+        self.metrics_file = mktemp(prefix='cleaning-schedule', suffix='.prom')
+        self.addCleanup(lambda: isfile(self.metrics_file) and remove(self.metrics_file))
+        self.set_up_patch('cleaning_schedule.os3website.OS3Website', MagicMock())
+        self.make_schedule = self.set_up_patch('cleaning_schedule.make_os3_cleaning_schedule.make_schedule')
+        self.args = ['-u', 'henk', '-p', 'henkpw', '--no-email', 'students', '--metrics-out', self.metrics_file]
+
+    def read_metrics(self):
+        with open(self.metrics_file) as fh:
+            return fh.read().splitlines()
+
+    def test_that_main_writes_metrics(self):
+        main(self.args)
+        lines = self.read_metrics()
+        self.assertIn('cleaning_schedule_last_run_success 1', lines)
+        self.assertTrue(any(line.startswith('cleaning_schedule_stage_duration_seconds{stage="parse_args"}')
+                            for line in lines))
+
+    def test_that_main_writes_metrics_of_failed_run(self):
+        self.make_schedule.side_effect = SystemExit(10)
+        with self.assertRaises(SystemExit):
+            main(self.args)
+        self.assertIn('cleaning_schedule_last_run_success 0', self.read_metrics())
+
+    def test_that_main_writes_json_metrics(self):
+        self.metrics_file = self.metrics_file[:-len('.prom')] + '.json'
+        main(self.args[:-1] + [self.metrics_file])
+        with open(self.metrics_file) as fh:
+            self.assertTrue(json.load(fh)['success'])
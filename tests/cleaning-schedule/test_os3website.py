@@ -1,8 +1,14 @@
 from logging import WARNING
+from mock import Mock
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from tests import MyTestCase
 from tests.fixtures.base import STUDENTS_WEBPAGE_FIXTURE
 from cleaning_schedule.os3website import OS3Website
+from cleaning_schedule.utils.cache import Changes
+from cleaning_schedule.utils.networking import IncompleteReadError, open_webpage_with_auth
+from cleaning_schedule.settings.base import MAX_WEBSITE_RETRIES
 
 
 class TestOS3WebsiteLogLevel(MyTestCase):
@@ -19,9 +25,14 @@ class TestOS3Website(MyTestCase):
     def setUp(self):
         self.year = '2018-2019'
         self.logger = self.set_up_patch('cleaning_schedule.os3website.logger')
+        self.sleep = self.set_up_patch('cleaning_schedule.utils.retry.sleep')
         self.os3website = OS3Website('henk', 'henkpw', self.year)
         self.get_call = self.set_up_patch('cleaning_schedule.os3website.get_webpage_with_auth')
         self.get_call.return_value = STUDENTS_WEBPAGE_FIXTURE
+        self.open_call = self.set_up_patch('cleaning_schedule.os3website.open_webpage_with_auth')
+        # Feed the fixture in small chunks like a streamed response
+        fixture = STUDENTS_WEBPAGE_FIXTURE.encode('utf-8')
+        self.open_call.side_effect = lambda *args, **kwargs: (fixture[i:i + 100] for i in range(0, len(fixture), 100))
 
     def test_that_class_user_gets_set_to_passed_user_var(self):
         self.assertEqual(self.os3website.user, 'henk')
@@ -72,7 +83,9 @@ class TestOS3Website(MyTestCase):
 
     def test_get_all_students_make_correct_function_calls(self):
         self.os3website.get_all_students()
-        self.get_call.assert_called_once_with(self.os3website._url, 'henk', 'henkpw', self.logger)
+        self.open_call.assert_called_once_with(self.os3website._url, 'henk', 'henkpw', self.logger,
+                                               session=self.os3website.session, timeout=self.os3website.timeout,
+                                               cache=None)
 
     def test_get_all_students_returns_students_from_fixture(self):
         students = self.os3website.get_all_students()
@@ -90,14 +103,160 @@ class TestOS3Website(MyTestCase):
 
     def test_that_get_url_gets_url(self):
         self.os3website.get_url('https://os3.nl/blaap')
-        self.get_call.assert_called_once_with('https://os3.nl/blaap', 'henk', 'henkpw', self.logger)
+        self.get_call.assert_called_once_with('https://os3.nl/blaap', 'henk', 'henkpw', self.logger,
+                                              session=self.os3website.session, timeout=self.os3website.timeout,
+                                              cache=None)
 
     def test_that_get_elements_from_webpage_makes_correct_function_calls(self):
-        self.get_call.return_value = ''
+        self.open_call.side_effect = None
+        self.open_call.return_value = iter([])
         self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'x')
-        self.get_call.assert_called_once_with('https://os3.nl/blaap', 'henk', 'henkpw', self.logger)
+        self.open_call.assert_called_with('https://os3.nl/blaap', 'henk', 'henkpw', self.logger,
+                                          session=self.os3website.session, timeout=self.os3website.timeout,
+                                          cache=None)
         self.logger.warning.assert_called_once_with('OS3 webpage call returned nothing to search for')
 
     def test_that_get_elements_from_webpage_gets_elements_from_webpage(self):
         elements = self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'p')
         self.assertIn('super secret test element', elements)
+
+    def test_that_get_elements_from_webpage_filters_on_attributes(self):
+        elements = self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'a', **{'class': 'sidebox_title'})
+        self.assertEqual(elements, ['Students'])
+
+    def test_that_get_elements_from_webpage_returns_none_on_error(self):
+        self.open_call.side_effect = None
+        self.open_call.return_value = None
+        self.assertIsNone(self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'p'))
+
+    def test_that_failed_requests_are_retried(self):
+        self.open_call.side_effect = None
+        self.open_call.return_value = None
+        self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'p')
+        self.assertEqual(self.open_call.call_count, MAX_WEBSITE_RETRIES)
+        self.assertEqual(self.sleep.call_count, MAX_WEBSITE_RETRIES - 1)
+
+    def test_that_failed_request_is_retried_until_it_succeeds(self):
+        fixture = STUDENTS_WEBPAGE_FIXTURE.encode('utf-8')
+        self.open_call.side_effect = [None, iter([fixture])]
+        self.assertIn('super secret test element', self.os3website.get_elements_from_webpage('https://os3.nl/blaap', 'p'))
+        self.assertEqual(self.open_call.call_count, 2)
+
+    def test_that_get_all_students_returns_empty_list_on_incomplete_read(self):
+        def broken_stream(*args, **kwargs):
+            yield STUDENTS_WEBPAGE_FIXTURE[:100].encode('utf-8')
+            raise IncompleteReadError('connection reset')
+        self.open_call.side_effect = broken_stream
+        self.assertEqual(self.os3website.get_all_students(), [])
+        self.assertEqual(self.open_call.call_count, MAX_WEBSITE_RETRIES)
+
+    def test_that_unchanged_page_is_not_parsed_again(self):
+        extract = self.set_up_patch('cleaning_schedule.os3website.extract_elements')
+        extract.return_value = ([({}, 'Henk Slaaf')], 1)
+        self.os3website.get_all_students()
+        self.assertEqual(self.os3website.get_all_students(), ['Henk Slaaf'])
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(self.open_call.call_count, 2)
+
+    def test_that_changed_page_reports_added_and_removed_elements(self):
+        url = 'https://os3.nl/blaap'
+        self.open_call.side_effect = None
+        self.open_call.return_value = iter([b'<ul><li>Dishes</li><li>Fridge</li></ul>'])
+        self.os3website.get_elements_from_webpage(url, 'li')
+        self.assertIsNone(self.os3website.page_changes(url))
+        self.open_call.return_value = iter([b'<ul><li>Dishes</li><li>Coffee machine</li></ul>'])
+        self.assertEqual(self.os3website.get_elements_from_webpage(url, 'li'), ['Dishes', 'Coffee machine'])
+        self.assertEqual(self.os3website.page_changes(url), Changes(['Coffee machine'], ['Fridge']))
+
+    def test_that_pages_larger_than_the_spool_size_are_parsed_from_disk(self):
+        self.set_up_patch('cleaning_schedule.os3website.EXTRACTION_SPOOL_SIZE', 10)
+        self.set_up_patch('cleaning_schedule.os3website.HTTP_CHUNK_SIZE', 7)
+        self.assertIn('Henk Slaaf', self.os3website.get_all_students())
+        self.assertIn('Henk Slaaf', self.os3website.get_all_students())
+        self.assertEqual(self.open_call.call_count, 2)
+
+    def test_that_error_pages_are_not_cached_or_compared(self):
+        url = 'https://os3.nl/blaap'
+        self.open_call.side_effect = open_webpage_with_auth
+        self.os3website.session = Mock()
+        response = self.os3website.session.get.return_value
+        response.status_code = 200
+        response.iter_content.return_value = [b'<ul><li>Dishes</li><li>Fridge</li></ul>']
+        self.os3website.get_elements_from_webpage(url, 'li')
+        response.status_code = 503
+        response.iter_content.return_value = [b'<html>Service Unavailable</html>']
+        self.assertIsNone(self.os3website.get_elements_from_webpage(url, 'li'))
+        self.assertIsNone(self.os3website.page_changes(url))
+        response.status_code = 200
+        response.iter_content.return_value = [b'<ul><li>Dishes</li><li>Fridge</li></ul>']
+        extract = self.set_up_patch('cleaning_schedule.os3website.extract_elements')
+        self.assertEqual(self.os3website.get_elements_from_webpage(url, 'li'), ['Dishes', 'Fridge'])
+        self.assertIsNone(self.os3website.page_changes(url))
+        self.assertFalse(extract.called)
+
+    def test_that_extracted_elements_are_cached_on_disk(self):
+        directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, directory)
+        self.set_up_patch('cleaning_schedule.os3website.HTTPCache')
+        OS3Website('henk', 'henkpw', self.year, cache_dir=directory).get_all_students()
+        extract = self.set_up_patch('cleaning_schedule.os3website.extract_elements')
+        students = OS3Website('henk', 'henkpw', self.year, cache_dir=directory).get_all_students()
+        self.assertIn('Henk Slaaf', students)
+        self.assertFalse(extract.called)
+
+    def test_that_send_email_sends_via_smtp_pool(self):
+        pool = self.set_up_patch('cleaning_schedule.os3website.SMTPConnectionPool')
+        self.assertTrue(self.os3website.send_email('test@os3.nl', ['henk@os3.nl'], 'message'))
+        pool.return_value.send.assert_called_once_with('test@os3.nl', ['henk@os3.nl'], 'message')
+
+    def test_that_send_email_returns_false_on_failure(self):
+        pool = self.set_up_patch('cleaning_schedule.os3website.SMTPConnectionPool')
+        pool.return_value.send.side_effect = ConnectionRefusedError('refused')
+        self.assertFalse(self.os3website.send_email('test@os3.nl', ['henk@os3.nl'], 'message'))
+        self.logger.error.assert_called_once_with('SMTP ERROR: refused')
+
+    def test_that_close_closes_smtp_pool(self):
+        pool = self.set_up_patch('cleaning_schedule.os3website.SMTPConnectionPool')
+        with self.os3website:
+            self.os3website.send_email('test@os3.nl', ['henk@os3.nl'], 'message')
+        pool.return_value.close.assert_called_once_with()
+
+    def test_that_for_year_shares_connections(self):
+        self.set_up_patch('cleaning_schedule.os3website.SMTPConnectionPool')
+        website = self.os3website.for_year('2019-2020')
+        self.assertEqual(website.year, '2019-2020')
+        self.assertEqual(website._url, 'https://www.os3.nl/2019-2020/start')
+        self.assertEqual(self.os3website.year, '2018-2019')
+        self.assertIs(website.session, self.os3website.session)
+        self.assertIs(website.smtp_pool, self.os3website.smtp_pool)
+
+
+class TestOS3WebsiteSnapshot(MyTestCase):
+    def setUp(self):
+        self.set_up_patch('cleaning_schedule.os3website.logger')
+        self.set_up_patch('cleaning_schedule.utils.retry.sleep')
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.open_call = self.set_up_patch('cleaning_schedule.os3website.open_webpage_with_auth')
+        self.open_call.side_effect = lambda *args, **kwargs: iter([STUDENTS_WEBPAGE_FIXTURE.encode('utf-8')])
+
+    def test_that_replay_serves_recorded_pages_without_network(self):
+        recorded = OS3Website('henk', 'henkpw', record_dir=self.directory).get_all_students()
+        self.open_call.reset_mock()
+        replayed = OS3Website(None, None, replay_dir=self.directory).get_all_students()
+        self.assertEqual(replayed, recorded)
+        self.assertFalse(self.open_call.called)
+
+    def test_that_replay_returns_nothing_for_pages_not_recorded(self):
+        OS3Website('henk', 'henkpw', record_dir=self.directory).get_all_students()
+        website = OS3Website(None, None, replay_dir=self.directory)
+        self.assertIsNone(website.get_url('https://www.os3.nl/2018-2019/other'))
+
+    def test_that_get_url_reads_recorded_page(self):
+        OS3Website('henk', 'henkpw', record_dir=self.directory).get_url('https://www.os3.nl/page')
+        website = OS3Website(None, None, replay_dir=self.directory)
+        self.assertEqual(website.get_url('https://www.os3.nl/page'), STUDENTS_WEBPAGE_FIXTURE.encode('utf-8'))
+
+    def test_that_record_and_replay_can_not_be_combined(self):
+        with self.assertRaises(ValueError):
+            OS3Website('henk', 'henkpw', record_dir=self.directory, replay_dir=self.directory)
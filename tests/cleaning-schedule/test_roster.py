@@ -0,0 +1,83 @@
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.roster import Roster, write_roster, is_roster_file, as_roster
+from cleaning_schedule.utils.filesystem import write_lines_to_file
+
+
+class TestRoster(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.path = join(self.directory, 'students.roster')
+        self.students = ['Henk Slaaf', 'Jürgen Jaapsen', '', 'Piet Paulusma']
+
+    def test_that_from_names_indexes_names_by_id(self):
+        roster = Roster.from_names(self.students + ['Henk Slaaf'])
+        self.assertEqual(len(roster), 4)
+        self.assertEqual(roster[1], 'Jürgen Jaapsen')
+        self.assertEqual(list(roster), self.students)
+
+    def test_that_getitem_raises_index_error_outside_roster(self):
+        with self.assertRaises(IndexError):
+            Roster.from_names(self.students)[4]
+
+    def test_that_open_reads_written_roster(self):
+        self.assertEqual(write_roster(self.path, self.students), 4)
+        with Roster.open(self.path) as roster:
+            self.assertEqual(roster[3], 'Piet Paulusma')
+            self.assertEqual(list(roster), self.students)
+
+    def test_that_open_reads_empty_roster(self):
+        write_roster(self.path, [])
+        with Roster.open(self.path) as roster:
+            self.assertEqual(len(roster), 0)
+
+    def test_that_written_roster_can_be_written_again(self):
+        write_roster(self.path, self.students)
+        other = join(self.directory, 'other.roster')
+        with Roster.open(self.path) as roster:
+            write_roster(other, roster)
+        with Roster.open(other) as roster:
+            self.assertEqual(list(roster), self.students)
+
+    def test_that_open_raises_value_error_on_plain_students_file(self):
+        write_lines_to_file(self.path, self.students)
+        self.assertFalse(is_roster_file(self.path))
+        with self.assertRaises(ValueError):
+            Roster.open(self.path)
+
+    def test_that_open_raises_value_error_on_truncated_roster(self):
+        write_roster(self.path, self.students)
+        with open(self.path, 'r+b') as fh:
+            fh.truncate(30)
+        with self.assertRaises(ValueError):
+            Roster.open(self.path)
+
+    def test_that_find_returns_ids_of_names(self):
+        roster = Roster.from_names(self.students)
+        self.assertEqual(roster.find(['Piet Paulusma', 'Nobody', 'Henk Slaaf']), {'Piet Paulusma': 3, 'Henk Slaaf': 0})
+
+    def test_that_find_returns_ids_of_names_in_roster_file(self):
+        write_roster(self.path, self.students)
+        with Roster.open(self.path) as roster:
+            self.assertEqual(roster.find(['Piet Paulusma', 'Nobody']), {'Piet Paulusma': 3})
+            self.assertEqual(roster.find([]), {})
+
+    def test_that_match_returns_ids_of_normalised_names(self):
+        write_roster(self.path, self.students)
+        with Roster.open(self.path) as roster:
+            self.assertEqual(roster.match(['henk  SLAAF', 'jurgen jaapsen', 'Nobody']),
+                             ({0, 1}, ['Nobody'], {}))
+
+    def test_that_match_only_matches_given_ids(self):
+        roster = Roster.from_names(self.students)
+        self.assertEqual(roster.match(['Henk Slaaf', 'Piet Paulusma'], student_ids=[3]), ({3}, ['Henk Slaaf'], {}))
+
+    def test_that_as_roster_keeps_roster(self):
+        roster = Roster.from_names(self.students)
+        self.assertIs(as_roster(roster), roster)
+        self.assertEqual(list(as_roster(self.students)), self.students)
@@ -0,0 +1,118 @@
+from tests import MyTestCase
+
+from cleaning_schedule.rotation import Rotation, IdRotation
+
+
+class TestRotation(MyTestCase):
+    def setUp(self):
+        self.students = ['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma', 'Klaas Vaak']
+        self.rotation = Rotation(self.students, seed=1)
+
+    def test_that_rotation_contains_all_students(self):
+        self.assertEqual(len(self.rotation), 4)
+        self.assertEqual(sorted(self.rotation), sorted(self.students))
+
+    def test_that_rotation_ignores_duplicate_students(self):
+        self.assertFalse(self.rotation.admit('Henk Slaaf'))
+        self.assertEqual(len(self.rotation), 4)
+
+    def test_that_exclude_removes_student(self):
+        self.assertTrue(self.rotation.exclude('Jarno Jaapsen'))
+        self.assertNotIn('Jarno Jaapsen', self.rotation)
+        self.assertEqual(len(self.rotation), 3)
+
+    def test_that_exclude_returns_false_for_unknown_student(self):
+        self.assertFalse(self.rotation.exclude('Nobody'))
+
+    def test_that_excluded_student_can_be_readmitted(self):
+        self.rotation.exclude('Henk Slaaf')
+        self.assertTrue(self.rotation.admit('Henk Slaaf'))
+        self.assertIn('Henk Slaaf', self.rotation)
+
+    def test_that_pick_removes_picked_students(self):
+        picked = self.rotation.pick(2)
+        self.assertEqual(len(set(picked)), 2)
+        self.assertEqual(len(self.rotation), 2)
+        for student in picked:
+            self.assertNotIn(student, self.rotation)
+
+    def test_that_pick_keeps_picked_students_if_asked(self):
+        picked = self.rotation.pick(2, keep_picked=True)
+        self.assertEqual(len(set(picked)), 2)
+        self.assertEqual(len(self.rotation), 4)
+
+    def test_that_pick_raises_value_error_when_not_enough_students(self):
+        with self.assertRaises(ValueError):
+            self.rotation.pick(5)
+
+    def test_that_all_students_get_picked_before_rotation_is_empty(self):
+        picked = self.rotation.pick(4)
+        self.assertEqual(sorted(picked), sorted(self.students))
+        with self.assertRaises(IndexError):
+            self.rotation.pop()
+
+    def test_that_same_seed_picks_same_students(self):
+        self.assertEqual(Rotation(self.students, seed=3).pick(3), Rotation(self.students, seed=3).pick(3))
+
+    def test_that_reset_starts_a_new_rotation(self):
+        self.rotation.pick(3)
+        self.rotation.reset(self.students)
+        self.assertEqual(len(self.rotation), 4)
+
+    def test_that_pick_fewest_picks_students_with_fewest_duties(self):
+        duties = {'Henk Slaaf': 3, 'Jarno Jaapsen': 0, 'Piet Paulusma': 1, 'Klaas Vaak': 1}
+        picked = self.rotation.pick_fewest(2, lambda student: duties[student])
+        self.assertEqual(picked[0], 'Jarno Jaapsen')
+        self.assertIn(picked[1], ('Piet Paulusma', 'Klaas Vaak'))
+        self.assertEqual(len(self.rotation), 2)
+        self.assertNotIn(picked[1], self.rotation)
+
+    def test_that_pick_fewest_keeps_picked_students_if_asked(self):
+        picked = self.rotation.pick_fewest(4, lambda student: 0, keep_picked=True)
+        self.assertEqual(sorted(picked), sorted(self.students))
+        self.assertEqual(len(self.rotation), 4)
+
+    def test_that_pick_fewest_raises_value_error_when_not_enough_students(self):
+        with self.assertRaises(ValueError):
+            self.rotation.pick_fewest(5, lambda student: 0)
+
+    def test_that_index_stays_consistent_after_many_operations(self):
+        rotation = Rotation(range(1000), seed=2)
+        for student in range(0, 1000, 3):
+            rotation.exclude(student)
+        rotation.pick(100)
+        for position, student in enumerate(rotation.students()):
+            self.assertEqual(rotation._index[student], position)
+
+
+class TestIdRotation(MyTestCase):
+    def setUp(self):
+        self.rotation = IdRotation(range(4), seed=1)
+
+    def test_that_id_rotation_contains_all_ids(self):
+        self.assertEqual(len(self.rotation), 4)
+        self.assertEqual(sorted(self.rotation), [0, 1, 2, 3])
+        self.assertNotIn(4, self.rotation)
+
+    def test_that_id_rotation_picks_like_rotation(self):
+        students = ['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma', 'Klaas Vaak']
+        rotation = Rotation(students, seed=1)
+        self.assertEqual([students[i] for i in self.rotation.pick(3)], rotation.pick(3))
+
+    def test_that_exclude_removes_id(self):
+        self.assertTrue(self.rotation.exclude(2))
+        self.assertFalse(self.rotation.exclude(2))
+        self.assertEqual(sorted(self.rotation), [0, 1, 3])
+
+    def test_that_admit_grows_the_index(self):
+        self.assertTrue(self.rotation.admit(10))
+        self.assertFalse(self.rotation.admit(10))
+        self.assertIn(10, self.rotation)
+        self.assertNotIn(7, self.rotation)
+
+    def test_that_pick_fewest_picks_ids_with_fewest_duties(self):
+        self.assertEqual(IdRotation(range(5), seed=1).pick_fewest(1, lambda student: abs(student - 3)), [3])
+
+    def test_that_reset_ignores_duplicate_ids(self):
+        self.rotation.reset([3, 1, 3])
+        self.assertEqual(self.rotation.students(), [3, 1])
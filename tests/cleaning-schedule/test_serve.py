@@ -0,0 +1,200 @@
+import json
+from argparse import ArgumentTypeError
+from datetime import datetime, timedelta
+from mock import Mock
+from os import remove
+from os.path import isfile
+from tempfile import mktemp
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+
+from tests import MyTestCase
+
+from cleaning_schedule.assignment import Assignment
+from cleaning_schedule.history import PickHistory
+from cleaning_schedule.serve import parse_args, parse_weekly_time, next_weekly_time, WarmWebsite, summarise, \
+    ScheduleService, ScheduleError, ScheduleServer, WeeklyScheduler
+from cleaning_schedule.make_os3_cleaning_schedule import parse_args as parse_schedule_args
+from cleaning_schedule.state import FileStateStore
+from cleaning_schedule.utils.filesystem import get_lines_from_file, write_lines_to_file
+
+
+class TestParseArgs(MyTestCase):
+    def test_that_parse_args_passes_other_arguments_to_the_schedule(self):
+        serve_args, args = parse_args(['--port', '0', '--send-at', 'mon 09:30', 'students', '-u', 'henk',
+                                       '-p', 'henkpw', '--no-email', '--weeks', '2'])
+        self.assertEqual(serve_args.port, 0)
+        self.assertEqual(serve_args.send_at, (0, 9, 30))
+        self.assertEqual(args.students_file, 'students')
+        self.assertEqual(args.weeks, 2)
+
+    def test_that_parse_weekly_time_parses_day_and_time(self):
+        self.assertEqual(parse_weekly_time('Friday 17:05'), (4, 17, 5))
+
+    def test_that_parse_weekly_time_rejects_invalid_times(self):
+        for value in ('mon', 'someday 09:00', 'mon 25:00', 'mon 9'):
+            with self.assertRaises(ArgumentTypeError):
+                parse_weekly_time(value)
+
+    def test_that_next_weekly_time_is_later_this_week(self):
+        # 02-01-2019 is a wednesday
+        self.assertEqual(next_weekly_time((4, 9, 0), datetime(2019, 1, 2, 12)), datetime(2019, 1, 4, 9))
+
+    def test_that_next_weekly_time_is_next_week_when_passed(self):
+        self.assertEqual(next_weekly_time((2, 9, 0), datetime(2019, 1, 2, 9)), datetime(2019, 1, 9, 9))
+
+
+class TestWarmWebsite(MyTestCase):
+    def setUp(self):
+        self.website = Mock()
+        self.website.get_all_students.return_value = ['Henk Slaaf']
+        self.warm = WarmWebsite(self.website, refresh_interval=60)
+
+    def test_that_warm_website_remembers_students(self):
+        self.warm.get_all_students()
+        self.assertEqual(self.warm.get_all_students(), ['Henk Slaaf'])
+        self.assertEqual(self.website.get_all_students.call_count, 1)
+
+    def test_that_warm_website_fetches_again_after_refresh(self):
+        self.warm.get_all_students()
+        self.warm.refresh()
+        self.warm.get_all_students()
+        self.assertEqual(self.website.get_all_students.call_count, 2)
+
+    def test_that_warm_website_does_not_remember_failures(self):
+        self.website.get_elements_from_webpage.return_value = None
+        self.warm.get_elements_from_webpage('https://www.os3.nl', 'li', **{'class': 'level1'})
+        self.warm.get_elements_from_webpage('https://www.os3.nl', 'li', **{'class': 'level1'})
+        self.assertEqual(self.website.get_elements_from_webpage.call_count, 2)
+
+    def test_that_warm_website_passes_other_attributes(self):
+        self.assertIs(self.warm.smtp_pool, self.website.smtp_pool)
+
+
+class TestScheduleService(MyTestCase):
+    def setUp(self):
+        self.students_file = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(lambda: isfile(self.students_file) and remove(self.students_file))
+        write_lines_to_file(self.students_file, ['Student {}'.format(i) for i in range(5)])
+        fetch = self.set_up_patch('cleaning_schedule.make_os3_cleaning_schedule.fetch_from_website')
+        fetch.side_effect = lambda website, year, fetch_students=True, max_concurrency=2: (None, ['Dishes'])
+        self.website = Mock()
+        self.website.changes = {'url': 'changes'}
+        self.website.page_changes.return_value = None
+        self.mail = Mock()
+        self.mail.render_template.return_value = b'<p>schedule</p>'
+        args = parse_schedule_args(['-u', 'henk', '-p', 'henkpw', '--no-email', self.students_file])
+        self.service = ScheduleService(args, self.website, FileStateStore(self.students_file), self.mail)
+
+    def test_that_plan_does_not_change_the_student_state(self):
+        emails = self.service.plan(weeks=2)
+        self.assertEqual(len(emails), 2)
+        self.service.plan()
+        self.assertEqual(len(get_lines_from_file(self.students_file)), 5)
+
+    def test_that_plan_does_not_change_the_pick_history(self):
+        self.service.history = PickHistory(self.students_file + '.history')
+        self.addCleanup(lambda: isfile(self.students_file + '.history') and remove(self.students_file + '.history'))
+        self.service.plan(weeks=2)
+        self.assertEqual(len(self.service.history), 0)
+        self.assertFalse(isfile(self.students_file + '.history'))
+
+    def test_that_plan_reads_picks_committed_since_the_service_started(self):
+        path = self.students_file + '.history'
+        self.addCleanup(lambda: isfile(path) and remove(path))
+        self.service.history = PickHistory(path)
+        other = PickHistory(path)
+        other.add('07-01-2019', ['Student 1'])
+        other.commit()
+        self.service.plan()
+        self.assertEqual(self.service.history.duties('Student 1'), 1)
+
+    def test_that_preview_returns_email_of_the_week(self):
+        self.assertEqual(self.service.preview(2), b'<p>schedule</p>')
+
+    def test_that_send_saves_the_student_state(self):
+        self.set_up_patch('cleaning_schedule.utils.development.print_html5')
+        self.service.send()
+        self.assertEqual(len(get_lines_from_file(self.students_file)), 3)
+        self.assertEqual(self.website.changes, {})
+
+    def test_that_failed_schedule_raises_schedule_error(self):
+        self.set_up_patch('cleaning_schedule.serve.plan_schedule').side_effect = SystemExit(10)
+        with self.assertRaises(ScheduleError):
+            self.service.plan()
+
+    def test_that_health_reports_next_send(self):
+        self.service.scheduler = Mock(next_run=datetime(2019, 1, 7, 9))
+        self.assertEqual(self.service.health(), {'status': 'ok', 'next_send': '2019-01-07T09:00:00'})
+
+
+class TestScheduleServer(MyTestCase):
+    def setUp(self):
+        self.service = Mock()
+        self.service.health.return_value = {'status': 'ok', 'next_send': None}
+        self.service.plan.return_value = [
+            ('01-01-2019', b'<p>schedule</p>', {'students': ['Henk'], 'assignments': [Assignment('Henk', ['Dishes'])],
+                                                'cleaning_tasks': ['Dishes'], 'list_rotated': False})
+        ]
+        self.service.preview.return_value = b'<p>schedule</p>'
+        self.server = ScheduleServer(('127.0.0.1', 0), self.service)
+        Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def request(self, path, method='GET'):
+        try:
+            with urlopen(Request(self.url + path, method=method, data=b'' if method == 'POST' else None)) as response:
+                return response.status, response.read()
+        except HTTPError as e:
+            return e.code, e.read()
+
+    def test_that_health_returns_status(self):
+        self.assertEqual(self.request('/health'), (200, b'{"status": "ok", "next_send": null}'))
+
+    def test_that_schedule_returns_plan_as_json(self):
+        status, body = self.request('/schedule?weeks=3')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8'))['weeks'][0]['assignments'],
+                         [{'student': 'Henk', 'tasks': ['Dishes']}])
+        self.service.plan.assert_called_once_with(3)
+
+    def test_that_preview_returns_html(self):
+        self.assertEqual(self.request('/preview'), (200, b'<p>schedule</p>'))
+        self.service.preview.assert_called_once_with(1)
+
+    def test_that_send_needs_post(self):
+        self.assertEqual(self.request('/send')[0], 405)
+        self.service.send.return_value = self.service.plan.return_value
+        self.assertEqual(self.request('/send', 'POST')[0], 200)
+
+    def test_that_invalid_requests_are_rejected(self):
+        self.assertEqual(self.request('/nothing')[0], 404)
+        self.assertEqual(self.request('/schedule?weeks=zero')[0], 400)
+
+    def test_that_failed_schedules_return_server_error(self):
+        self.service.plan.side_effect = ScheduleError('schedule failed with exit code 10')
+        self.assertEqual(self.request('/schedule'),
+                         (500, b'{"error": "schedule failed with exit code 10"}'))
+
+
+class TestWeeklyScheduler(MyTestCase):
+    def test_that_weekly_scheduler_runs_job_at_the_next_time(self):
+        self.set_up_patch('cleaning_schedule.serve.next_weekly_time').return_value = \
+            datetime.now() - timedelta(seconds=1)
+        scheduler = WeeklyScheduler((0, 9, 0), Mock())
+        scheduler.job.side_effect = scheduler.stop
+        scheduler.start()
+        scheduler.join(5)
+        scheduler.job.assert_called_once_with()
+
+
+class TestSummarise(MyTestCase):
+    def test_that_summarise_lists_assignments(self):
+        weeks = summarise([('01-01-2019', b'', {'students': ['Henk'], 'assignments': [Assignment('Henk', ['Dishes'])],
+                                                'cleaning_tasks': ['Dishes'], 'list_rotated': True})])
+        self.assertEqual(weeks, [{'date': '01-01-2019', 'students': ['Henk'],
+                                  'assignments': [{'student': 'Henk', 'tasks': ['Dishes']}],
+                                  'cleaning_tasks': ['Dishes'], 'list_rotated': True}])
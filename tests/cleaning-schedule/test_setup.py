@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.settings.base import PROJECT_DIR
+
+REPO_DIR = os.path.dirname(PROJECT_DIR)
+
+
+def run_setup(*args):
+    """
+    Run setup.py from the repo root in a fresh interpreter
+    :param args: str: The setup.py arguments
+    :return: subprocess.CompletedProcess: The finished process, output as text
+    """
+    return subprocess.run(
+        [sys.executable, 'setup.py'] + list(args), cwd=REPO_DIR,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+
+
+class TestSetup(MyTestCase):
+    def test_that_precompile_templates_compiles_the_email_templates(self):
+        result = run_setup('precompile_templates')
+        self.assertEqual(result.returncode, 0, result.stdout)
+        self.assertIn('compiled template this_weeks_cleaning_tasks.email.jn2', result.stdout)
+        self.assertIn('compiled template personal_cleaning_tasks.email.jn2', result.stdout)
+
+    def test_that_build_py_ships_the_precompiled_templates(self):
+        build_lib = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, build_lib)
+        result = run_setup('build_py', '--build-lib', build_lib)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        cache_dir = os.path.join(build_lib, 'cleaning_schedule', 'templates', '__jinjacache__')
+        templates = [name for name in os.listdir(os.path.dirname(cache_dir)) if name.endswith('.jn2')]
+        self.assertEqual(len(os.listdir(cache_dir)), len(templates))
@@ -0,0 +1,126 @@
+import json
+from os import remove
+from tempfile import mktemp
+from unittest import skipUnless
+
+from tests import MyTestCase
+
+from cleaning_schedule.make_os3_cleaning_schedule import main as schedule_main
+from cleaning_schedule.roster import write_roster
+from cleaning_schedule.simulate import parse_args, gini, max_gap, simulate_python, simulate_numpy, simulate, \
+    choose_engine, format_report, main
+from cleaning_schedule.utils.filesystem import write_lines_to_file
+
+try:
+    import numpy  # noqa: F401
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+ROSTER = ['Student {}'.format(number) for number in range(7)]
+
+
+class TestParseArgs(MyTestCase):
+    def test_that_parse_args_makes_roster_of_roster_size(self):
+        args = parse_args(['-r', '3'])
+        self.assertEqual(args.roster, ['Student 0', 'Student 1', 'Student 2'])
+
+    def test_that_parse_args_reads_roster_from_students_file(self):
+        path = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, path)
+        write_lines_to_file(path, ['Henk Slaaf', '', 'Jarno Jaapsen'])
+        self.assertEqual(parse_args(['-f', path]).roster, ['Henk Slaaf', 'Jarno Jaapsen'])
+
+    def test_that_parse_args_reads_roster_from_roster_file(self):
+        path = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, path)
+        write_roster(path, ['Henk Slaaf', 'Jarno Jaapsen'])
+        self.assertEqual(parse_args(['-f', path]).roster, ['Henk Slaaf', 'Jarno Jaapsen'])
+
+    def test_that_parse_args_rejects_more_students_than_the_roster(self):
+        with self.assertRaises(SystemExit):
+            parse_args(['-r', '3', '-s', '4'])
+
+
+class TestStatistics(MyTestCase):
+    def test_that_gini_is_zero_for_equal_duty(self):
+        self.assertEqual(gini([2, 2, 2]), 0)
+        self.assertEqual(gini([0, 0]), 0)
+
+    def test_that_gini_grows_with_unequal_duty(self):
+        self.assertAlmostEqual(gini([0, 0, 0, 4]), 0.75)
+
+    def test_that_max_gap_returns_most_weeks_between_duties(self):
+        self.assertEqual(max_gap([1, 3, 10]), 7)
+        self.assertEqual(max_gap([5]), 0)
+
+
+class TestSimulatePython(MyTestCase):
+    def test_that_simulate_python_picks_students_every_week(self):
+        counts, gaps, ginis = simulate_python(ROSTER, 2, 10, 5)
+        self.assertEqual([sum(year) for year in counts], [20] * 5)
+        self.assertEqual(len(gaps), 5)
+        self.assertEqual(len(ginis), 5)
+
+    def test_that_simulate_python_skips_students_left_when_the_rotation_refills(self):
+        # 7 students picked 2 a week: every round of 3 weeks leaves one student out
+        counts, _, _ = simulate_python(ROSTER, 2, 3, 50)
+        self.assertTrue(all(sorted(year) == [0] + [1] * 6 for year in counts))
+
+    def test_that_simulate_python_is_reproducible(self):
+        self.assertEqual(simulate_python(ROSTER, 2, 20, 10, seed=3), simulate_python(ROSTER, 2, 20, 10, seed=3))
+
+    def test_that_simulate_python_keeps_picked_students(self):
+        counts, _, _ = simulate_python(ROSTER, 7, 4, 2, keep_picked=True)
+        self.assertEqual(counts, [[4] * 7] * 2)
+
+
+@skipUnless(HAS_NUMPY, 'NumPy is not installed')
+class TestSimulateNumpy(MyTestCase):
+    def test_that_simulate_numpy_skips_students_left_when_the_rotation_refills(self):
+        counts, gaps, _ = simulate_numpy(ROSTER, 2, 3, 50, batch_size=7)
+        self.assertEqual(len(counts), 50)
+        self.assertTrue(all(sorted(year.tolist()) == [0] + [1] * 6 for year in counts))
+        self.assertEqual(gaps.max(), 0)
+
+    def test_that_simulate_numpy_matches_the_rotation_distribution(self):
+        python = simulate(ROSTER, 2, 52, 2000, engine='python')
+        vectorised = simulate(ROSTER, 2, 52, 2000, engine='numpy')
+        self.assertAlmostEqual(python['gini']['mean'], vectorised['gini']['mean'], places=2)
+        self.assertAlmostEqual(python['max_gap_weeks']['mean'], vectorised['max_gap_weeks']['mean'], delta=0.2)
+
+    def test_that_simulate_numpy_matches_the_rotation_distribution_when_keeping_picked_students(self):
+        python = simulate(ROSTER, 2, 52, 2000, keep_picked=True, engine='python')
+        vectorised = simulate(ROSTER, 2, 52, 2000, keep_picked=True, engine='numpy')
+        self.assertAlmostEqual(python['gini']['mean'], vectorised['gini']['mean'], places=1)
+        self.assertAlmostEqual(python['max_gap_weeks']['mean'], vectorised['max_gap_weeks']['mean'], delta=0.5)
+
+    def test_that_simulate_numpy_keeps_weeks_in_small_integers(self):
+        counts, gaps, _ = simulate_numpy(ROSTER, 2, 52, 10)
+        self.assertEqual(counts.dtype.itemsize, 2)
+        self.assertEqual(gaps.dtype.itemsize, 2)
+
+
+class TestSimulate(MyTestCase):
+    def test_that_simulate_reports_the_duty_distribution(self):
+        report = simulate(ROSTER, 2, 3, 20, engine='python')
+        self.assertEqual(report['duties_per_student_year']['distribution'], {'0': 1 / 7, '1': 6 / 7})
+        self.assertEqual(report['settings']['engine'], 'python')
+        self.assertIn('Gini coefficient', format_report(report))
+
+    def test_that_choose_engine_keeps_explicit_engine(self):
+        self.assertEqual(choose_engine('python'), 'python')
+        self.assertEqual(choose_engine('auto'), 'numpy' if HAS_NUMPY else 'python')
+
+    def test_that_main_writes_json_report(self):
+        path = mktemp(prefix='cleaning-schedule')
+        self.addCleanup(remove, path)
+        self.set_up_patch('builtins.print')
+        main(['-r', '7', '-t', '5', '--engine', 'python', '-o', path])
+        with open(path) as fh:
+            self.assertEqual(json.load(fh)['settings']['trials'], 5)
+
+    def test_that_schedule_main_dispatches_simulate_command(self):
+        simulate_main = self.set_up_patch('cleaning_schedule.simulate.main')
+        schedule_main(['simulate', '-t', '5'])
+        simulate_main.assert_called_once_with(['-t', '5'])
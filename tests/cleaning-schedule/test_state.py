@@ -0,0 +1,194 @@
+import sqlite3
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.assignment import Assignment
+from cleaning_schedule.roster import Roster, is_roster_file
+from cleaning_schedule.state import FileStateStore, SQLiteStateStore, RosterStateStore, open_state_store, \
+    import_students_file
+from cleaning_schedule.utils.filesystem import get_lines_from_file, write_lines_to_file
+
+
+class StateStoreTestCase(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.students = ['Henk Slaaf', 'Jarno Jaapsen', 'Piet Paulusma']
+
+
+class TestFileStateStore(StateStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = join(self.directory, 'students')
+        self.store = FileStateStore(self.path)
+
+    def test_that_store_does_not_exist_without_file(self):
+        self.assertFalse(self.store.exists())
+        self.assertEqual(self.store.load(), [])
+
+    def test_that_replace_and_commit_writes_students(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.assertEqual(get_lines_from_file(self.path), self.students)
+
+    def test_that_remove_removes_students_from_file(self):
+        write_lines_to_file(self.path, self.students)
+        self.store.load()
+        self.store.remove(['Henk Slaaf'])
+        self.store.commit()
+        self.assertEqual(get_lines_from_file(self.path), ['Jarno Jaapsen', 'Piet Paulusma'])
+
+    def test_that_exclusions_alone_are_not_written(self):
+        write_lines_to_file(self.path, self.students)
+        self.store.load()
+        self.store.exclude(['Henk Slaaf'])
+        self.store.commit()
+        self.assertEqual(get_lines_from_file(self.path), self.students)
+
+    def test_that_rollback_forgets_changes(self):
+        write_lines_to_file(self.path, self.students)
+        self.store.load()
+        self.store.remove(['Henk Slaaf'])
+        self.store.rollback()
+        self.store.commit()
+        self.assertEqual(self.store.load(), self.students)
+
+
+class TestRosterStateStore(StateStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = join(self.directory, 'students.roster')
+        self.store = RosterStateStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def test_that_store_does_not_exist_without_file(self):
+        self.assertFalse(self.store.exists())
+        self.assertEqual(len(self.store.load()), 0)
+
+    def test_that_replace_and_commit_writes_roster(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.assertTrue(is_roster_file(self.path))
+        self.assertEqual(list(self.store.load()), self.students)
+
+    def test_that_remove_removes_students_from_roster(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.assertIsInstance(self.store.load(), Roster)
+        self.store.remove(['Henk Slaaf'])
+        self.store.commit()
+        self.assertEqual(list(self.store.load()), ['Jarno Jaapsen', 'Piet Paulusma'])
+
+    def test_that_exclusions_alone_are_not_written(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.store.load()
+        self.store.exclude(['Henk Slaaf'])
+        self.store.commit()
+        self.assertEqual(list(self.store.load()), self.students)
+
+    def test_that_rollback_forgets_changes(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.store.load()
+        self.store.remove(['Henk Slaaf'])
+        self.store.rollback()
+        self.store.commit()
+        self.assertEqual(list(self.store.load()), self.students)
+
+
+class TestSQLiteStateStore(StateStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = join(self.directory, 'students.db')
+        self.store = SQLiteStateStore(self.path)
+        self.addCleanup(self.store.close)
+
+    def test_that_database_uses_wal_mode(self):
+        self.assertEqual(self.store.connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_that_store_does_not_exist_when_empty(self):
+        self.assertFalse(self.store.exists())
+
+    def test_that_replace_stores_rotation(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.assertTrue(self.store.exists())
+        self.assertEqual(self.store.load(), self.students)
+
+    def test_that_remove_updates_remaining_students(self):
+        self.store.replace(self.students)
+        self.store.remove(['Jarno Jaapsen'])
+        self.store.commit()
+        self.assertEqual(self.store.load(), ['Henk Slaaf', 'Piet Paulusma'])
+
+    def test_that_exclude_records_exclusion(self):
+        self.store.replace(self.students)
+        self.store.exclude(['Piet Paulusma'])
+        self.store.commit()
+        self.assertEqual(self.store.load(), ['Henk Slaaf', 'Jarno Jaapsen'])
+        self.assertEqual(self.store.connection.execute('SELECT COUNT(*) FROM exclusions').fetchone()[0], 1)
+
+    def test_that_record_assignments_stores_assignment_history(self):
+        self.store.replace(self.students)
+        self.store.record_assignments('01-01-2019', [Assignment('Henk Slaaf', ['Dishes', 'Fridge'])])
+        self.store.commit()
+        self.assertEqual(self.store.assignment_history(),
+                         [('01-01-2019', 'Henk Slaaf', 'Dishes'), ('01-01-2019', 'Henk Slaaf', 'Fridge')])
+
+    def test_that_replace_starts_new_rotation_and_keeps_history(self):
+        self.store.replace(self.students)
+        self.store.remove(['Henk Slaaf'])
+        self.store.record_picks('01-01-2019', ['Henk Slaaf'])
+        self.store.replace(['Jarno Jaapsen', 'Klaas Vaak'])
+        self.store.commit()
+        self.assertEqual(self.store.load(), ['Jarno Jaapsen', 'Klaas Vaak'])
+        self.assertEqual(self.store.history('Henk Slaaf'), [('01-01-2019', 'Henk Slaaf')])
+
+    def test_that_uncommitted_changes_are_rolled_back_on_close(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.store.load()
+        self.store.remove(self.students)
+        self.store.close()
+        store = SQLiteStateStore(self.path)
+        self.addCleanup(store.close)
+        self.assertEqual(store.load(), self.students)
+
+    def test_that_rollback_releases_lock(self):
+        self.store.replace(self.students)
+        self.store.commit()
+        self.store.load()
+        self.store.remove(self.students)
+        self.store.rollback()
+        other = SQLiteStateStore(self.path, timeout=0)
+        self.addCleanup(other.close)
+        self.assertEqual(other.load(), self.students)
+
+    def test_that_concurrent_run_waits_for_lock(self):
+        self.store.load()
+        other = SQLiteStateStore(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.load()
+
+
+class TestImportStudentsFile(StateStoreTestCase):
+    def test_that_import_students_file_imports_students_into_database(self):
+        students_file = join(self.directory, 'students')
+        write_lines_to_file(students_file, self.students)
+        store = open_state_store('sqlite', join(self.directory, 'students.db'))
+        self.addCleanup(store.close)
+        self.assertEqual(import_students_file(store, students_file), 3)
+        self.assertEqual(store.load(), self.students)
+
+    def test_that_import_students_file_converts_students_into_roster(self):
+        students_file = join(self.directory, 'students')
+        write_lines_to_file(students_file, self.students)
+        store = open_state_store('roster', join(self.directory, 'students.roster'))
+        self.addCleanup(store.close)
+        self.assertEqual(import_students_file(store, students_file), 3)
+        self.assertEqual(list(store.load()), self.students)
@@ -0,0 +1,85 @@
+from os import listdir, utime
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import time
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.cache import HTTPCache, ExtractionCache, Changes, diff_lists
+
+
+class TestHTTPCache(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.cache = HTTPCache(self.directory, ttl=60, max_size=10)
+        self.url = 'https://www.os3.nl/2018-2019/start'
+
+    def test_get_returns_none_for_uncached_url(self):
+        self.assertIsNone(self.cache.get(self.url))
+
+    def test_store_stores_body_and_validators(self):
+        self.cache.store(self.url, b'blaap', {'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'})
+        entry = self.cache.get(self.url)
+        self.assertEqual(entry['etag'], '"abc"')
+        self.assertEqual(self.cache.read(self.url), b'blaap')
+
+    def test_validators_returns_conditional_headers(self):
+        self.cache.store(self.url, b'blaap', {'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2018 00:00:00 GMT'})
+        self.assertEqual(self.cache.validators(self.cache.get(self.url)), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT',
+        })
+
+    def test_validators_returns_no_headers_without_entry(self):
+        self.assertEqual(self.cache.validators(None), {})
+
+    def test_is_fresh_returns_true_for_new_entry(self):
+        self.cache.store(self.url, b'blaap', {})
+        self.assertTrue(self.cache.is_fresh(self.cache.get(self.url)))
+
+    def test_is_fresh_returns_false_for_expired_entry(self):
+        self.cache.store(self.url, b'blaap', {})
+        entry = self.cache.get(self.url)
+        entry['stored_at'] = time() - 61
+        self.assertFalse(self.cache.is_fresh(entry))
+
+    def test_refresh_keeps_stored_validators(self):
+        self.cache.store(self.url, b'blaap', {'ETag': '"abc"'})
+        self.cache.refresh(self.url, {})
+        self.assertEqual(self.cache.get(self.url)['etag'], '"abc"')
+
+    def test_evict_removes_least_recently_used_entries(self):
+        self.cache.store('https://os3.nl/1', b'123456', {})
+        utime(self.cache._paths('https://os3.nl/1')[1], (0, 0))
+        self.cache.store('https://os3.nl/2', b'123456', {})
+        self.assertIsNone(self.cache.get('https://os3.nl/1'))
+        self.assertEqual(self.cache.read('https://os3.nl/2'), b'123456')
+        self.assertEqual(len(listdir(self.directory)), 2)
+
+
+class TestDiffLists(MyTestCase):
+    def test_diff_lists_returns_added_and_removed_in_order(self):
+        self.assertEqual(diff_lists(['Dishes', 'Fridge', 'Floor'], ['Floor', 'Coffee machine', 'Dishes']),
+                         Changes(['Coffee machine'], ['Fridge']))
+
+
+class TestExtractionCache(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.elements = [({'class': 'level1'}, 'Dishes')]
+
+    def test_get_returns_none_for_unknown_key(self):
+        self.assertIsNone(ExtractionCache(self.directory).get('tasks'))
+
+    def test_store_keeps_elements_in_memory_without_directory(self):
+        cache = ExtractionCache()
+        cache.store('tasks', 'abc', self.elements)
+        self.assertEqual(cache.get('tasks')['elements'], self.elements)
+
+    def test_stored_elements_are_read_by_the_next_run(self):
+        ExtractionCache(self.directory).store('tasks', 'abc', self.elements)
+        entry = ExtractionCache(self.directory).get('tasks')
+        self.assertEqual(entry['digest'], 'abc')
+        self.assertEqual(entry['elements'], self.elements)
@@ -0,0 +1,68 @@
+from tests import MyTestCase
+from tests.fixtures.base import STUDENTS_WEBPAGE_FIXTURE
+
+from cleaning_schedule.utils.extraction import ElementExtractor, TextExtractor, extract_elements, \
+    html_to_text
+
+
+class TestElementExtractor(MyTestCase):
+    def test_that_extractor_finds_elements_by_tag(self):
+        elements, _ = extract_elements([STUDENTS_WEBPAGE_FIXTURE], 'p')
+        self.assertEqual(elements, [({}, 'super secret test element')])
+
+    def test_that_extractor_filters_on_class(self):
+        elements, _ = extract_elements(['<ul><li class="level1 open">a</li><li class="level2">b</li></ul>'],
+                                       'li', {'class': 'level1'})
+        self.assertEqual([text for _, text in elements], ['a'])
+
+    def test_that_extractor_filters_on_attribute_presence(self):
+        elements, _ = extract_elements(['<a name="x">a</a><a href="/y">b</a>'], 'a', {'href': True})
+        self.assertEqual(elements, [({'href': '/y'}, 'b')])
+
+    def test_that_extractor_filters_with_callable(self):
+        elements, _ = extract_elements(['<a href="/x">a</a><a href="/y/z">b</a>'], 'a', {'href': lambda h: '/y' in h})
+        self.assertEqual([text for _, text in elements], ['b'])
+
+    def test_that_extractor_includes_text_of_child_elements(self):
+        elements, _ = extract_elements(['<li class="level1">Clean <b>the</b> sink</li>'], 'li', {'class_': 'level1'})
+        self.assertEqual(elements[0][1], 'Clean the sink')
+
+    def test_that_extractor_returns_nested_matches_in_document_order(self):
+        elements, _ = extract_elements(['<li>outer <ul><li>inner</li></ul></li><li>last</li>'], 'li')
+        self.assertEqual([text for _, text in elements], ['outer inner', 'inner', 'last'])
+
+    def test_that_extractor_handles_tags_and_characters_split_over_chunks(self):
+        page = '<p>café &amp; thee</p><p class="x">second</p>'.encode('utf-8')
+        extractor = ElementExtractor('p')
+        for i in range(len(page)):
+            extractor.feed(page[i:i + 1])
+        self.assertEqual([text for _, text in extractor.close()], ['café & thee', 'second'])
+
+    def test_that_extractor_counts_fed_data(self):
+        _, size = extract_elements([b'<p>', b'a</p>'], 'p')
+        self.assertEqual(size, 8)
+
+
+class TestTextExtractor(MyTestCase):
+    def test_that_html_to_text_puts_blocks_on_their_own_lines(self):
+        self.assertEqual(html_to_text('<p>Hi  all,</p><p>This is\n the schedule<br/>for this week</p>'),
+                         'Hi all,\n\nThis is the schedule\nfor this week\n')
+
+    def test_that_html_to_text_lists_items_with_bullets(self):
+        self.assertEqual(html_to_text('<ul><li><b>Henk</b>: Dishes</li><li>Fridge</li></ul><p>Bye</p>'),
+                         '* Henk: Dishes\n* Fridge\n\nBye\n')
+
+    def test_that_html_to_text_skips_head_and_style(self):
+        self.assertEqual(html_to_text('<html><head><title>T</title><style>p {}</style></head><body>Text</body>'),
+                         'Text\n')
+
+    def test_that_html_to_text_adds_link_urls(self):
+        self.assertEqual(html_to_text('<a href="https://os3.nl">OS3</a> <a href="#top">top</a>'),
+                         'OS3 (https://os3.nl) top\n')
+
+    def test_that_text_extractor_handles_characters_split_over_chunks(self):
+        html = '<p>café &amp; thee</p>'.encode('utf-8')
+        extractor = TextExtractor()
+        for i in range(len(html)):
+            extractor.feed(html[i:i + 1])
+        self.assertEqual(extractor.close(), 'café & thee\n')
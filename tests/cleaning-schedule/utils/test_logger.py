@@ -0,0 +1,97 @@
+import json
+import logging
+import sys
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.logger import configure_logging, start_listener, stop_listener, create_file_handler, \
+    JSONFormatter, LogQueueHandler, PACKAGE_LOGGER
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestConfigureLogging(MyTestCase):
+    def test_that_configure_logging_twice_adds_one_handler(self):
+        configure_logging('cleaning_schedule.test')
+        configure_logging('cleaning_schedule.test')
+        self.assertEqual(len(logging.getLogger(PACKAGE_LOGGER).handlers), 1)
+        self.assertEqual(logging.getLogger('cleaning_schedule.test').handlers, [])
+
+    def test_that_configure_logging_outside_package_adds_one_handler(self):
+        configure_logging('not_cleaning_schedule')
+        log = configure_logging('not_cleaning_schedule')
+        self.assertEqual(len(log.handlers), 1)
+
+    def test_that_configure_logging_sets_level(self):
+        self.assertEqual(configure_logging('cleaning_schedule.test', logging.WARNING).level, logging.WARNING)
+
+
+class TestLogListener(MyTestCase):
+    def setUp(self):
+        self.sink = ListHandler()
+        start_listener(self.sink)
+        self.addCleanup(start_listener)
+        self.logger = configure_logging('cleaning_schedule.test', logging.DEBUG)
+
+    def test_that_records_reach_the_sink(self):
+        self.logger.info('Picked %s', 'Henk Slaaf')
+        stop_listener()
+        self.assertEqual([record.getMessage() for record in self.sink.records], ['Picked Henk Slaaf'])
+
+    def test_that_message_is_merged_when_logged(self):
+        students = ['Henk Slaaf']
+        self.logger.info('Picked %s', students)
+        students.append('Jarno Jaapsen')
+        stop_listener()
+        self.assertEqual(self.sink.records[0].getMessage(), "Picked ['Henk Slaaf']")
+
+    def test_that_disabled_debug_messages_are_not_queued(self):
+        self.logger.setLevel(logging.INFO)
+        self.logger.debug('Not shown %s', 'at all')
+        stop_listener()
+        self.assertEqual(self.sink.records, [])
+
+
+class TestLogFormatting(MyTestCase):
+    def setUp(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.getLogger('cleaning_schedule.test').makeRecord(
+                'cleaning_schedule.test', logging.ERROR, __file__, 1, 'Failed %s', ('henk',), sys.exc_info()
+            )
+        self.record = LogQueueHandler(None).prepare(record)
+
+    def test_that_prepare_keeps_the_exception_as_text(self):
+        self.assertIsNone(self.record.exc_info)
+        self.assertIn('ValueError: boom', self.record.exc_text)
+
+    def test_that_json_formatter_writes_json_lines(self):
+        line = json.loads(JSONFormatter().format(self.record))
+        self.assertEqual(line['message'], 'Failed henk')
+        self.assertEqual(line['level'], 'ERROR')
+        self.assertIn('ValueError: boom', line['exception'])
+
+
+class TestFileSink(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+
+    def test_that_file_sink_rotates(self):
+        handler = create_file_handler(join(self.directory, 'schedule.log'), max_bytes=100, backup_count=2)
+        self.addCleanup(handler.close)
+        for i in range(20):
+            handler.handle(logging.makeLogRecord({'msg': 'line {}'.format(i), 'levelno': logging.INFO}))
+        self.assertEqual(sorted(listdir(self.directory)), ['schedule.log', 'schedule.log.1', 'schedule.log.2'])
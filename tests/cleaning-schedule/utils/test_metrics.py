@@ -0,0 +1,70 @@
+import json
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.metrics import Metrics
+
+
+class TestMetrics(MyTestCase):
+    def setUp(self):
+        self.now = 10.0
+        self.set_up_patch('cleaning_schedule.utils.metrics.monotonic').side_effect = lambda: self.now
+        self.metrics = Metrics()
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+
+    def test_that_span_records_duration(self):
+        with self.metrics.span('render'):
+            self.now += 1.5
+        self.assertEqual(self.metrics.duration('render'), 1.5)
+
+    def test_that_span_records_duration_when_raising(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.span('render'):
+                self.now += 2
+                raise ValueError()
+        self.assertEqual(self.metrics.duration('render'), 2)
+
+    def test_that_spans_of_the_same_stage_add_up(self):
+        for _ in range(3):
+            with self.metrics.span('render'):
+                self.now += 1
+        self.assertEqual(self.metrics.to_dict()['stages']['render'], {'seconds': 3, 'calls': 3})
+
+    def test_that_increment_counts(self):
+        self.metrics.increment('retries')
+        self.metrics.increment('http_bytes_downloaded', 100)
+        self.assertEqual(self.metrics.count('retries'), 1)
+        self.assertEqual(self.metrics.count('http_bytes_downloaded'), 100)
+
+    def test_that_known_counters_start_at_zero(self):
+        self.assertEqual(self.metrics.to_dict()['counters']['http_cache_hits'], 0)
+
+    def test_that_export_writes_json(self):
+        path = join(self.directory, 'metrics.json')
+        self.metrics.record('fetch', 0.25)
+        self.metrics.export(path, success=True)
+        with open(path) as fh:
+            data = json.load(fh)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['stages']['fetch']['seconds'], 0.25)
+
+    def test_that_export_writes_prometheus_text_format(self):
+        path = join(self.directory, 'cleaning_schedule.prom')
+        self.metrics.record('fetch', 0.25)
+        self.metrics.increment('emails_sent')
+        self.metrics.export(path, success=False)
+        with open(path) as fh:
+            lines = fh.read().splitlines()
+        self.assertIn('cleaning_schedule_stage_duration_seconds{stage="fetch"} 0.25', lines)
+        self.assertIn('cleaning_schedule_emails_sent 1', lines)
+        self.assertIn('cleaning_schedule_last_run_success 0', lines)
+        self.assertIn('# TYPE cleaning_schedule_stage_duration_seconds gauge', lines)
+
+    def test_that_prometheus_text_format_escapes_stage_labels(self):
+        self.metrics.record('cohort "Year 1" \\ 2019', 1)
+        self.assertIn('cleaning_schedule_stage_calls{stage="cohort \\"Year 1\\" \\\\ 2019"} 1',
+                      self.metrics.to_prometheus().splitlines())
@@ -0,0 +1,96 @@
+from tests import MyTestCase
+
+from cleaning_schedule.utils.names import NameIndex, NameMatcher, normalise_name, normalise_encoded_name, \
+    MATCH_MODES
+
+
+class TestNormaliseName(MyTestCase):
+    def test_that_normalise_name_ignores_case(self):
+        self.assertEqual(normalise_name('Henk SLAAF'), 'henk slaaf')
+
+    def test_that_normalise_name_collapses_whitespace(self):
+        self.assertEqual(normalise_name('  Henk \t Slaaf\n'), 'henk slaaf')
+
+    def test_that_normalise_name_strips_accents(self):
+        self.assertEqual(normalise_name('Zoë Müller'), 'zoe muller')
+
+    def test_that_normalise_name_casefolds(self):
+        self.assertEqual(normalise_name('Straße'), normalise_name('STRASSE'))
+
+
+class TestNormaliseEncodedName(MyTestCase):
+    def test_that_normalise_encoded_name_folds_ascii_names(self):
+        self.assertEqual(normalise_encoded_name(b'  Henk \t SLAAF\n'), 'henk slaaf')
+
+    def test_that_normalise_encoded_name_normalises_other_names(self):
+        self.assertEqual(normalise_encoded_name('Zoë Müller'.encode('utf-8')), 'zoe muller')
+
+    def test_that_normalise_encoded_name_splits_like_normalise_name(self):
+        self.assertEqual(normalise_encoded_name(b'Henk\x1fSlaaf'), normalise_name('Henk\x1fSlaaf'))
+
+
+class TestNameIndex(MyTestCase):
+    def setUp(self):
+        self.index = NameIndex(['Henk Slaaf', 'Jarno Jaapsen', 'Jarno Jansen', 'Zoë Müller'])
+
+    def test_that_lookup_finds_normalised_name(self):
+        self.assertEqual(self.index.lookup('zoe  muller'), ['Zoë Müller'])
+
+    def test_that_lookup_does_not_match_prefix_by_default(self):
+        self.assertEqual(self.index.lookup('Henk'), [])
+
+    def test_that_lookup_matches_prefix(self):
+        self.assertEqual(self.index.lookup('Henk', match='prefix'), ['Henk Slaaf'])
+
+    def test_that_lookup_returns_all_prefix_matches(self):
+        self.assertEqual(self.index.lookup('jarno', match='prefix'), ['Jarno Jaapsen', 'Jarno Jansen'])
+
+    def test_that_lookup_matches_fuzzy(self):
+        self.assertEqual(self.index.lookup('Henk Slaf', match='fuzzy'), ['Henk Slaaf'])
+
+    def test_that_lookup_prefers_exact_match(self):
+        self.assertEqual(NameIndex(['Jan', 'Jan Smit']).lookup('jan', match='prefix'), ['Jan'])
+
+    def test_that_resolve_splits_matched_unmatched_and_ambiguous(self):
+        matched, unmatched, ambiguous = self.index.resolve(['henk slaaf', 'Nobody', 'Jarno'], match='prefix')
+        self.assertEqual(matched, {'Henk Slaaf'})
+        self.assertEqual(unmatched, ['Nobody'])
+        self.assertEqual(ambiguous, {'Jarno': ['Jarno Jaapsen', 'Jarno Jansen']})
+
+    def test_that_index_returns_values_of_names(self):
+        index = NameIndex(iter(['Henk Slaaf', 'Jarno Jaapsen', 'Jarno Jansen']), [7, 8, 9])
+        self.assertEqual(index.lookup('henk slaaf'), [7])
+        self.assertEqual(index.resolve(['jarno'], match='prefix'), (set(), [], {'jarno': [8, 9]}))
+
+    def test_that_index_reads_names_from_iterator(self):
+        self.assertEqual(NameIndex(iter(['Henk Slaaf', 'Jarno Jaapsen'])).lookup('jarno jaapsen'), ['Jarno Jaapsen'])
+
+
+class TestNameMatcher(MyTestCase):
+    def setUp(self):
+        self.names = ['Henk Slaaf', 'Jarno Jaapsen', 'Jarno Jansen', 'Zoë Müller', 'zoe muller', 'Piet', '']
+
+    def resolve(self, names, match):
+        matcher = NameMatcher(names, match)
+        for student_id, name in enumerate(self.names):
+            matcher.add(normalise_name(name), student_id)
+        return matcher.resolve()
+
+    def test_that_resolve_matches_scanned_names(self):
+        self.assertEqual(self.resolve(['henk slaaf', 'Nobody'], 'exact'), ({0}, ['Nobody'], {}))
+
+    def test_that_resolve_reports_ambiguous_prefix(self):
+        self.assertEqual(self.resolve(['jarno', 'henk'], 'prefix'), ({0}, [], {'jarno': [1, 2]}))
+
+    def test_that_resolve_prefers_exact_match(self):
+        self.assertEqual(self.resolve(['piet'], 'prefix'), ({5}, [], {}))
+
+    def test_that_resolve_matches_like_name_index(self):
+        index = NameIndex(self.names, range(len(self.names)))
+        names = ['henk slaaf', 'jarno', 'Jarno Jaapsn', 'zoe', 'Zoe Muller', 'Pie', 'Piet Pieters', '', 'Nobody']
+        for match in MATCH_MODES:
+            matched, unmatched, ambiguous = index.resolve(names, match)
+            expected = matched, unmatched, {name: sorted(found) for name, found in ambiguous.items()}
+            matched, unmatched, ambiguous = self.resolve(names, match)
+            self.assertEqual((matched, unmatched, {name: sorted(found) for name, found in ambiguous.items()}),
+                             expected, match)
@@ -1,6 +1,10 @@
+from mock import Mock
+from requests.exceptions import Timeout
+
 from tests import MyTestCase
 
-from cleaning_schedule.utils.networking import https_in_url
+from cleaning_schedule.utils.networking import create_http_session, get_webpage_with_auth, open_webpage_with_auth, \
+    https_in_url, IncompleteReadError
 
 
 class TestNetworking(MyTestCase):
@@ -9,3 +13,145 @@ class TestNetworking(MyTestCase):
 
     def test_that_https_in_url_returns_false_if_url_does_not_start_with_https(self):
         self.assertFalse(https_in_url('http://blaap.nl'))
+
+
+class TestCreateHTTPSession(MyTestCase):
+    def setUp(self):
+        self.session = create_http_session('henk', 'henkpw', pool_size=3)
+
+    def test_that_create_http_session_sets_basic_auth(self):
+        self.assertEqual(self.session.auth.username, 'henk')
+        self.assertEqual(self.session.auth.password, 'henkpw')
+
+    def test_that_create_http_session_accepts_gzip(self):
+        self.assertIn('gzip', self.session.headers['Accept-Encoding'])
+
+    def test_that_create_http_session_uses_keep_alive(self):
+        self.assertEqual(self.session.headers['Connection'], 'keep-alive')
+
+    def test_that_create_http_session_sets_pool_size(self):
+        self.assertEqual(self.session.get_adapter('https://www.os3.nl')._pool_maxsize, 3)
+
+
+class TestGetWebpageWithAuth(MyTestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.session.get.return_value.status_code = 200
+        self.session.get.return_value.iter_content.return_value = [b'bla', b'ap']
+        self.logger = Mock()
+
+    def test_that_get_webpage_with_auth_uses_session_when_given(self):
+        get = self.set_up_patch('cleaning_schedule.utils.networking.requests.get')
+        get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session, timeout=(1, 2))
+        self.session.get.assert_called_once_with('https://os3.nl', timeout=(1, 2), headers={}, stream=True)
+        self.assertFalse(get.called)
+
+    def test_that_get_webpage_with_auth_returns_content(self):
+        self.assertEqual(get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session),
+                         b'blaap')
+
+    def test_that_get_webpage_with_auth_logs_timeouts(self):
+        self.session.get.side_effect = Timeout('too slow')
+        self.assertIsNone(get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session))
+        self.logger.error.assert_called_once_with(
+            'Timeout occurred while trying to retrieve https://os3.nl\nGot error: too slow'
+        )
+
+    def test_that_get_webpage_with_auth_returns_none_on_incomplete_read(self):
+        self.session.get.return_value.iter_content.side_effect = ConnectionError('connection reset')
+        self.assertIsNone(get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session))
+        self.session.get.return_value.close.assert_called_once_with()
+
+
+class TestOpenWebpageWithAuth(MyTestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.session.get.return_value.status_code = 200
+        self.session.get.return_value.iter_content.return_value = [b'bla', b'ap']
+        self.logger = Mock()
+
+    def test_that_open_webpage_with_auth_streams_chunks(self):
+        chunks = open_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session,
+                                        chunk_size=3)
+        self.assertEqual(list(chunks), [b'bla', b'ap'])
+        self.session.get.return_value.iter_content.assert_called_once_with(3)
+
+    def test_that_open_webpage_with_auth_returns_none_on_server_error(self):
+        self.session.get.return_value.status_code = 503
+        self.session.get.return_value.reason = 'Service Unavailable'
+        self.assertIsNone(open_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger,
+                                                 session=self.session))
+        self.logger.error.assert_called_once_with(
+            'Got HTTP status 503 Service Unavailable while trying to retrieve https://os3.nl'
+        )
+        self.session.get.return_value.close.assert_called_once_with()
+        self.assertFalse(self.session.get.return_value.iter_content.called)
+
+    def test_that_open_webpage_with_auth_returns_none_on_unauthorized(self):
+        self.session.get.return_value.status_code = 401
+        self.assertIsNone(open_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger,
+                                                 session=self.session))
+
+    def test_that_open_webpage_with_auth_raises_incomplete_read_error(self):
+        self.session.get.return_value.iter_content.side_effect = ConnectionError('connection reset')
+        chunks = open_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session)
+        with self.assertRaises(IncompleteReadError):
+            list(chunks)
+
+
+class TestGetWebpageWithAuthCache(MyTestCase):
+    def setUp(self):
+        self.session = Mock()
+        self.logger = Mock()
+        self.cache = Mock()
+        self.cache.validators.return_value = {'If-None-Match': '"abc"'}
+        self.cache.iter_body.return_value = [b'cached']
+
+    def test_that_fresh_cache_entries_are_served_without_request(self):
+        self.cache.is_fresh.return_value = True
+        ret = get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session,
+                                    cache=self.cache)
+        self.assertEqual(ret, b'cached')
+        self.assertFalse(self.session.get.called)
+
+    def test_that_expired_cache_entries_are_revalidated(self):
+        self.cache.is_fresh.return_value = False
+        self.session.get.return_value.status_code = 304
+        ret = get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session,
+                                    cache=self.cache)
+        self.session.get.assert_called_once_with('https://os3.nl', timeout=None, headers={'If-None-Match': '"abc"'},
+                                                 stream=True)
+        self.cache.refresh.assert_called_once_with('https://os3.nl', self.session.get.return_value.headers)
+        self.assertEqual(ret, b'cached')
+
+    def test_that_changed_pages_are_stored_in_cache(self):
+        self.cache.get.return_value = None
+        self.session.get.return_value.status_code = 200
+        self.session.get.return_value.iter_content.return_value = [b'bla', b'ap']
+        ret = get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session,
+                                    cache=self.cache)
+        self.cache.open_writer.assert_called_once_with('https://os3.nl', self.session.get.return_value.headers)
+        self.cache.open_writer.return_value.commit.assert_called_once_with()
+        self.assertEqual(ret, b'blaap')
+
+    def test_that_incomplete_pages_are_not_stored_in_cache(self):
+        self.cache.get.return_value = None
+        self.session.get.return_value.status_code = 200
+        self.session.get.return_value.iter_content.side_effect = ConnectionError('connection reset')
+        get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger, session=self.session, cache=self.cache)
+        self.cache.open_writer.return_value.abort.assert_called_once_with()
+        self.assertFalse(self.cache.open_writer.return_value.commit.called)
+
+    def test_that_server_errors_are_not_served_from_cache(self):
+        self.cache.is_fresh.return_value = False
+        self.session.get.return_value.status_code = 500
+        self.assertIsNone(get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger,
+                                                session=self.session, cache=self.cache))
+        self.assertFalse(self.cache.iter_body.called)
+        self.assertFalse(self.cache.open_writer.called)
+
+    def test_that_not_modified_without_cache_entry_is_an_error(self):
+        self.cache.get.return_value = None
+        self.session.get.return_value.status_code = 304
+        self.assertIsNone(get_webpage_with_auth('https://os3.nl', 'henk', 'henkpw', self.logger,
+                                                session=self.session, cache=self.cache))
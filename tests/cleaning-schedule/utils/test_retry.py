@@ -0,0 +1,135 @@
+from mock import Mock
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.retry import RetryPolicy, CircuitBreaker, CIRCUIT_CLOSED, CIRCUIT_OPEN, \
+    CIRCUIT_HALF_OPEN
+
+
+class RetryTestCase(MyTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.monotonic = self.set_up_patch('cleaning_schedule.utils.retry.monotonic')
+        self.monotonic.side_effect = lambda: self.now
+        self.sleep = self.set_up_patch('cleaning_schedule.utils.retry.sleep')
+        self.sleep.side_effect = self.advance
+        self.set_up_patch('cleaning_schedule.utils.retry.logger')
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TestCircuitBreaker(RetryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+
+    def test_that_circuit_opens_after_threshold_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_after(), 10)
+
+    def test_that_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CIRCUIT_CLOSED)
+
+    def test_that_half_open_circuit_allows_one_trial_call(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.advance(10)
+        self.assertEqual(self.breaker.state, CIRCUIT_HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+    def test_that_failed_trial_call_reopens_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.advance(10)
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_that_successful_trial_call_closes_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.advance(10)
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CIRCUIT_CLOSED)
+
+
+class TestRetryPolicy(RetryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.func = Mock(return_value=None)
+        self.policy = RetryPolicy(attempts=3, backoff=1, max_backoff=3, deadline=60, jitter=False,
+                                  breaker=CircuitBreaker(threshold=5, reset_timeout=60))
+
+    def test_that_call_returns_first_result(self):
+        self.func.return_value = 'page'
+        self.assertEqual(self.policy.call('test', self.func, 'url'), 'page')
+        self.func.assert_called_once_with('url', timeout=60)
+
+    def test_that_call_retries_until_success(self):
+        self.func.side_effect = [None, IOError('reset'), 'page']
+        self.assertEqual(self.policy.call('test', self.func), 'page')
+        self.assertEqual(self.func.call_count, 3)
+
+    def test_that_call_returns_none_after_max_attempts(self):
+        self.assertIsNone(self.policy.call('test', self.func))
+        self.assertEqual(self.func.call_count, 3)
+
+    def test_that_call_backs_off_exponentially(self):
+        self.policy.attempts = 4
+        self.policy.call('test', self.func)
+        self.assertEqual([call[0][0] for call in self.sleep.call_args_list], [1, 2, 3])
+
+    def test_that_jitter_waits_at_most_backoff(self):
+        self.policy.jitter = True
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= self.policy.delay(attempt) <= 3)
+
+    def test_that_call_does_not_retry_other_exceptions(self):
+        self.func.side_effect = ValueError('bug')
+        with self.assertRaises(ValueError):
+            self.policy.call('test', self.func)
+
+    def test_that_other_exception_in_trial_call_reopens_circuit(self):
+        self.policy.breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+        self.policy.call('test', self.func)
+        self.advance(60)
+        self.func.side_effect = ValueError('bug')
+        with self.assertRaises(ValueError):
+            self.policy.call('test', self.func)
+        self.assertEqual(self.policy.breaker.state, CIRCUIT_OPEN)
+        self.advance(60)
+        self.func.side_effect = None
+        self.func.return_value = 'page'
+        self.assertEqual(self.policy.call('test', self.func), 'page')
+
+    def test_that_call_gives_up_at_deadline(self):
+        self.policy.deadline = 2
+        self.func.side_effect = lambda timeout: self.advance(1.5)
+        self.assertIsNone(self.policy.call('test', self.func))
+        self.assertEqual(self.func.call_count, 1)
+        self.assertFalse(self.sleep.called)
+
+    def test_that_attempt_timeout_is_bounded_by_deadline(self):
+        self.policy.attempt_timeout = 30
+        self.policy.deadline = 40
+        self.func.side_effect = lambda timeout: self.advance(25)
+        self.policy.call('test', self.func)
+        timeouts = [call[1]['timeout'] for call in self.func.call_args_list]
+        self.assertEqual(timeouts, [30, 14])
+
+    def test_that_open_circuit_fails_fast(self):
+        self.policy.breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+        self.policy.call('test', self.func)
+        self.assertEqual(self.func.call_count, 2)
+        self.assertIsNone(self.policy.call('test', self.func))
+        self.assertEqual(self.func.call_count, 2)
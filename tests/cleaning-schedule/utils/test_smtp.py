@@ -0,0 +1,78 @@
+import smtplib
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.smtp import SMTPConnectionPool, is_connection_error
+
+
+class TestIsConnectionError(MyTestCase):
+    def test_that_disconnects_are_connection_errors(self):
+        self.assertTrue(is_connection_error(smtplib.SMTPServerDisconnected()))
+
+    def test_that_socket_errors_are_connection_errors(self):
+        self.assertTrue(is_connection_error(ConnectionResetError()))
+
+    def test_that_refused_recipients_are_not_connection_errors(self):
+        self.assertFalse(is_connection_error(smtplib.SMTPRecipientsRefused({})))
+
+
+class TestSMTPConnectionPool(MyTestCase):
+    def setUp(self):
+        self.smtp = self.set_up_patch('cleaning_schedule.utils.smtp.smtplib.SMTP')
+        self.smtp.return_value.starttls.return_value = (220, b'Ready')
+        self.smtp.return_value.noop.return_value = (250, b'OK')
+        self.smtp.return_value.esmtp_features = {}
+        self.pool = SMTPConnectionPool('smtp.os3.nl', 587, 'henk', 'henkpw', size=2)
+
+    def test_that_send_connects_with_starttls_and_login(self):
+        self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.smtp.assert_called_once_with('smtp.os3.nl', 587, timeout=self.pool.timeout)
+        self.smtp.return_value.starttls.assert_called_once_with()
+        self.smtp.return_value.login.assert_called_once_with('henk', 'henkpw')
+        self.smtp.return_value.sendmail.assert_called_once_with('test@os3.nl', ['henk@os3.nl'], 'message')
+
+    def test_that_send_reuses_connection(self):
+        self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.assertEqual(self.smtp.call_count, 1)
+        self.assertEqual(self.smtp.return_value.login.call_count, 1)
+        self.smtp.return_value.noop.assert_called_once_with()
+
+    def test_that_send_skips_starttls_and_login_when_disabled(self):
+        pool = SMTPConnectionPool('localhost', 1025, starttls=False, login=False)
+        pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.assertFalse(self.smtp.return_value.starttls.called)
+        self.assertFalse(self.smtp.return_value.login.called)
+
+    def test_that_broken_idle_connections_are_replaced(self):
+        self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.smtp.return_value.noop.side_effect = smtplib.SMTPServerDisconnected()
+        self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.assertEqual(self.smtp.call_count, 2)
+
+    def test_that_send_reconnects_on_connection_failure(self):
+        self.smtp.return_value.sendmail.side_effect = [smtplib.SMTPServerDisconnected(), {}]
+        self.assertEqual(self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message'), {})
+        self.assertEqual(self.smtp.call_count, 2)
+
+    def test_that_send_does_not_reconnect_on_refused_recipients(self):
+        self.smtp.return_value.sendmail.side_effect = smtplib.SMTPRecipientsRefused({})
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.assertEqual(self.smtp.call_count, 1)
+
+    def test_that_failed_starttls_raises_and_closes_connection(self):
+        self.smtp.return_value.starttls.return_value = (454, b'TLS not available')
+        with self.assertRaises(smtplib.SMTPException):
+            self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.smtp.return_value.close.assert_called_once_with()
+
+    def test_that_close_quits_idle_connections(self):
+        with self.pool:
+            self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
+        self.smtp.return_value.quit.assert_called_once_with()
+
+    def test_that_closed_pool_can_not_be_used(self):
+        self.pool.close()
+        with self.assertRaises(smtplib.SMTPException):
+            self.pool.send('test@os3.nl', ['henk@os3.nl'], 'message')
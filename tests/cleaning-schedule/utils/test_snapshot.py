@@ -0,0 +1,58 @@
+import json
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from tests import MyTestCase
+
+from cleaning_schedule.utils.networking import IncompleteReadError
+from cleaning_schedule.utils.snapshot import Snapshot, MANIFEST
+
+
+class TestSnapshot(MyTestCase):
+    def setUp(self):
+        self.directory = mkdtemp(prefix='cleaning-schedule')
+        self.addCleanup(rmtree, self.directory)
+        self.snapshot = Snapshot(self.directory)
+        self.url = 'https://www.os3.nl/2018-2019/start'
+
+    def record(self, chunks):
+        return b''.join(self.snapshot.record(self.url, chunks))
+
+    def test_that_record_passes_chunks_through(self):
+        self.assertEqual(self.record([b'<html>', b'</html>']), b'<html></html>')
+
+    def test_that_recorded_page_can_be_replayed(self):
+        self.record([b'<html>', b'</html>'])
+        replay = Snapshot(self.directory, replay=True)
+        self.assertEqual(b''.join(replay.open(self.url, chunk_size=3)), b'<html></html>')
+
+    def test_that_record_writes_manifest(self):
+        self.record([b'<html></html>'])
+        with open(join(self.directory, MANIFEST)) as fh:
+            page = json.load(fh)['pages'][self.url]
+        self.assertEqual(page['size'], 13)
+        self.assertTrue(page['file'].endswith('.html.gz'))
+
+    def test_that_incomplete_page_is_not_recorded(self):
+        def broken_stream():
+            yield b'<html>'
+            raise IncompleteReadError('connection reset')
+        with self.assertRaises(IncompleteReadError):
+            self.record(broken_stream())
+        self.assertNotIn(self.url, self.snapshot)
+        self.assertEqual(listdir(self.directory), [])
+
+    def test_that_open_returns_none_for_unknown_url(self):
+        self.assertIsNone(self.snapshot.open(self.url))
+
+    def test_that_replay_without_snapshot_raises_io_error(self):
+        with self.assertRaises(IOError):
+            Snapshot(join(self.directory, 'nothing'), replay=True)
+
+    def test_that_corrupt_page_raises_incomplete_read_error(self):
+        self.record([b'<html></html>'])
+        self.snapshot.manifest['pages'][self.url]['sha256'] = '0' * 64
+        with self.assertRaises(IncompleteReadError):
+            b''.join(self.snapshot.open(self.url))